@@ -1,6 +1,8 @@
 from flask import render_template, request, redirect, url_for, flash, session
 from models import User, Course, Enrollment, Grade, CourseMaterial, Announcement, CourseDeletionRequest, Assignment, AssignmentSubmission, StudyProgress, UserDeletionRequest, QuizAnswer, QuizAttempt
 from database import db
+from enrollments import remove_course_enrollments, remove_user_enrollments
+from stats_cache import report_cache, invalidate_on_commit
 from datetime import datetime
 
 def admin_dashboard():
@@ -14,38 +16,51 @@ def admin_dashboard():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Get system statistics
-    total_users = User.query.count()
-    total_courses = Course.query.count()
-    total_enrollments = Enrollment.query.count()
-    
-    # Get user counts by role
-    students = User.query.filter_by(role='student').count()
-    teachers = User.query.filter_by(role='teacher').count()
-    admins = User.query.filter_by(role='admin').count()
-    
-    # Get pending deletion requests count
-    pending_deletion_requests = CourseDeletionRequest.query.filter_by(status='pending').count()
-    pending_user_deletion_requests = UserDeletionRequest.query.filter_by(status='pending').count()
-    
-    # Get recent courses
-    recent_courses = Course.query.order_by(Course.created_at.desc()).limit(5).all()
-    
-    # Get recent users
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
+    # System statistics are cached and dropped by the write paths that change them
+    stats = report_cache.get('admin_dashboard', _compute_admin_dashboard_stats)
     
     return render_template('admin/dashboard.html',
                          user=user,
-                         total_users=total_users,
-                         total_courses=total_courses,
-                         total_enrollments=total_enrollments,
-                         students=students,
-                         teachers=teachers,
-                         admins=admins,
-                         pending_deletion_requests=pending_deletion_requests,
-                         pending_user_deletion_requests=pending_user_deletion_requests,
-                         recent_courses=recent_courses,
-                         recent_users=recent_users)
+                         **stats)
+
+def _compute_admin_dashboard_stats():
+    """Gather the dashboard counters in one query, plus the recent lists"""
+    def count_where(condition):
+        return db.func.count(db.case((condition, 1)))
+    
+    def scalar_count(model, *criteria):
+        return db.select(db.func.count(model.id)).where(*criteria).scalar_subquery()
+    
+    counters = db.session.query(
+        db.func.count(User.id).label('total_users'),
+        count_where(User.role == 'student').label('students'),
+        count_where(User.role == 'teacher').label('teachers'),
+        count_where(User.role == 'admin').label('admins'),
+        scalar_count(Course).label('total_courses'),
+        scalar_count(Enrollment).label('total_enrollments'),
+        scalar_count(CourseDeletionRequest, CourseDeletionRequest.status == 'pending').label('pending_deletion_requests'),
+        scalar_count(UserDeletionRequest, UserDeletionRequest.status == 'pending').label('pending_user_deletion_requests'),
+    ).one()
+    
+    # Cached values outlive the session, so keep plain data rather than models
+    recent_courses = [{
+        'id': course.id,
+        'title': course.title,
+        'instructor': course.instructor,
+        'difficulty': course.difficulty,
+        'enrolled_count': course.enrolled_count,
+    } for course in Course.query.order_by(Course.created_at.desc()).limit(5)]
+    recent_users = [{
+        'id': recent.id,
+        'first_name': recent.first_name,
+        'last_name': recent.last_name,
+        'email': recent.email,
+        'role': recent.role,
+    } for recent in User.query.order_by(User.created_at.desc()).limit(5)]
+    
+    stats = dict(counters._mapping)
+    stats.update(recent_courses=recent_courses, recent_users=recent_users)
+    return stats
 
 def manage_users():
     """Manage all users in the system"""
@@ -66,11 +81,30 @@ def manage_users():
         per_page=per_page, 
         error_out=False
     )
+    # Users on this page with any enrollment, rather than loading each one's enrollments
+    enrolled_user_ids = set(db.session.scalars(
+        db.select(Enrollment.user_id).distinct()
+        .where(Enrollment.user_id.in_([listed.id for listed in users_pagination.items]))
+    ))
     
     return render_template('admin/manage_users.html', 
                          user=user,
                          users=users_pagination.items,
-                         pagination=users_pagination)
+                         pagination=users_pagination,
+                         enrolled_user_ids=enrolled_user_ids)
+
+def _user_activity_counts(user_id):
+    """Count what a user has in each table in one query, without loading the rows"""
+    def count_for(model):
+        return db.select(db.func.count(model.id)).where(model.user_id == user_id).scalar_subquery()
+    
+    return db.session.execute(db.select(
+        count_for(Enrollment).label('enrollments'),
+        count_for(Grade).label('grades'),
+        count_for(AssignmentSubmission).label('submissions'),
+        count_for(StudyProgress).label('study_progress'),
+        count_for(QuizAttempt).label('quiz_attempts'),
+    )).one()._asdict()
 
 def edit_user(user_id):
     """Edit user information"""
@@ -91,13 +125,15 @@ def edit_user(user_id):
         target_user.email = request.form['email']
         target_user.role = request.form['role']
         
+        invalidate_on_commit(report_cache)
         db.session.commit()
         flash(f'User {target_user.username} updated successfully!', 'success')
         return redirect(url_for('manage_users'))
     
     return render_template('admin/edit_user.html', 
                          user=admin_user,
-                         target_user=target_user)
+                         target_user=target_user,
+                         activity=_user_activity_counts(target_user.id))
 
 def delete_user(user_id):
     """Delete a user"""
@@ -117,7 +153,9 @@ def delete_user(user_id):
         return redirect(url_for('manage_users'))
     
     username = target_user.username
+    remove_user_enrollments(target_user.id)
     db.session.delete(target_user)
+    invalidate_on_commit(report_cache)
     db.session.commit()
     
     flash(f'User {username} deleted successfully!', 'success')
@@ -192,6 +230,7 @@ def create_course():
         
         try:
             db.session.add(course)
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('Course created successfully!', 'success')
             return redirect(url_for('manage_courses'))
@@ -230,6 +269,7 @@ def edit_course(course_id):
                 course.instructor = instructor.first_name + " " + instructor.last_name
                 course.instructor_id = instructor.id
         
+        invalidate_on_commit(report_cache)
         db.session.commit()
         flash(f'Course "{course.title}" updated successfully!', 'success')
         return redirect(url_for('manage_courses'))
@@ -253,7 +293,9 @@ def delete_course(course_id):
     course = Course.query.get_or_404(course_id)
     title = course.title
     
+    remove_course_enrollments(course.id)
     db.session.delete(course)
+    invalidate_on_commit(report_cache)
     db.session.commit()
     
     flash(f'Course "{title}" deleted successfully!', 'success')
@@ -270,57 +312,70 @@ def system_analytics():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Get analytics data
-    total_users = User.query.count()
-    total_courses = Course.query.count()
-    total_enrollments = Enrollment.query.count()
-    
-    # Course popularity
-    course_enrollments = []
-    for course in Course.query.all():
-        course_enrollments.append({
-            'course': course,
-            'enrollment_count': len(course.enrollments),
-            'completion_rate': len([e for e in course.enrollments if e.status == 'completed']) / len(course.enrollments) * 100 if course.enrollments else 0
-        })
-    
-    course_enrollments.sort(key=lambda x: x['enrollment_count'], reverse=True)
-    
-    # User activity
-    active_users = User.query.filter(User.enrollments.any()).count()
-    inactive_users = total_users - active_users
-    
-    # Calculate average completion rate
-    total_completion_rate = 0
-    courses_with_enrollments = 0
-    for course_data in course_enrollments:
-        if course_data['enrollment_count'] > 0:
-            total_completion_rate += course_data['completion_rate']
-            courses_with_enrollments += 1
-    
-    avg_completion_rate = total_completion_rate / courses_with_enrollments if courses_with_enrollments > 0 else 0
-    
-    # Get user roles distribution
-    user_roles = {
-        'student': User.query.filter_by(role='student').count(),
-        'teacher': User.query.filter_by(role='teacher').count(),
-        'admin': User.query.filter_by(role='admin').count()
-    }
-    
-    # Get recent activities (placeholder for now)
-    recent_activities = []
+    # Aggregates are cached for a few minutes and dropped whenever users,
+    # courses or enrollments change
+    analytics = report_cache.get('system_analytics', _compute_system_analytics)
     
     return render_template('admin/analytics.html', 
                          user=user,
-                         total_users=total_users,
-                         total_courses=total_courses,
-                         total_enrollments=total_enrollments,
-                         avg_completion_rate=avg_completion_rate,
-                         course_enrollments=course_enrollments[:10],  # Top 10
-                         user_roles=user_roles,
-                         recent_activities=recent_activities,
-                         active_users=active_users,
-                         inactive_users=inactive_users)
+                         recent_activities=[],  # placeholder for now
+                         **analytics)
+
+def _compute_system_analytics():
+    """Gather the analytics report with aggregate queries only"""
+    # User roles distribution and totals in one pass over the user table
+    user_roles = {'student': 0, 'teacher': 0, 'admin': 0}
+    for role, count in db.session.query(User.role, db.func.count(User.id)).group_by(User.role):
+        user_roles[role] = count
+    total_users = sum(user_roles.values())
+    
+    total_courses = db.session.query(db.func.count(Course.id)).scalar()
+    total_enrollments, active_users = db.session.query(
+        db.func.count(Enrollment.id),
+        db.func.count(db.distinct(Enrollment.user_id))
+    ).one()
+    
+    # Completion rate of every course that has enrollments
+    per_course = db.session.query(
+        Enrollment.course_id.label('course_id'),
+        (db.func.count(db.case((Enrollment.status == 'completed', 1))) * 100.0
+         / db.func.count(Enrollment.id)).label('completion_rate')
+    ).group_by(Enrollment.course_id).subquery()
+    avg_completion_rate = db.session.query(
+        db.func.coalesce(db.func.avg(per_course.c.completion_rate), 0)
+    ).scalar()
+    
+    # Course popularity (top 10), using the maintained enrollment counters
+    top_courses = db.session.query(
+        Course, db.func.coalesce(per_course.c.completion_rate, 0)
+    ).outerjoin(
+        per_course, per_course.c.course_id == Course.id
+    ).order_by(Course.enrolled_count.desc(), Course.id).limit(10).all()
+    
+    # Cached values outlive the session, so keep plain data rather than models
+    course_enrollments = [{
+        'course': {
+            'id': course.id,
+            'title': course.title,
+            'description': course.description,
+            'instructor': course.instructor,
+            'instructor_id': course.instructor_id,
+            'max_students': course.max_students,
+        },
+        'enrollment_count': course.enrolled_count,
+        'completion_rate': completion_rate,
+    } for course, completion_rate in top_courses]
+    
+    return {
+        'total_users': total_users,
+        'total_courses': total_courses,
+        'total_enrollments': total_enrollments,
+        'avg_completion_rate': avg_completion_rate,
+        'course_enrollments': course_enrollments,
+        'user_roles': user_roles,
+        'active_users': active_users,
+        'inactive_users': total_users - active_users,
+    }
 
 def manage_deletion_requests():
     """Manage course deletion requests from teachers"""
@@ -368,7 +423,7 @@ def review_deletion_request(request_id):
         
         if action == 'approve':
             # Check if course still has enrolled students
-            if len(deletion_request.course.enrollments) > 0:
+            if deletion_request.course.get_enrolled_count() > 0:
                 flash('Cannot approve deletion for a course with enrolled students. Please unenroll all students first.', 'danger')
                 return redirect(url_for('review_deletion_request', request_id=request_id))
             
@@ -395,6 +450,7 @@ def review_deletion_request(request_id):
                 
                 # Delete the course itself
                 db.session.delete(course)
+                invalidate_on_commit(report_cache)
                 db.session.commit()
                 
                 flash(f'Course "{course_title}" deletion approved and course deleted successfully.', 'success')
@@ -412,6 +468,7 @@ def review_deletion_request(request_id):
             deletion_request.reviewed_by = admin_user.id
             deletion_request.reviewed_at = datetime.utcnow()
             
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('Course deletion request denied successfully.', 'success')
             return redirect(url_for('manage_deletion_requests'))
@@ -491,10 +548,11 @@ def review_user_deletion_request(request_id):
                 QuizAttempt.query.filter_by(user_id=target_user.id).delete()
                 
                 # Delete enrollments
-                Enrollment.query.filter_by(user_id=target_user.id).delete()
+                remove_user_enrollments(target_user.id)
                 
                 # Delete the user itself
                 db.session.delete(target_user)
+                invalidate_on_commit(report_cache)
                 db.session.commit()
                 
                 flash(f'User "{username}" deletion approved and account deleted successfully.', 'success')
@@ -512,10 +570,12 @@ def review_user_deletion_request(request_id):
             deletion_request.reviewed_by = admin_user.id
             deletion_request.reviewed_at = datetime.utcnow()
             
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('User account deletion request denied successfully.', 'success')
             return redirect(url_for('manage_user_deletion_requests'))
     
     return render_template('admin/review_user_deletion_request.html', 
                          user=admin_user,
-                         deletion_request=deletion_request) 
\ No newline at end of file
+                         deletion_request=deletion_request,
+                         activity=_user_activity_counts(deletion_request.user_id)) 
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 import logging
-from flask import Flask, session, flash, redirect, url_for, send_file, abort
+from flask import Flask, session, flash, redirect, url_for, abort
+from werkzeug.exceptions import HTTPException
 from database import db
 
 # Configure logging
@@ -31,6 +32,43 @@ db.init_app(app)
 
 # Import models after db initialization to avoid circular imports
 from models import User, Course, Enrollment, Grade, CourseMaterial, Announcement
+from file_uploads import UploadRequest, DEFAULT_MATERIAL_MAX_BYTES, DEFAULT_COURSE_UPLOAD_QUOTA_BYTES, DEFAULT_ASSIGNMENT_MAX_BYTES
+from blob_store import upload_key, ensure_blob_collector, BLOB_GC_INTERVAL_SECONDS
+from file_downloads import send_upload, DEFAULT_DOWNLOAD_MAX_AGE
+from storage import storage
+
+# Uploads are streamed to disk as they arrive; limits are in bytes
+app.request_class = UploadRequest
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER') or os.path.join(app.root_path, 'uploads')
+app.config['MATERIAL_MAX_BYTES'] = int(os.environ.get('MATERIAL_MAX_BYTES', DEFAULT_MATERIAL_MAX_BYTES))
+app.config['COURSE_UPLOAD_QUOTA_BYTES'] = int(os.environ.get('COURSE_UPLOAD_QUOTA_BYTES', DEFAULT_COURSE_UPLOAD_QUOTA_BYTES))
+app.config['ASSIGNMENT_MAX_BYTES'] = int(os.environ.get('ASSIGNMENT_MAX_BYTES', DEFAULT_ASSIGNMENT_MAX_BYTES))
+
+# Downloads are cached by browsers and can be handed to the front proxy:
+# DOWNLOAD_OFFLOAD is unset, 'x-sendfile' or 'x-accel-redirect'
+app.config['DOWNLOAD_MAX_AGE'] = int(os.environ.get('DOWNLOAD_MAX_AGE', DEFAULT_DOWNLOAD_MAX_AGE))
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD') or None
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')
+
+# Where uploaded files live: STORAGE_BACKEND is 'local' (UPLOAD_FOLDER) or 's3'.
+# Uploads are still staged in UPLOAD_FOLDER, which may be /tmp on serverless hosts.
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')
+app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET')
+app.config['S3_PREFIX'] = os.environ.get('S3_PREFIX', '')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+app.config['S3_REGION'] = os.environ.get('S3_REGION')
+app.config['S3_PRESIGN_DOWNLOADS'] = os.environ.get('S3_PRESIGN_DOWNLOADS', 'true').lower() != 'false'
+
+# Blobs no longer used by any row (deleted materials, submissions, whole
+# courses) are removed by a collector thread in each worker; 0 turns it off
+app.config['BLOB_GC_INTERVAL_SECONDS'] = int(os.environ.get('BLOB_GC_INTERVAL_SECONDS', BLOB_GC_INTERVAL_SECONDS))
+
+@app.before_request
+def start_blob_collector():
+    """Start this worker's blob collector with its first request"""
+    interval = app.config['BLOB_GC_INTERVAL_SECONDS']
+    if interval > 0:
+        ensure_blob_collector(app, interval)
 
 def create_sample_data():
     """Create sample courses and users if database is empty"""
@@ -289,7 +327,7 @@ def init_db():
 
 # Import route functions
 try:
-    from routes import index, register, login, logout, dashboard, courses, course_detail, enroll_course, study_material, mark_complete, submit_assignment, view_grades, profile, create_quiz, take_quiz, quiz_results, request_account_deletion, settings, certificates, schedule
+    from routes import index, register, login, logout, dashboard, courses, course_detail, enroll_course, study_material, mark_complete, submit_assignment, view_grades, profile, create_quiz, take_quiz, autosave_quiz, quiz_results, request_account_deletion, settings, certificates, schedule
     print("✓ Routes imported successfully")
 except Exception as e:
     print(f"✗ Routes import failed: {e}")
@@ -298,7 +336,7 @@ except Exception as e:
     raise e
 
 try:
-    from teacher_routes import teacher_dashboard, create_course as teacher_create_course, manage_course, grade_assignment, upload_material, create_announcement, create_assignment, view_submissions, unenroll_student, unenroll_all_students, delete_course, request_course_deletion, manage_quizzes, quiz_results_overview, edit_quiz_answers, delete_quiz, manage_assignments, edit_assignment, delete_assignment, toggle_assignment_status, assignment_analytics
+    from teacher_routes import teacher_dashboard, create_course as teacher_create_course, manage_course, grade_assignment, upload_material, delete_material, create_announcement, create_assignment, view_submissions, unenroll_student, unenroll_all_students, delete_course, request_course_deletion, manage_quizzes, quiz_results_overview, edit_quiz_answers, delete_quiz, export_quizzes, import_quizzes, manage_assignments, edit_assignment, delete_assignment, toggle_assignment_status, assignment_analytics
     print("✓ Teacher routes imported successfully")
 except Exception as e:
     print(f"✗ Teacher routes import failed: {e}")
@@ -308,6 +346,7 @@ except Exception as e:
     def manage_course(course_id): return "Teacher routes not available"
     def grade_assignment(submission_id): return "Teacher routes not available"
     def upload_material(course_id): return "Teacher routes not available"
+    def delete_material(material_id): return "Teacher routes not available"
     def create_announcement(course_id): return "Teacher routes not available"
     def create_assignment(course_id): return "Teacher routes not available"
     def view_submissions(assignment_id): return "Teacher routes not available"
@@ -319,6 +358,8 @@ except Exception as e:
     def quiz_results_overview(quiz_id): return "Teacher routes not available"
     def edit_quiz_answers(quiz_id): return "Teacher routes not available"
     def delete_quiz(quiz_id): return "Teacher routes not available"
+    def export_quizzes(course_id): return "Teacher routes not available"
+    def import_quizzes(course_id): return "Teacher routes not available"
     def manage_assignments(course_id): return "Teacher routes not available"
     def edit_assignment(assignment_id): return "Teacher routes not available"
     def delete_assignment(assignment_id): return "Teacher routes not available"
@@ -368,6 +409,7 @@ app.add_url_rule('/schedule', 'schedule', schedule)
 # Quiz routes
 app.add_url_rule('/quiz/create/<int:course_id>', 'create_quiz', create_quiz, methods=['GET', 'POST'])
 app.add_url_rule('/quiz/<int:quiz_id>/take', 'take_quiz', take_quiz, methods=['GET', 'POST'])
+app.add_url_rule('/quiz/<int:quiz_id>/autosave', 'autosave_quiz', autosave_quiz, methods=['POST'])
 app.add_url_rule('/quiz/results/<int:attempt_id>', 'quiz_results', quiz_results)
 
 # User account routes
@@ -489,6 +531,7 @@ app.add_url_rule('/teacher/dashboard', 'teacher_dashboard', teacher_dashboard)
 app.add_url_rule('/teacher/create-course', 'teacher_create_course', teacher_create_course, methods=['GET', 'POST'])
 app.add_url_rule('/teacher/manage-course/<int:course_id>', 'manage_course', manage_course)
 app.add_url_rule('/teacher/upload-material/<int:course_id>', 'upload_material', upload_material, methods=['GET', 'POST'])
+app.add_url_rule('/teacher/delete-material/<int:material_id>', 'delete_material', delete_material, methods=['POST'])
 app.add_url_rule('/teacher/create-assignment/<int:course_id>', 'create_assignment', create_assignment, methods=['GET', 'POST'])
 app.add_url_rule('/teacher/grade-submission/<int:submission_id>', 'grade_assignment', grade_assignment, methods=['GET', 'POST'])
 app.add_url_rule('/teacher/grade-course/<int:course_id>/<int:student_id>', 'grade_course_assignment', grade_assignment, methods=['GET', 'POST'])
@@ -511,6 +554,8 @@ app.add_url_rule('/teacher/manage-quizzes/<int:course_id>', 'manage_quizzes', ma
 app.add_url_rule('/teacher/quiz-results/<int:quiz_id>', 'quiz_results_overview', quiz_results_overview)
 app.add_url_rule('/teacher/edit-quiz-answers/<int:quiz_id>', 'edit_quiz_answers', edit_quiz_answers, methods=['GET', 'POST'])
 app.add_url_rule('/teacher/delete-quiz/<int:quiz_id>', 'delete_quiz', delete_quiz, methods=['GET', 'POST'])
+app.add_url_rule('/teacher/export-quizzes/<int:course_id>', 'export_quizzes', export_quizzes)
+app.add_url_rule('/teacher/import-quizzes/<int:course_id>', 'import_quizzes', import_quizzes, methods=['POST'])
 
 # Admin routes
 app.add_url_rule('/admin/dashboard', 'admin_dashboard', admin_dashboard)
@@ -530,47 +575,44 @@ app.add_url_rule('/admin/analytics', 'system_analytics', system_analytics)
 # File serving route
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """Serve uploaded files"""
-    from flask import send_from_directory
-    upload_dir = os.path.join(app.root_path, 'uploads')
-    
-    # Check if uploads directory exists
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir, exist_ok=True)
+    """Serve uploaded course material files"""
+    from models import CourseMaterial
     
-    return send_from_directory(upload_dir, filename)
+    # Stored names map to their content in the blob store. Submission files
+    # are private and only served by download_submission.
+    file_path = f"uploads/{filename}"
+    sha256 = db.session.scalar(
+        db.select(CourseMaterial.sha256)
+        .where(CourseMaterial.file_path == file_path, CourseMaterial.sha256.isnot(None)).limit(1)
+    )
+    key = upload_key(file_path, sha256)
+    if key is None:
+        abort(404)
+    return send_upload(key, filename, sha256=sha256)
 
 # Debug route to check uploads directory
 @app.route('/debug/uploads')
 def debug_uploads():
     """Debug route to check uploads directory"""
-    upload_dir = os.path.join(app.root_path, 'uploads')
-    
-    if not os.path.exists(upload_dir):
-        return {'status': 'error', 'message': 'Uploads directory does not exist', 'path': upload_dir}
+    store = storage()
     
     try:
-        files = os.listdir(upload_dir)
         file_info = []
-        for filename in files:
-            file_path = os.path.join(upload_dir, filename)
-            if os.path.isfile(file_path):
-                file_info.append({
-                    'filename': filename,
-                    'size': os.path.getsize(file_path),
-                    'path': file_path,
-                    'exists': True
-                })
+        for stored in store.list():
+            file_info.append({
+                'filename': stored.key,
+                'size': stored.size,
+                'exists': True
+            })
         
         return {
             'status': 'success',
-            'upload_dir': upload_dir,
-            'exists': True,
+            'storage': repr(store),
             'files': file_info,
-            'file_count': len(files)
+            'file_count': len(file_info)
         }
     except Exception as e:
-        return {'status': 'error', 'message': str(e), 'upload_dir': upload_dir}
+        return {'status': 'error', 'message': str(e), 'storage': repr(store)}
 
 # Debug route to check course materials
 @app.route('/debug/materials')
@@ -584,10 +626,7 @@ def debug_materials():
         
         for material in materials:
             # Check if file exists
-            file_exists = False
-            if material.file_path:
-                full_path = os.path.join(app.root_path, material.file_path)
-                file_exists = os.path.exists(full_path)
+            file_exists = upload_key(material.file_path, material.sha256) is not None
             
             material_info.append({
                 'id': material.id,
@@ -607,6 +646,14 @@ def debug_materials():
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
+# Debug route to check the quiz question cache
+@app.route('/debug/quiz-cache')
+def debug_quiz_cache():
+    """Hit/miss counters for this process's quiz question cache"""
+    from quiz_cache import quiz_cache
+    
+    return {'status': 'success', 'quiz_cache': quiz_cache.stats()}
+
 # Download course material route
 @app.route('/download-material/<int:material_id>')
 def download_material(material_id):
@@ -645,16 +692,39 @@ def download_material(material_id):
         return redirect(url_for('study_material', material_id=material_id))
     
     try:
-        file_path = os.path.join(app.root_path, material.file_path)
-        if not os.path.exists(file_path):
+        key = upload_key(material.file_path, material.sha256)
+        if key is None:
             flash('File not found', 'error')
             return redirect(url_for('study_material', material_id=material_id))
         
-        return send_file(file_path, as_attachment=True, download_name=os.path.basename(material.file_path))
+        # Answers 304 and byte ranges itself, or redirects to the bucket; see file_downloads
+        return send_upload(key, os.path.basename(material.file_path),
+                           sha256=material.sha256, as_attachment=True)
+    except HTTPException:
+        # e.g. 416 for a range past the end of the file
+        raise
     except Exception as e:
         flash(f'Error downloading file: {str(e)}', 'error')
         return redirect(url_for('study_material', material_id=material_id))
 
+# Download assignment submission file route
+@app.route('/submission/<int:submission_id>/file')
+def download_submission(submission_id):
+    """Download a submitted file; only its student and the course instructor may"""
+    from models import AssignmentSubmission
+    
+    submission = AssignmentSubmission.query.get_or_404(submission_id)
+    user_id = session.get('user_id')
+    # 404 rather than 403, so submission ids and names give nothing away
+    if user_id is None or user_id not in (submission.user_id, submission.assignment.course.instructor_id):
+        abort(404)
+    
+    key = upload_key(submission.file_path, submission.sha256) if submission.file_path else None
+    if key is None:
+        abort(404)
+    return send_upload(key, os.path.basename(submission.file_path),
+                       sha256=submission.sha256, as_attachment=True)
+
 
 if __name__ == "__main__":
     with app.app_context():
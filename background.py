@@ -0,0 +1,51 @@
+"""
+Periodic background jobs.
+
+Some work is batched rather than done inside requests: flushing autosaved
+quiz answers, closing attempts whose deadline has passed and collecting
+unused blobs. Each job runs on a daemon thread inside an app context. Jobs
+are started from a request rather than at import, so every forked worker
+gets its own threads: the blob collector with a worker's first request,
+the quiz jobs with the first request that needs them. They are never
+started for test apps, which run the jobs explicitly.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+_started = set()
+_lock = threading.Lock()
+
+
+def run_periodically(app, name, interval, job, run_at_exit=False):
+    """Run ``job()`` every ``interval`` seconds on a daemon thread, once per process"""
+    if app.testing:
+        return
+    with _lock:
+        if name in _started:
+            return
+        _started.add(name)
+
+    def run_once():
+        with app.app_context():
+            try:
+                job()
+            except Exception:
+                logger.exception('Background job %s failed', name)
+            finally:
+                db.session.remove()
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            run_once()
+
+    threading.Thread(target=loop, name=name, daemon=True).start()
+    if run_at_exit:
+        atexit.register(run_once)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latency of the teacher's manage-course page against section size.
+
+Seeds a throwaway database with one course per section size, each student
+holding a handful of grades, then times repeated GETs of
+/teacher/manage-course/<id> and reports the median latency and the number
+of SQL statements per request.
+
+Usage: python bench_manage_course.py [repeats]
+"""
+
+import sys
+import os
+import statistics
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import db
+from isolated_app import make_isolated_app, drop_isolated_app, count_queries, login_as
+from models import User, Course, Enrollment, Grade
+
+SECTION_SIZES = [10, 50, 200, 500]
+GRADES_PER_STUDENT = 5
+
+
+def seed_section(teacher, size, first_student):
+    course = Course(title=f'Section of {size}', description='Benchmark course',
+                    instructor='Bench Teacher', instructor_id=teacher.id,
+                    duration_weeks=8, difficulty='Beginner', max_students=size,
+                    enrolled_count=size)
+    db.session.add(course)
+    db.session.flush()
+
+    students = [{'username': f'bench{n}', 'email': f'bench{n}@example.com',
+                 'password_hash': 'unused', 'first_name': 'Bench', 'last_name': str(n),
+                 'role': 'student'}
+                for n in range(first_student, first_student + size)]
+    db.session.execute(db.insert(User), students)
+    ids = db.session.scalars(
+        db.select(User.id).where(User.username.in_([s['username'] for s in students]))
+    ).all()
+    db.session.execute(db.insert(Enrollment),
+                       [{'user_id': user_id, 'course_id': course.id} for user_id in ids])
+    db.session.execute(db.insert(Grade), [
+        {'user_id': user_id, 'course_id': course.id,
+         'assignment_name': f'Homework {g}', 'score': 60 + (user_id + g) % 40}
+        for user_id in ids for g in range(GRADES_PER_STUDENT)
+    ])
+    db.session.commit()
+    return course.id
+
+
+def main(repeats=5):
+    app = make_isolated_app()
+    try:
+        with app.app_context():
+            teacher = User(username='bench_teacher', email='teacher@example.com',
+                           first_name='Bench', last_name='Teacher', role='teacher')
+            teacher.set_password('teacher123')
+            db.session.add(teacher)
+            db.session.commit()
+
+            sections = []
+            next_student = 0
+            for size in SECTION_SIZES:
+                sections.append((size, seed_section(teacher, size, next_student)))
+                next_student += size
+
+            client = app.test_client()
+            login_as(client, teacher)
+
+            print(f"{'students':>10} {'queries':>8} {'median ms':>10} {'max ms':>8}")
+            for size, course_id in sections:
+                path = f'/teacher/manage-course/{course_id}'
+                with count_queries() as statements:
+                    assert client.get(path).status_code == 200
+                timings = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    client.get(path)
+                    timings.append((time.perf_counter() - start) * 1000)
+                print(f"{size:>10} {len(statements):>8} "
+                      f"{statistics.median(timings):>10.1f} {max(timings):>8.1f}")
+    finally:
+        drop_isolated_app(app)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
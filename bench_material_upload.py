@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: uploading a large course material.
+
+Writes a file of N MiB to a temporary directory and posts it to
+/teacher/upload-material/<course_id> against a throwaway database.
+Reports wall time, throughput and the peak Python memory allocated while
+the request ran (the test client's own multipart encoding included).
+
+Usage: python bench_material_upload.py [mebibytes]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import db
+from isolated_app import make_isolated_app, drop_isolated_app, login_as
+from models import User, Course, CourseMaterial
+
+MIB = 1024 * 1024
+
+
+def seed():
+    teacher = User(username='bench_teacher', email='teacher@example.com',
+                   first_name='Bench', last_name='Teacher', role='teacher', password_hash='unused')
+    db.session.add(teacher)
+    db.session.flush()
+    course = Course(title='Lectures', description='Benchmark course', instructor='Bench Teacher',
+                    instructor_id=teacher.id, duration_weeks=8, difficulty='Beginner',
+                    max_students=10)
+    db.session.add(course)
+    db.session.commit()
+    return teacher, course.id
+
+
+def main(mebibytes=200):
+    app = make_isolated_app()
+    workdir = tempfile.mkdtemp(prefix='edutrack-upload-')
+    app.config.update(UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+                      MATERIAL_MAX_BYTES=(mebibytes + 1) * MIB,
+                      COURSE_UPLOAD_QUOTA_BYTES=(mebibytes + 1) * MIB)
+    source = os.path.join(workdir, 'lecture.mp4')
+    with open(source, 'wb') as out:
+        for _ in range(mebibytes):
+            out.write(os.urandom(MIB))
+    try:
+        with app.app_context():
+            teacher, course_id = seed()
+            client = app.test_client()
+            login_as(client, teacher)
+
+            with open(source, 'rb') as video:
+                tracemalloc.start()
+                start = time.perf_counter()
+                response = client.post(f'/teacher/upload-material/{course_id}', data={
+                    'title': 'Lecture', 'description': '', 'file': (video, 'lecture.mp4'),
+                }, content_type='multipart/form-data')
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            assert response.status_code == 302, response.status_code
+            assert db.session.scalars(db.select(CourseMaterial.file_path)).one()
+
+            print(f"upload: {mebibytes} MiB")
+            print(f"  time:        {elapsed * 1000:8.1f} ms")
+            print(f"  throughput:  {mebibytes / elapsed:8.1f} MiB/s")
+            print(f"  peak memory: {peak / MIB:8.1f} MiB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        drop_isolated_app(app)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:2]]
+    main(*args)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark: exporting and importing a quiz archive.
+
+Seeds a quiz with Q questions and one completed attempt per student, each
+answering every question, then exports it to a JSON Lines file and imports
+the file into a second course against a throwaway database. Run it with two
+sizes to check that peak Python memory stays flat as the answer count
+grows.
+
+Usage: python bench_quiz_archive.py [students] [questions]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import db
+from isolated_app import make_isolated_app, drop_isolated_app, count_queries
+from models import User, Course, Quiz, QuizQuestion, QuizAttempt, QuizAnswer
+from quiz_archive import export_records, archive_lines, read_records, import_archive
+
+SEED_CHUNK = 5000
+
+
+def seed(students, questions):
+    teacher = User(username='bench_teacher', email='teacher@example.com',
+                   first_name='Bench', last_name='Teacher', role='teacher', password_hash='unused')
+    db.session.add(teacher)
+    db.session.flush()
+    courses = [Course(title=title, description='Benchmark course', instructor='Bench Teacher',
+                      instructor_id=teacher.id, duration_weeks=8, difficulty='Beginner',
+                      max_students=students) for title in ('Source', 'Target')]
+    db.session.add_all(courses)
+    db.session.flush()
+    quiz = Quiz(title='Archive bench', course_id=courses[0].id, passing_score=50)
+    db.session.add(quiz)
+    db.session.flush()
+
+    db.session.execute(db.insert(QuizQuestion), [
+        {'quiz_id': quiz.id, 'question_text': f'Question {n}?', 'option_a': 'a', 'option_b': 'b',
+         'option_c': 'c', 'option_d': 'd', 'correct_answer': 'ABCD'[n % 4], 'points': 1,
+         'order_num': n} for n in range(questions)])
+    db.session.execute(db.insert(User), [
+        {'username': f'student{n}', 'email': f'student{n}@example.com', 'first_name': 'S',
+         'last_name': str(n), 'role': 'student', 'password_hash': 'unused'}
+        for n in range(students)])
+    user_ids = db.session.scalars(db.select(User.id).where(User.role == 'student')).all()
+    question_ids = db.session.scalars(
+        db.select(QuizQuestion.id).where(QuizQuestion.quiz_id == quiz.id)).all()
+
+    now = datetime.utcnow()
+    db.session.execute(db.insert(QuizAttempt), [
+        {'quiz_id': quiz.id, 'user_id': user_id, 'score': questions / 2, 'max_score': questions,
+         'percentage': 50.0, 'passed': True, 'started_at': now, 'completed_at': now}
+        for user_id in user_ids])
+    attempt_ids = db.session.scalars(db.select(QuizAttempt.id)).all()
+    rows = []
+    for attempt_id in attempt_ids:
+        for n, question_id in enumerate(question_ids):
+            rows.append({'attempt_id': attempt_id, 'question_id': question_id,
+                         'selected_answer': 'ABCD'[(n + attempt_id) % 4],
+                         'is_correct': (n + attempt_id) % 4 == n % 4, 'points_earned': 0.0})
+            if len(rows) >= SEED_CHUNK:
+                db.session.execute(db.insert(QuizAnswer), rows)
+                rows = []
+    if rows:
+        db.session.execute(db.insert(QuizAnswer), rows)
+    db.session.commit()
+    return quiz.id, courses[1].id
+
+
+def measure(label, answers, action):
+    tracemalloc.start()
+    with count_queries() as statements:
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label}: {answers} answers")
+    print(f"  time:        {elapsed * 1000:8.1f} ms")
+    print(f"  throughput:  {answers / elapsed:8.0f} answers/s")
+    print(f"  statements:  {len(statements):8d}")
+    print(f"  peak memory: {peak / 1024 / 1024:8.1f} MiB")
+
+
+def main(students=5000, questions=20):
+    app = make_isolated_app()
+    answers = students * questions
+    path = tempfile.mktemp(suffix='.jsonl')
+    try:
+        with app.app_context():
+            quiz_id, target_id = seed(students, questions)
+
+            def export():
+                with open(path, 'w', encoding='utf-8') as out:
+                    out.writelines(archive_lines(export_records([quiz_id]), 'jsonl'))
+
+            def import_():
+                with open(path, encoding='utf-8') as source:
+                    counts = import_archive(read_records(source, 'jsonl'), target_id)
+                db.session.commit()
+                assert counts['answers'] == answers, counts
+
+            measure('export', answers, export)
+            print(f"  file size:   {os.path.getsize(path) / 1024 / 1024:8.1f} MiB")
+            measure('import', answers, import_)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+        drop_isolated_app(app)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: importing a large question bank.
+
+Builds a bank of N questions in the create-quiz text format and posts it to
+/quiz/create/<course_id> against a throwaway database, once as pasted text
+and once as a file upload. Reports wall time, questions per second, the
+number of SQL statements and the peak Python memory allocated while the
+request ran.
+
+Usage: python bench_quiz_import.py [questions]
+"""
+
+import io
+import sys
+import os
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import db
+from isolated_app import make_isolated_app, drop_isolated_app, count_queries, login_as
+from models import User, Course, QuizQuestion
+
+
+def question_bank(questions):
+    lines = ['Question bank', '']
+    for n in range(questions):
+        correct = 'ABCD'[n % 4]
+        lines.append(f'What is the answer to question {n}?')
+        for letter in 'ABCD':
+            marker = ' [CORRECT]' if letter == correct else ''
+            lines.append(f'{letter}) Option {letter} for {n}{marker}')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def seed():
+    teacher = User(username='bench_teacher', email='teacher@example.com',
+                   first_name='Bench', last_name='Teacher', role='teacher')
+    teacher.password_hash = 'unused'
+    db.session.add(teacher)
+    db.session.flush()
+    course = Course(title='Question banks', description='Benchmark course',
+                    instructor='Bench Teacher', instructor_id=teacher.id,
+                    duration_weeks=8, difficulty='Beginner', max_students=10)
+    db.session.add(course)
+    db.session.commit()
+    return teacher, course.id
+
+
+def run(client, path, data, label, questions):
+    tracemalloc.start()
+    with count_queries() as statements:
+        start = time.perf_counter()
+        response = client.post(path, data=data, content_type='multipart/form-data')
+        elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert response.status_code == 302, response.status_code
+
+    print(f"{label}: {questions} questions")
+    print(f"  time:        {elapsed * 1000:8.1f} ms")
+    print(f"  throughput:  {questions / elapsed:8.0f} questions/s")
+    print(f"  statements:  {len(statements):8d}")
+    print(f"  peak memory: {peak / 1024 / 1024:8.1f} MiB")
+
+
+def main(questions=10000):
+    app = make_isolated_app()
+    # A 10k bank is well over Werkzeug's default 500 kB limit for form fields;
+    # lift it so the pasted-text path can be compared with the upload
+    app.config['MAX_FORM_MEMORY_SIZE'] = None
+    bank = question_bank(questions)
+    try:
+        with app.app_context():
+            teacher, course_id = seed()
+            client = app.test_client()
+            login_as(client, teacher)
+            path = f'/quiz/create/{course_id}'
+
+            run(client, path, {'quiz_text': bank}, 'pasted text', questions)
+            run(client, path, {'quiz_file': (io.BytesIO(bank.encode()), 'bank.txt')},
+                'file upload', questions)
+
+            imported = db.session.scalar(db.select(db.func.count(QuizQuestion.id)))
+            assert imported == 2 * questions, imported
+    finally:
+        drop_isolated_app(app)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:2]]
+    main(*args)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: re-grading a quiz after its answer key changes.
+
+Seeds a throwaway database with one quiz, its attempts, every attempt's
+answers and the linked grades (10,000 attempts x 50 questions by default,
+i.e. 500,000 answers), flips half of the answer key and times
+quiz_grading.regrade_quiz().
+
+Usage: python bench_quiz_regrade.py [attempts] [questions]
+"""
+
+import sys
+import os
+import random
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import db
+from isolated_app import make_isolated_app, drop_isolated_app, count_queries
+from models import User, Course, Quiz, QuizQuestion, QuizAttempt, QuizAnswer, Grade
+from quiz_grading import regrade_quiz
+
+CHUNK = 50000
+
+
+def seed(attempts, questions):
+    rng = random.Random(7)
+    teacher = User(username='bench_teacher', email='teacher@example.com',
+                   first_name='Bench', last_name='Teacher', role='teacher')
+    teacher.password_hash = 'unused'
+    db.session.add(teacher)
+    db.session.flush()
+    course = Course(title='Finals', description='Benchmark course', instructor='Bench Teacher',
+                    instructor_id=teacher.id, duration_weeks=8, difficulty='Beginner',
+                    max_students=attempts)
+    db.session.add(course)
+    db.session.flush()
+    quiz = Quiz(title='Final exam', course_id=course.id, passing_score=60)
+    db.session.add(quiz)
+    db.session.flush()
+
+    db.session.execute(db.insert(QuizQuestion), [
+        {'quiz_id': quiz.id, 'question_text': f'Question {n}', 'option_a': 'a',
+         'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+         'correct_answer': 'ABCD'[n % 4], 'points': 1, 'order_num': n}
+        for n in range(questions)
+    ])
+    key = db.session.execute(
+        db.select(QuizQuestion.id, QuizQuestion.correct_answer)
+        .where(QuizQuestion.quiz_id == quiz.id).order_by(QuizQuestion.id)
+    ).all()
+
+    db.session.execute(db.insert(User), [
+        {'username': f'bench{n}', 'email': f'bench{n}@example.com', 'password_hash': 'unused',
+         'first_name': 'Bench', 'last_name': str(n), 'role': 'student'}
+        for n in range(attempts)
+    ])
+    student_ids = db.session.scalars(
+        db.select(User.id).where(User.role == 'student').order_by(User.id)).all()
+    db.session.execute(db.insert(QuizAttempt), [
+        {'quiz_id': quiz.id, 'user_id': user_id, 'max_score': questions}
+        for user_id in student_ids
+    ])
+    attempt_ids = db.session.execute(
+        db.select(QuizAttempt.id, QuizAttempt.user_id).where(QuizAttempt.quiz_id == quiz.id)
+    ).all()
+
+    answers = []
+    for attempt_id, _ in attempt_ids:
+        for question_id, correct in key:
+            selected = rng.choice('ABCD')
+            answers.append({'attempt_id': attempt_id, 'question_id': question_id,
+                            'selected_answer': selected, 'is_correct': selected == correct,
+                            'points_earned': int(selected == correct)})
+            if len(answers) >= CHUNK:
+                db.session.execute(db.insert(QuizAnswer), answers)
+                answers = []
+    if answers:
+        db.session.execute(db.insert(QuizAnswer), answers)
+
+    db.session.execute(db.insert(Grade), [
+        {'user_id': user_id, 'course_id': course.id, 'assignment_name': 'Quiz: Final exam',
+         'score': 0.0, 'max_score': 100.0, 'quiz_attempt_id': attempt_id}
+        for attempt_id, user_id in attempt_ids
+    ])
+    db.session.commit()
+    return quiz
+
+
+def main(attempts=10000, questions=50):
+    app = make_isolated_app()
+    try:
+        with app.app_context():
+            start = time.perf_counter()
+            quiz = seed(attempts, questions)
+            print(f"seeded {attempts} attempts x {questions} questions "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+            # Change the key for every other question
+            for question in QuizQuestion.query.filter_by(quiz_id=quiz.id):
+                if question.order_num % 2:
+                    question.correct_answer = 'A'
+            db.session.flush()
+
+            with count_queries() as statements:
+                start = time.perf_counter()
+                regraded = regrade_quiz(quiz)
+                db.session.commit()
+                elapsed = time.perf_counter() - start
+
+            print(f"re-graded {regraded} attempts in {elapsed:.2f}s "
+                  f"({len(statements)} statements)")
+            passed = db.session.scalar(
+                db.select(db.func.count(QuizAttempt.id)).where(QuizAttempt.passed == True))
+            print(f"  {passed} attempts now passing")
+    finally:
+        drop_isolated_app(app)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
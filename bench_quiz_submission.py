@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: quiz submission throughput.
+
+Simulates a class submitting a final at the bell: every student posts a
+completed form to /quiz/<id>/take, one after another, against a throwaway
+database. Reports submissions per second, the average latency and the
+number of SQL statements per submission.
+
+Usage: python bench_quiz_submission.py [students] [questions]
+"""
+
+import sys
+import os
+import random
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import db
+from isolated_app import make_isolated_app, drop_isolated_app, count_queries, login_as
+from models import User, Course, Enrollment, Quiz, QuizQuestion, QuizAnswer
+
+
+def seed(students, questions):
+    teacher = User(username='bench_teacher', email='teacher@example.com',
+                   first_name='Bench', last_name='Teacher', role='teacher')
+    teacher.password_hash = 'unused'
+    db.session.add(teacher)
+    db.session.flush()
+    course = Course(title='Finals', description='Benchmark course', instructor='Bench Teacher',
+                    instructor_id=teacher.id, duration_weeks=8, difficulty='Beginner',
+                    max_students=students, enrolled_count=students)
+    db.session.add(course)
+    db.session.flush()
+    quiz = Quiz(title='Final exam', course_id=course.id, passing_score=60)
+    db.session.add(quiz)
+    db.session.flush()
+
+    db.session.execute(db.insert(QuizQuestion), [
+        {'quiz_id': quiz.id, 'question_text': f'Question {n}', 'option_a': 'a',
+         'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+         'correct_answer': 'ABCD'[n % 4], 'points': 1 + n % 3, 'order_num': n}
+        for n in range(questions)
+    ])
+    db.session.execute(db.insert(User), [
+        {'username': f'bench{n}', 'email': f'bench{n}@example.com', 'password_hash': 'unused',
+         'first_name': 'Bench', 'last_name': str(n), 'role': 'student'}
+        for n in range(students)
+    ])
+    student_ids = db.session.scalars(db.select(User.id).where(User.role == 'student')).all()
+    db.session.execute(db.insert(Enrollment),
+                       [{'user_id': user_id, 'course_id': course.id} for user_id in student_ids])
+    db.session.commit()
+    question_ids = db.session.scalars(
+        db.select(QuizQuestion.id).where(QuizQuestion.quiz_id == quiz.id)).all()
+    return quiz.id, db.session.scalars(db.select(User).where(User.role == 'student')).all(), question_ids
+
+
+def main(students=300, questions=50):
+    app = make_isolated_app()
+    rng = random.Random(42)
+    try:
+        with app.app_context():
+            quiz_id, student_list, question_ids = seed(students, questions)
+            client = app.test_client()
+            path = f'/quiz/{quiz_id}/take'
+
+            statement_count = 0
+            start = time.perf_counter()
+            for student in student_list:
+                login_as(client, student)
+                form = {f'question_{qid}': rng.choice('ABCD') for qid in question_ids}
+                with count_queries() as statements:
+                    response = client.post(path, data=form)
+                assert response.status_code == 302, response.status_code
+                statement_count += len(statements)
+            elapsed = time.perf_counter() - start
+
+            assert db.session.scalar(db.select(db.func.count(QuizAnswer.id))) == students * questions
+            print(f"{students} submissions x {questions} questions")
+            print(f"  throughput:  {students / elapsed:8.1f} submissions/s")
+            print(f"  latency:     {elapsed / students * 1000:8.2f} ms/submission")
+            print(f"  statements:  {statement_count / students:8.1f} per submission")
+    finally:
+        drop_isolated_app(app)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,309 @@
+"""
+Content-addressed blob store.
+
+Uploaded files are stored once per distinct content, named by their
+SHA-256 under the storage key blobs/ab/cd/<digest> (see storage).
+CourseMaterial and AssignmentSubmission keep the digest in their sha256
+column, and a Blob row counts how many of them use each content, so the
+slide deck a teacher uploads again every term and for every section is
+stored once.
+
+put_blob() takes an upload that was hashed while it streamed in and
+saves it to storage only if that content is not stored yet, outside any
+transaction, so a slow S3 upload holds neither a connection nor a lock.
+Its reference is taken just before the session commits, together with
+the row that uses it. release_blob() drops a reference.
+
+Files are only ever removed by collect_garbage(). It deletes the blobs
+that no row in either table uses (so rows removed by cascades are
+accounted for), recounts the rest, and removes blob files that no Blob
+row knows about once they are older than ORPHAN_GRACE_SECONDS, which is
+what an upload whose transaction rolled back leaves behind.
+
+A blob is only deleted after its row is locked, by a statement that
+checks again for rows using it. Under READ COMMITTED that statement sees
+every upload that held the lock before it, so a reference committed
+while the collector waited is never missed.
+"""
+
+import hashlib
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from background import run_periodically
+from database import db
+from file_uploads import UPLOAD_CHUNK_SIZE, UploadError, receive_upload, resolve_upload
+from models import Blob, CourseMaterial, AssignmentSubmission
+from storage import storage
+
+BLOB_DIR = 'blobs'
+
+# How often each worker collects unreferenced blobs
+BLOB_GC_INTERVAL_SECONDS = 3600
+
+# Blob files without a row are left alone this long; their upload may not have committed yet
+ORPHAN_GRACE_SECONDS = 3600
+
+# Rows per batch when folding old uploads into the store
+FOLD_BATCH_SIZE = 200
+
+# Blob rows or files checked per query when collecting
+COLLECT_BATCH_SIZE = 500
+
+# Tables whose rows refer to blobs by sha256
+BLOB_REFERENCES = (CourseMaterial, AssignmentSubmission)
+
+StoredBlob = namedtuple('StoredBlob', ['key', 'size', 'sha256'])
+
+
+def blob_key(sha256):
+    """Storage key of the blob with this digest"""
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def upload_key(file_path, sha256):
+    """Storage key of a material's or submission's bytes, or None if they are missing"""
+    store = storage()
+    if sha256 and store.exists(blob_key(sha256)):
+        return blob_key(sha256)
+    # Not folded into the store yet (see fold_legacy_uploads)
+    if file_path and store.exists(os.path.basename(file_path)):
+        return os.path.basename(file_path)
+    return None
+
+
+def put_blob(incoming):
+    """Store a finished IncomingFile; its reference is taken at the next commit.
+
+    Returns a StoredBlob. If the same bytes are already stored the upload is
+    kept until the commit, in case the collector removes them meanwhile.
+    """
+    key = blob_key(incoming.sha256)
+    store = storage()
+    retained = None
+    if store.exists(key):
+        retained = incoming
+        db.session.info.setdefault('retained_uploads', []).append(incoming)
+    else:
+        store.save(key, incoming)
+    db.session.info.setdefault('pending_blobs', []).append((incoming.sha256, incoming.size, retained))
+    return StoredBlob(key, incoming.size, incoming.sha256)
+
+
+def store_blob(file, max_bytes=None):
+    """Store an uploaded FileStorage in the blob store. Returns a StoredBlob."""
+    return put_blob(receive_upload(file, max_bytes))
+
+
+def add_reference(sha256, size, count=1, session=None):
+    """Create the Blob row if needed and add ``count`` references, in one upsert"""
+    session = session or db.session
+    insert = sqlite.insert if session.get_bind().dialect.name == 'sqlite' else postgresql.insert
+    stmt = insert(Blob).values(sha256=sha256, size=size, ref_count=count,
+                               created_at=datetime.utcnow())
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={'ref_count': Blob.ref_count + stmt.excluded.ref_count},
+    ))
+
+
+@event.listens_for(Session, 'before_commit')
+def _reference_pending_blobs(session):
+    pending = session.info.pop('pending_blobs', ())
+    if not pending:
+        return
+    store = storage()
+    for sha256, size, retained in pending:
+        # Holds the Blob row lock until the commit, so the collector waits for us
+        add_reference(sha256, size, session=session)
+        if not store.exists(blob_key(sha256)):
+            # Collected since put_blob() found it
+            if retained is None or retained.closed:
+                raise UploadError('The file was removed while it was being saved; please try again')
+            store.save(blob_key(sha256), retained)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _discard_retained_uploads(session):
+    session.info.pop('pending_blobs', None)
+    for incoming in session.info.pop('retained_uploads', ()):
+        incoming.close()
+
+
+def release_blob(sha256):
+    """Drop one reference to a blob; the file goes at the next collection"""
+    if not sha256:
+        return
+    db.session.execute(
+        db.update(Blob)
+        .where(Blob.sha256 == sha256, Blob.ref_count > 0)
+        .values(ref_count=Blob.ref_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recount_references():
+    """Set every Blob.ref_count from the rows that use it, in one UPDATE"""
+    references = sum(
+        db.select(db.func.count()).select_from(model)
+        .where(model.sha256 == Blob.sha256).scalar_subquery()
+        for model in BLOB_REFERENCES
+    )
+    db.session.execute(
+        db.update(Blob).values(ref_count=references)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _unused():
+    """Condition for a Blob that no material or submission refers to"""
+    return db.and_(*(
+        ~db.exists().where(model.sha256 == Blob.sha256) for model in BLOB_REFERENCES
+    ))
+
+
+def collect_garbage(now=None):
+    """Remove unreferenced blobs and orphaned blob files. Commits.
+
+    Returns (blobs removed, orphaned files removed).
+    """
+    store = storage()
+    removed = 0
+    candidates = db.session.scalars(db.select(Blob.sha256).where(_unused())).all()
+    for start in range(0, len(candidates), COLLECT_BATCH_SIZE):
+        batch = candidates[start:start + COLLECT_BATCH_SIZE]
+        # Wait for uploads holding these rows; the next statement then sees their commits
+        locked = db.session.scalars(
+            db.select(Blob.sha256).where(Blob.sha256.in_(batch)).with_for_update()
+        ).all()
+        unused = db.delete(Blob).where(Blob.sha256.in_(locked), _unused())
+        if db.session.get_bind().dialect.delete_returning:
+            deleted = db.session.scalars(unused.returning(Blob.sha256)).all()
+        else:
+            deleted = db.session.scalars(db.select(Blob.sha256).where(Blob.sha256.in_(locked), _unused())).all()
+            db.session.execute(db.delete(Blob).where(Blob.sha256.in_(deleted)))
+        # Files go before the commit: a concurrent upload of the same bytes
+        # waits for this transaction, then finds no file and writes it again
+        for sha256 in deleted:
+            store.delete(blob_key(sha256))
+        db.session.commit()
+        removed += len(deleted)
+    # The counts only show usage now; deletion above does not rely on them
+    recount_references()
+    db.session.commit()
+    return removed, _remove_orphans(store, now or time.time())
+
+
+def _remove_orphans(store, now):
+    removed = 0
+    stored = store.list(BLOB_DIR + '/')
+    while batch := list(islice(stored, COLLECT_BATCH_SIZE)):
+        names = {item.key.rsplit('/', 1)[-1]: item for item in batch}
+        known = set(db.session.scalars(db.select(Blob.sha256).where(Blob.sha256.in_(names))))
+        for name, item in names.items():
+            if name not in known and now - item.modified > ORPHAN_GRACE_SECONDS:
+                store.delete(item.key)
+                removed += 1
+    db.session.rollback()
+    return removed
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def ensure_blob_collector(app, interval=BLOB_GC_INTERVAL_SECONDS):
+    """Start this process's blob collector thread if it is not running yet"""
+    run_periodically(app, 'blob-collector', interval, collect_garbage)
+
+
+def file_digest(path):
+    """SHA-256 and size of a file, read in chunks"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def fold_legacy_uploads(dry_run=False, batch_size=FOLD_BATCH_SIZE):
+    """Move old-style uploads (uploads/<name>, not in the store) into the blob store.
+
+    Each file is hashed in chunks and copied into storage (a hard link
+    when that is the local upload folder itself); rows get their sha256
+    and file_size, and each batch is committed. The old files are only
+    removed once every batch has committed, so an interrupted run can
+    simply be run again. Returns a dict of counts and byte totals before
+    and after.
+    """
+    report = {'files': 0, 'missing': 0, 'duplicates': 0, 'bytes_before': 0, 'bytes_after': 0}
+    store = storage()
+    folded = {}  # old path -> (sha256, size), for files shared by several rows
+    stored = set()
+
+    for model in BLOB_REFERENCES:
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(model.id, model.file_path)
+                .where(model.file_path.isnot(None), model.id > last_id,
+                       db.or_(model.sha256.is_(None),
+                              ~db.exists().where(Blob.sha256 == model.sha256)))
+                .order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = []
+            for row in rows:
+                path = resolve_upload(row.file_path)
+                if path not in folded:
+                    if not os.path.isfile(path):
+                        report['missing'] += 1
+                        continue
+                    sha256, size = file_digest(path)
+                    folded[path] = (sha256, size)
+                    report['files'] += 1
+                    report['bytes_before'] += size
+                    if sha256 in stored or store.exists(blob_key(sha256)):
+                        report['duplicates'] += 1
+                    else:
+                        report['bytes_after'] += size
+                        if not dry_run:
+                            store.save_path(blob_key(sha256), path)
+                    stored.add(sha256)
+                sha256, size = folded[path]
+                updates.append({'id': row.id, 'sha256': sha256, 'size': size})
+            if dry_run:
+                continue
+            for update in updates:
+                add_reference(update['sha256'], update['size'], count=0)
+            if updates:
+                db.session.execute(db.update(model), [
+                    {'id': update['id'], 'sha256': update['sha256'], 'file_size': update['size']}
+                    for update in updates
+                ])
+            db.session.commit()
+
+    if dry_run:
+        db.session.rollback()
+        return report
+    recount_references()
+    db.session.commit()
+    for path in folded:
+        _unlink(path)
+    return report
+
@@ -27,7 +27,7 @@ def check_courses():
                 
                 print(f"   - {course.title} (ID: {course.id})")
                 print(f"     Instructor: {instructor_name}")
-                print(f"     Students: {len(course.enrollments)}")
+                print(f"     Students: {course.enrolled_count}")
                 print(f"     Created: {course.created_at}")
                 print()
             
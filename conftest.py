@@ -0,0 +1,176 @@
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The older tests run against app's own database. Point it at a copy of the
+# development database before app is imported, so the suite never rewrites
+# instance/lms.db; the copy is brought up to the current schema below.
+if 'DATABASE_URL' not in os.environ:
+    _handle, DEVELOPMENT_DB_COPY = tempfile.mkstemp(prefix='edutrack-dev-', suffix='.db')
+    os.close(_handle)
+    shutil.copyfile(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'lms.db'),
+                    DEVELOPMENT_DB_COPY)
+    os.environ['DATABASE_URL'] = f'sqlite:///{DEVELOPMENT_DB_COPY}'
+else:
+    DEVELOPMENT_DB_COPY = None
+
+from database import db
+from enrollments import add_enrollment
+from isolated_app import make_isolated_app, drop_isolated_app, login_as
+from models import User, Course, Quiz, QuizQuestion
+
+
+@pytest.fixture(scope='session', autouse=True)
+def development_database(tmp_path_factory):
+    """Upgrade the copy of the development database, and remove it afterwards.
+
+    Uploads go to a temporary folder for the whole session, both for app and
+    for the isolated apps copied from its config, so neither the upgrade
+    (which folds legacy uploads into the blob store) nor any test touches
+    the repository's uploads/.
+    """
+    from app import app
+    from db_migrate import upgrade_database
+
+    app.config['UPLOAD_FOLDER'] = str(tmp_path_factory.mktemp('uploads'))
+    if DEVELOPMENT_DB_COPY is None:
+        yield
+        return
+    with app.app_context():
+        upgrade_database()
+    yield
+    with app.app_context():
+        db.engine.dispose()
+    os.remove(DEVELOPMENT_DB_COPY)
+
+
+@pytest.fixture
+def isolated_app():
+    """An EduTrack app bound to a fresh, empty SQLite database"""
+    app = make_isolated_app()
+    yield app
+    drop_isolated_app(app)
+
+
+@pytest.fixture
+def client(isolated_app):
+    return isolated_app.test_client()
+
+
+# The factories below are called inside the test's app context
+
+
+@pytest.fixture
+def make_user():
+    """Factory for users; the user is added to the session, not flushed"""
+    def make_user(username, role, first_name=None, last_name='Tester'):
+        user = User(username=username, email=f'{username}@example.com',
+                    first_name=first_name or username.title(), last_name=last_name, role=role)
+        # Tests log in with login_as(), so no password needs hashing
+        user.password_hash = 'unused'
+        db.session.add(user)
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_course():
+    """Factory for a course taught by ``teacher`` (which must have an id); flushed"""
+    def make_course(teacher, title='Course', **fields):
+        course = Course(title=title, instructor_id=teacher.id, **{
+            'description': f'{title} course',
+            'instructor': f'{teacher.first_name} {teacher.last_name}',
+            'duration_weeks': 4, 'difficulty': 'Beginner', 'max_students': 10,
+            **fields,
+        })
+        db.session.add(course)
+        db.session.flush()
+        return course
+    return make_course
+
+
+@pytest.fixture
+def seed_course(make_user, make_course):
+    """Factory for a course with a teacher and one enrolled student.
+
+    Commits and returns (teacher, student, course).
+    """
+    def seed_course(title='Course'):
+        teacher = make_user('teacher', 'teacher', first_name='Sarah', last_name='Johnson')
+        student = make_user('student', 'student', first_name='John', last_name='Student')
+        db.session.flush()
+        course = make_course(teacher, title=title)
+        add_enrollment(student.id, course.id)
+        db.session.commit()
+        return teacher, student, course
+    return seed_course
+
+
+@pytest.fixture
+def seed_quiz(seed_course):
+    """Factory for a quiz with one question per entry of ``question_points``.
+
+    The quiz's course has a teacher and one enrolled student. Commits and
+    returns (student, quiz, questions).
+    """
+    def seed_quiz(question_points=(1, 2, 3, 4)):
+        teacher, student, course = seed_course(title='Quizzing')
+        quiz = Quiz(title='Final', course_id=course.id, passing_score=50)
+        db.session.add(quiz)
+        db.session.flush()
+        questions = [QuizQuestion(quiz_id=quiz.id, question_text=f'Q{i}', option_a='a',
+                                  option_b='b', option_c='c', option_d='d',
+                                  correct_answer='ABCD'[i % 4], points=points, order_num=i)
+                     for i, points in enumerate(question_points)]
+        db.session.add_all(questions)
+        db.session.commit()
+        return student, quiz, questions
+    return seed_quiz
+
+
+@pytest.fixture
+def open_quiz(isolated_app, seed_quiz):
+    """Factory that seeds a quiz and opens it as its student.
+
+    Returns (logged-in client, quiz, [(question_id, correct_answer)]).
+    """
+    def open_quiz():
+        student, quiz, questions = seed_quiz()
+        client = isolated_app.test_client()
+        login_as(client, student)
+        assert client.get(f'/quiz/{quiz.id}/take').status_code == 200
+        return client, quiz, [(q.id, q.correct_answer) for q in questions]
+    return open_quiz
+
+
+@pytest.fixture
+def upload_config():
+    """Extra app config for teacher_client; override it in a module to set upload limits"""
+    return {}
+
+
+@pytest.fixture
+def teacher_client(isolated_app, tmp_path, seed_course, upload_config):
+    """A client logged in as the teacher of a seeded course, uploading to tmp_path.
+
+    Yields (client, course id, the course's student) inside an app context.
+    """
+    isolated_app.config.update(UPLOAD_FOLDER=str(tmp_path), **upload_config)
+    with isolated_app.app_context():
+        teacher, student, course = seed_course()
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+        yield client, course.id, student
+
+
+@pytest.fixture
+def upload_material():
+    """Post a file as a new course material with a teacher's test client"""
+    def upload_material(client, course_id, data, filename='slides.pdf'):
+        return client.post(f'/teacher/upload-material/{course_id}', data={
+            'title': 'Week 1', 'description': '', 'file': (io.BytesIO(data), filename),
+        }, content_type='multipart/form-data')
+    return upload_material
@@ -262,13 +262,9 @@ def create_sample_data():
     db.session.commit()
     
     # Enroll student in courses
-    enrollments = [
-        Enrollment(user_id=2, course_id=1),  # student in Python course
-        Enrollment(user_id=2, course_id=2),  # student in Flask course
-    ]
-    
-    for enrollment in enrollments:
-        db.session.add(enrollment)
+    from enrollments import add_enrollment
+    add_enrollment(2, 1)  # student in Python course
+    add_enrollment(2, 2)  # student in Flask course
     db.session.commit()
     
     print("✓ Sample data created successfully")
@@ -279,6 +275,134 @@ def create_sample_data():
     print("  - 2 announcements")
     print("  - 2 student enrollments")
 
+def add_missing_columns():
+    """Add columns declared in models.py that an existing database lacks.
+
+    db.create_all() only creates missing tables, so new columns on old
+    tables are added here with ALTER TABLE. Safe to run repeatedly.
+    """
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=db.engine.dialect)}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = "'" + default.replace("'", "''") + "'"
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+def add_missing_indexes():
+    """Create indexes declared in models.py that an existing database lacks.
+
+    Each index is built in its own short transaction so writers are only
+    held up for one index at a time; on PostgreSQL the build uses
+    CREATE INDEX CONCURRENTLY and does not block writes at all. Safe to
+    run repeatedly.
+    """
+    from sqlalchemy import inspect, text
+    from sqlalchemy.schema import CreateIndex
+
+    inspector = inspect(db.engine)
+    concurrent = db.engine.dialect.name == 'postgresql'
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=db.engine.dialect))
+            if concurrent:
+                # CONCURRENTLY cannot run inside a transaction block
+                ddl = ddl.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+                with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    conn.execute(text(ddl))
+            else:
+                with db.engine.begin() as conn:
+                    conn.execute(text(ddl))
+            created.append(index.name)
+    return created
+
+def drop_duplicate_open_attempts():
+    """Delete all but the first open attempt of each student on each quiz.
+
+    Only one open attempt per student and quiz is allowed (see
+    QuizAttempt's uq_quiz_attempt_open), but older code could open a
+    second one when a quiz was started twice at once. Answers were always
+    autosaved to the first, so the later ones are dropped along with any
+    answers they hold. Returns the number of attempts deleted.
+    """
+    from sqlalchemy.orm import aliased
+    from models import QuizAnswer, QuizAttempt
+
+    earlier = aliased(QuizAttempt)
+    duplicate_ids = db.select(QuizAttempt.id).where(
+        QuizAttempt.completed_at.is_(None),
+        db.exists().where(earlier.quiz_id == QuizAttempt.quiz_id,
+                          earlier.user_id == QuizAttempt.user_id,
+                          earlier.completed_at.is_(None),
+                          earlier.id < QuizAttempt.id)
+    )
+    duplicates = db.session.scalars(duplicate_ids).all()
+    if duplicates:
+        db.session.execute(db.delete(QuizAnswer).where(QuizAnswer.attempt_id.in_(duplicates)))
+        db.session.execute(db.delete(QuizAttempt).where(QuizAttempt.id.in_(duplicates)))
+    db.session.commit()
+    return len(duplicates)
+
+def reconcile_counters():
+    """Rebuild denormalized counters from the underlying rows"""
+    from enrollments import reconcile_enrolled_counts, recompute_progress
+
+    drifted = reconcile_enrolled_counts()
+    recomputed = recompute_progress()
+    db.session.commit()
+    print(f"✓ Enrollment counters reconciled ({drifted} course(s) corrected)")
+    print(f"✓ Course progress recomputed for {recomputed} enrollment(s)")
+    return True
+
+def link_quiz_grades():
+    """Point quiz grades written before Grade.quiz_attempt_id existed at their attempt.
+
+    Older quiz grades are only tied to their attempt by student, course and
+    the "Quiz: <title>" name, so they are matched on those in one UPDATE.
+    Returns the number of grades linked.
+    """
+    from models import Grade, Quiz, QuizAttempt
+
+    attempt_id = db.select(QuizAttempt.id).join(
+        Quiz, Quiz.id == QuizAttempt.quiz_id
+    ).where(
+        QuizAttempt.user_id == Grade.user_id,
+        Quiz.course_id == Grade.course_id,
+        db.literal('Quiz: ') + Quiz.title == Grade.assignment_name
+    ).order_by(QuizAttempt.id).limit(1).scalar_subquery()
+
+    result = db.session.execute(
+        db.update(Grade)
+        .where(Grade.quiz_attempt_id.is_(None), Grade.assignment_name.like('Quiz: %'),
+               attempt_id.is_not(None))
+        .values(quiz_attempt_id=attempt_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
 def upgrade_database():
     """Upgrade existing database with new tables"""
     try:
@@ -287,9 +411,23 @@ def upgrade_database():
         # Create new tables if they don't exist
         db.create_all()
         
+        # Add new columns to existing tables
+        for column in add_missing_columns():
+            print(f"✓ Added column '{column}'")
+        
+        # The unique index on open attempts cannot be built over duplicates
+        dropped = drop_duplicate_open_attempts()
+        if dropped:
+            print(f"✓ Removed {dropped} duplicate open quiz attempt(s)")
+        
+        # Build indexes for hot query paths
+        for index in add_missing_indexes():
+            print(f"✓ Created index '{index}'")
+        
         # Check if new tables exist
         tables_to_check = ['assignment', 'assignment_submission', 'study_progress']
-        existing_tables = db.engine.table_names()
+        from sqlalchemy import inspect
+        existing_tables = inspect(db.engine).get_table_names()
         
         for table in tables_to_check:
             if table in existing_tables:
@@ -297,6 +435,16 @@ def upgrade_database():
             else:
                 print(f"✗ Table '{table}' missing")
         
+        reconcile_counters()
+        
+        linked = link_quiz_grades()
+        print(f"✓ Linked {linked} quiz grade(s) to their attempts")
+        
+        from blob_store import fold_legacy_uploads
+        folded = fold_legacy_uploads()
+        print(f"✓ Moved {folded['files']} upload(s) into the blob store "
+              f"({folded['duplicates']} duplicate(s), {folded['missing']} missing)")
+        
         print("✓ Database upgrade completed")
         return True
         
@@ -377,18 +525,22 @@ if __name__ == "__main__":
     print("EduTrack Database Migration Tool")
     print("=" * 40)
     
-    # Initialize database
-    if init_db():
-        print("\n✓ Database initialization completed successfully!")
-    else:
-        print("\n✗ Database initialization failed!")
-    
-    # Upgrade existing database
-    print("\nUpgrading existing database...")
-    if upgrade_database():
-        print("✓ Database upgrade completed successfully!")
-    else:
-        print("✗ Database upgrade failed!")
+    success = True
+    with app.app_context():
+        # Initialize database
+        if init_db():
+            print("\n✓ Database initialization completed successfully!")
+        else:
+            print("\n✗ Database initialization failed!")
+            success = False
+        
+        # Upgrade existing database
+        print("\nUpgrading existing database...")
+        if upgrade_database():
+            print("✓ Database upgrade completed successfully!")
+        else:
+            print("✗ Database upgrade failed!")
+            success = False
     
     # Fix course limits if needed
     print("\nChecking course student limits...")
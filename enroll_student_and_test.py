@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app, db
 from models import User, Course, Enrollment, Quiz, QuizQuestion
+from enrollments import add_enrollment
 
 def enroll_and_test():
     """Enroll student in a course and test quiz"""
@@ -43,12 +44,7 @@ def enroll_and_test():
                 print(f"✅ Student already enrolled in course")
             else:
                 # Create enrollment
-                enrollment = Enrollment(
-                    user_id=student.id,
-                    course_id=course.id,
-                    status='active'
-                )
-                db.session.add(enrollment)
+                add_enrollment(student.id, course.id, status='active')
                 db.session.commit()
                 print(f"✅ Student enrolled in course")
             
@@ -0,0 +1,263 @@
+"""
+Enrollment bookkeeping.
+
+Course.enrolled_count is a denormalized copy of the number of Enrollment
+rows for a course, and Enrollment.progress/completed_materials/
+total_materials are a denormalized copy of the student's study progress.
+Every path that adds or removes enrollments or materials, or changes a
+material's completion status, goes through the helpers below so the
+counters move in the same transaction as the rows themselves. Apart
+from enroll_student, which has to roll back to report its outcome, none
+of these helpers commit; the caller owns the transaction.
+"""
+
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import Course, Enrollment, CourseMaterial, StudyProgress
+from stats_cache import report_cache, invalidate_on_commit
+
+# Outcomes of enroll_student()
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+COURSE_FULL = 'full'
+
+
+def enroll_student(user_id, course_id):
+    """Enroll a student, letting the database decide whether there is room.
+
+    The enrollment row is inserted with ON CONFLICT DO NOTHING against the
+    (user_id, course_id) unique constraint, then a seat is claimed with a
+    conditional UPDATE on the course row. The UPDATE only matches while
+    enrolled_count < max_students and takes the course row's write lock, so
+    concurrent requests queue behind each other instead of both taking the
+    last seat. Commits on success and rolls back otherwise.
+
+    Returns ENROLLED, ALREADY_ENROLLED or COURSE_FULL.
+    """
+    if not _insert_enrollment(user_id, course_id):
+        db.session.rollback()
+        return ALREADY_ENROLLED
+
+    claimed = db.session.execute(
+        db.update(Course)
+        .where(Course.id == course_id,
+               Course.enrolled_count < Course.max_students)
+        .values(enrolled_count=Course.enrolled_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return COURSE_FULL
+
+    invalidate_on_commit(report_cache)
+    db.session.commit()
+    return ENROLLED
+
+
+def _insert_enrollment(user_id, course_id):
+    """Insert the enrollment row unless it already exists; True if inserted"""
+    values = {
+        'user_id': user_id,
+        'course_id': course_id,
+        'enrolled_at': datetime.utcnow(),
+        'progress': 0.0,
+        'completed_materials': 0,
+        'total_materials': _material_count(course_id),
+        'status': 'active',
+    }
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Enrollment).values(**values))
+            return True
+        except IntegrityError:
+            return False
+
+    statement = insert(Enrollment).values(**values).on_conflict_do_nothing(
+        index_elements=['user_id', 'course_id']
+    )
+    return db.session.execute(statement).rowcount == 1
+
+
+def adjust_enrolled_count(course_id, delta):
+    """Atomically add ``delta`` to a course's enrollment counter"""
+    if not delta:
+        return
+    db.session.execute(
+        db.update(Course)
+        .where(Course.id == course_id)
+        .values(enrolled_count=Course.enrolled_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+    _expire_course(course_id)
+    invalidate_on_commit(report_cache)
+
+
+def add_enrollment(user_id, course_id, **fields):
+    """Insert an enrollment and count it against the course"""
+    fields.setdefault('total_materials', CourseMaterial.query.filter_by(course_id=course_id).count())
+    fields.setdefault('progress', 0.0)
+    enrollment = Enrollment(user_id=user_id, course_id=course_id, **fields)
+    db.session.add(enrollment)
+    db.session.flush()
+    adjust_enrolled_count(course_id, 1)
+    return enrollment
+
+
+def remove_enrollment(enrollment):
+    """Delete a single enrollment and release its seat"""
+    course_id = enrollment.course_id
+    db.session.delete(enrollment)
+    db.session.flush()
+    adjust_enrolled_count(course_id, -1)
+
+
+def remove_course_enrollments(course_id):
+    """Delete every enrollment in a course; returns how many were removed"""
+    removed = Enrollment.query.filter_by(course_id=course_id).delete(synchronize_session=False)
+    adjust_enrolled_count(course_id, -removed)
+    return removed
+
+
+def remove_user_enrollments(user_id):
+    """Delete every enrollment held by a user, releasing one seat per course"""
+    enrolled_course_ids = db.select(Enrollment.course_id).where(Enrollment.user_id == user_id)
+    db.session.execute(
+        db.update(Course)
+        .where(Course.id.in_(enrolled_course_ids))
+        .values(enrolled_count=Course.enrolled_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    removed = Enrollment.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    _expire_courses()
+    invalidate_on_commit(report_cache)
+    return removed
+
+
+def reconcile_enrolled_counts():
+    """Rebuild every course's counter from the enrollment table in one statement.
+
+    Returns the number of courses whose counter had drifted.
+    """
+    actual = db.select(db.func.count(Enrollment.id)).where(
+        Enrollment.course_id == Course.id
+    ).scalar_subquery()
+    result = db.session.execute(
+        db.update(Course)
+        .where(Course.enrolled_count != actual)
+        .values(enrolled_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    _expire_courses()
+    invalidate_on_commit(report_cache)
+    return result.rowcount
+
+
+def material_added(course_id):
+    """Count a new material against every enrollment in the course"""
+    _update_progress(Enrollment.course_id == course_id, total_delta=1)
+
+
+def material_removed(course_id, material_id):
+    """Drop a material from every enrollment in the course.
+
+    Must run before the material's StudyProgress rows are deleted, since
+    they tell us which students had completed it.
+    """
+    completed_by = db.select(StudyProgress.user_id).where(
+        StudyProgress.material_id == material_id,
+        StudyProgress.completion_status == 'completed'
+    )
+    had_completed = db.case((Enrollment.user_id.in_(completed_by), 1), else_=0)
+    _update_progress(Enrollment.course_id == course_id,
+                     completed_delta=-had_completed, total_delta=-1)
+
+
+def completion_changed(user_id, course_id, was_completed, is_completed):
+    """Move a student's completed counter when a material's status flips"""
+    delta = int(bool(is_completed)) - int(bool(was_completed))
+    if delta:
+        _update_progress(db.and_(Enrollment.user_id == user_id,
+                                 Enrollment.course_id == course_id),
+                         completed_delta=delta)
+
+
+def recompute_progress(course_id=None):
+    """Rebuild progress counters from the material and study tables.
+
+    Intended for backfills; runs as two bulk UPDATEs regardless of how
+    many enrollments are touched. Returns the number of enrollments updated.
+    """
+    total = db.select(db.func.count(CourseMaterial.id)).where(
+        CourseMaterial.course_id == Enrollment.course_id
+    ).scalar_subquery()
+    completed = db.select(db.func.count(StudyProgress.id)).where(
+        StudyProgress.user_id == Enrollment.user_id,
+        StudyProgress.course_id == Enrollment.course_id,
+        StudyProgress.completion_status == 'completed'
+    ).scalar_subquery()
+
+    counts = db.update(Enrollment).values(total_materials=total, completed_materials=completed)
+    percentages = db.update(Enrollment).values(
+        progress=_percentage(Enrollment.completed_materials, Enrollment.total_materials)
+    )
+    if course_id is not None:
+        counts = counts.where(Enrollment.course_id == course_id)
+        percentages = percentages.where(Enrollment.course_id == course_id)
+
+    result = db.session.execute(counts.execution_options(synchronize_session=False))
+    db.session.execute(percentages.execution_options(synchronize_session=False))
+    _expire_enrollments()
+    return result.rowcount
+
+
+def _update_progress(criteria, completed_delta=0, total_delta=0):
+    # SET expressions see the row's old values, so the new percentage is
+    # computed from the adjusted counters rather than the columns
+    completed = Enrollment.completed_materials + completed_delta
+    total = Enrollment.total_materials + total_delta
+    db.session.execute(
+        db.update(Enrollment)
+        .where(criteria)
+        .values(completed_materials=completed,
+                total_materials=total,
+                progress=_percentage(completed, total))
+        .execution_options(synchronize_session=False)
+    )
+    _expire_enrollments()
+
+
+def _percentage(completed, total):
+    return db.case((total > 0, completed * 100.0 / total), else_=0.0)
+
+
+def _material_count(course_id):
+    return db.select(db.func.count(CourseMaterial.id)).where(
+        CourseMaterial.course_id == course_id
+    ).scalar_subquery()
+
+
+def _expire_enrollments():
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Enrollment):
+            db.session.expire(obj, ['progress', 'completed_materials', 'total_materials'])
+
+
+def _expire_course(course_id):
+    course = db.session.identity_map.get(db.session.identity_key(Course, course_id))
+    if course is not None:
+        db.session.expire(course, ['enrolled_count'])
+
+
+def _expire_courses():
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Course):
+            db.session.expire(obj, ['enrolled_count'])
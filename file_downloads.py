@@ -0,0 +1,110 @@
+"""
+Conditional and range downloads of stored files.
+
+send_stored_file() answers with a strong ETag (the content's SHA-256 for
+files in the blob store, otherwise the file's mtime and size), a
+Last-Modified date and a long private Cache-Control, so a browser that
+already has a file revalidates it with a 304 instead of downloading it
+again. Range and If-Range requests get 206 partial responses, which lets
+interrupted downloads resume.
+
+With DOWNLOAD_OFFLOAD set, the bytes are not sent by the app at all: the
+response carries an X-Sendfile header (Apache, lighttpd) or an
+X-Accel-Redirect to X_ACCEL_REDIRECT_PREFIX + the file's path in the
+upload folder (nginx, with a matching internal location), and the front
+proxy streams the file and handles ranges itself. 304s are still answered
+here.
+
+send_upload() picks the right way for the configured storage backend:
+local files go through send_stored_file(), S3 objects are a redirect to a
+presigned URL (the bucket then handles validators and ranges), or, with
+presigning turned off, streamed through the app in chunks.
+"""
+
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import current_app, redirect, request
+from werkzeug.utils import send_file
+
+from file_uploads import UPLOAD_CHUNK_SIZE, upload_folder
+from storage import storage
+
+# One year; stored files never change under the same name or hash
+DEFAULT_DOWNLOAD_MAX_AGE = 365 * 24 * 60 * 60
+
+# Values for DOWNLOAD_OFFLOAD
+OFFLOAD_MODES = ('x-sendfile', 'x-accel-redirect')
+
+DEFAULT_X_ACCEL_REDIRECT_PREFIX = '/protected-uploads/'
+
+
+def file_etag(path, sha256=None):
+    """Strong ETag for a stored file: its content hash, or its mtime and size"""
+    if sha256:
+        return sha256
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def send_stored_file(path, download_name, sha256=None, as_attachment=False):
+    """Send a stored file with validators, caching headers and range support"""
+    config = current_app.config
+    offload = config.get('DOWNLOAD_OFFLOAD')
+    if offload and offload not in OFFLOAD_MODES:
+        raise ValueError(f'DOWNLOAD_OFFLOAD must be one of {", ".join(OFFLOAD_MODES)}')
+
+    response = send_file(
+        path, request.environ, download_name=download_name, as_attachment=as_attachment,
+        etag=file_etag(path, sha256), max_age=config.get('DOWNLOAD_MAX_AGE', DEFAULT_DOWNLOAD_MAX_AGE),
+        use_x_sendfile=bool(offload), conditional=not offload,
+        response_class=current_app.response_class,
+    )
+    # Downloads sit behind a login, so only the user's own browser may cache them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if sha256:
+        response.cache_control.immutable = True
+
+    if offload:
+        # The proxy handles ranges; only revalidation is answered here
+        response = response.make_conditional(request.environ)
+        sendfile = response.headers.pop('X-Sendfile', None)
+        if response.status_code != 304 and offload == 'x-accel-redirect':
+            location = os.path.relpath(sendfile, upload_folder()).replace(os.sep, '/')
+            prefix = config.get('X_ACCEL_REDIRECT_PREFIX', DEFAULT_X_ACCEL_REDIRECT_PREFIX)
+            response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(location)
+        elif response.status_code != 304:
+            response.headers['X-Sendfile'] = sendfile
+    return response
+
+
+def send_upload(key, download_name, sha256=None, as_attachment=False):
+    """Send a stored file by its storage key, whatever the backend"""
+    store = storage()
+    url = store.download_url(key, download_name, as_attachment=as_attachment)
+    if url:
+        response = redirect(url)
+        # The link expires, so the redirect itself must not be cached
+        response.cache_control.no_store = True
+        return response
+    path = store.local_path(key)
+    if path:
+        return send_stored_file(path, download_name, sha256=sha256, as_attachment=as_attachment)
+
+    body = store.open(key)
+    response = current_app.response_class(
+        iter(lambda: body.read(UPLOAD_CHUNK_SIZE), b''),
+        mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+        direct_passthrough=True,
+    )
+    response.call_on_close(body.close)
+    response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                         filename=download_name)
+    if sha256:
+        response.set_etag(sha256)
+        response.cache_control.private = True
+        response.cache_control.max_age = current_app.config.get('DOWNLOAD_MAX_AGE', DEFAULT_DOWNLOAD_MAX_AGE)
+        response = response.make_conditional(request.environ)
+    return response
@@ -0,0 +1,203 @@
+"""
+Streaming file uploads.
+
+Werkzeug parses a multipart upload in 64 KiB chunks and hands each
+file's bytes to a stream from Request._get_file_stream(). By default that
+is a SpooledTemporaryFile, which the view then copies again with
+FileStorage.save(). Views that take large files call stage_uploads()
+before touching request.files; UploadRequest then writes each file
+straight to an IncomingFile in the upload folder's staging directory,
+hashing it with SHA-256 as the chunks arrive. Keeping the upload is one
+os.replace() into its final name, so a file is either fully in place or
+not there at all.
+
+Memory per upload is bounded by the parser's buffer and the hash state,
+whatever the size of the file. The request's max_content_length is
+lowered to what the upload may use, so an oversized upload is refused from
+its Content-Length before any of it is read, or as soon as the limit is
+crossed when the client does not send one. Uploads that would leave less
+than FREE_SPACE_RESERVE_BYTES on the disk are refused up front.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
+
+from database import db
+from models import CourseMaterial
+
+# Bytes read per chunk when a stream has to be copied
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Defaults for MATERIAL_MAX_BYTES, COURSE_UPLOAD_QUOTA_BYTES and ASSIGNMENT_MAX_BYTES
+DEFAULT_MATERIAL_MAX_BYTES = 500 * 1024 * 1024
+DEFAULT_COURSE_UPLOAD_QUOTA_BYTES = 5 * 1024 * 1024 * 1024
+DEFAULT_ASSIGNMENT_MAX_BYTES = 50 * 1024 * 1024
+
+# Allowance for multipart framing and the other form fields
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Free disk space an upload must leave behind
+FREE_SPACE_RESERVE_BYTES = 100 * 1024 * 1024
+
+# Partial uploads live here until they are kept or discarded
+STAGING_DIR = '.incoming'
+
+class UploadError(ValueError):
+    """Raised when an upload cannot be kept, e.g. it is over its size limit"""
+
+
+class InsufficientStorage(HTTPException):
+    """507: the disk cannot take this upload"""
+    code = 507
+    description = 'There is not enough disk space to store this upload.'
+
+
+class IncomingFile(io.FileIO):
+    """A staged upload, hashed and counted as it is written.
+
+    Deleted on close unless keep() has moved it into place.
+    """
+
+    def __init__(self, directory):
+        self.path = None
+        self._kept = False
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='upload-', suffix='.part')
+        super().__init__(fd, 'r+b')
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += super().write(view[written:])
+        self._hash.update(view)
+        self.size += written
+        return written
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def keep(self, path):
+        """Atomically move the finished upload to ``path``"""
+        os.fsync(self.fileno())
+        os.replace(self.path, path)
+        self._kept = True
+        self.close()
+
+    def close(self):
+        super().close()
+        if self.path is not None and not self._kept:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadRequest(Request):
+    """Request that streams staged uploads to disk instead of spooling them"""
+
+    upload_staging = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        if self.upload_staging is None:
+            return super()._get_file_stream(total_content_length, content_type,
+                                            filename, content_length)
+        expected = content_length or total_content_length or 0
+        if shutil.disk_usage(self.upload_staging).free < expected + FREE_SPACE_RESERVE_BYTES:
+            raise InsufficientStorage()
+        return IncomingFile(self.upload_staging)
+
+
+_ensured_dirs = set()
+
+
+def _ensure_dir(path):
+    # Created once per process rather than checked on every request
+    if path not in _ensured_dirs:
+        os.makedirs(path, exist_ok=True)
+        _ensured_dirs.add(path)
+    return path
+
+
+def upload_folder():
+    """Directory uploaded files are kept in (UPLOAD_FOLDER, or uploads/)"""
+    folder = current_app.config.get('UPLOAD_FOLDER') or os.path.join(current_app.root_path, 'uploads')
+    return _ensure_dir(folder)
+
+
+def stage_uploads(max_bytes):
+    """Stream this request's files to the staging directory, at most ``max_bytes``.
+
+    Must be called before request.files or request.form is first read.
+    """
+    request.upload_staging = _ensure_dir(os.path.join(upload_folder(), STAGING_DIR))
+    request.max_content_length = max(max_bytes, 0) + FORM_OVERHEAD_BYTES
+
+
+def receive_upload(file, max_bytes=None):
+    """The IncomingFile holding an uploaded FileStorage's bytes.
+
+    Staged uploads are used as they are; anything else is copied in
+    UPLOAD_CHUNK_SIZE chunks to a staging file first. Raises UploadError
+    if the file is larger than ``max_bytes``.
+    """
+    incoming = file.stream
+    if not isinstance(incoming, IncomingFile):
+        incoming = IncomingFile(_ensure_dir(os.path.join(upload_folder(), STAGING_DIR)))
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+            incoming.write(chunk)
+    if max_bytes is not None and incoming.size > max_bytes:
+        incoming.close()
+        raise UploadError(f'{file.filename} is larger than {format_size(max_bytes)}')
+    return incoming
+
+
+def resolve_upload(file_path):
+    """Absolute path of a stored ``uploads/<name>`` file_path"""
+    return os.path.join(upload_folder(), os.path.basename(file_path))
+
+
+def stored_name(prefix, filename):
+    """A unique, filesystem-safe name for an upload"""
+    return f"{prefix}_{secure_filename(filename) or 'upload'}"
+
+
+def course_upload_usage(course_id):
+    """Bytes of material files a course already stores"""
+    return db.session.scalar(
+        db.select(db.func.coalesce(db.func.sum(CourseMaterial.file_size), 0))
+        .where(CourseMaterial.course_id == course_id)
+    )
+
+
+def material_upload_limit(course_id):
+    """Largest file a course can take now: the per-file cap or what is left of its quota"""
+    config = current_app.config
+    per_file = config.get('MATERIAL_MAX_BYTES', DEFAULT_MATERIAL_MAX_BYTES)
+    quota = config.get('COURSE_UPLOAD_QUOTA_BYTES', DEFAULT_COURSE_UPLOAD_QUOTA_BYTES)
+    return max(0, min(per_file, quota - course_upload_usage(course_id)))
+
+
+def submission_upload_limit(assignment=None):
+    """Largest file a submission to this assignment (or by default) may have"""
+    if assignment is not None and assignment.max_file_bytes:
+        return assignment.max_file_bytes
+    return current_app.config.get('ASSIGNMENT_MAX_BYTES', DEFAULT_ASSIGNMENT_MAX_BYTES)
+
+
+def format_size(size):
+    """Human-readable byte count, e.g. 1.5 MB"""
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+        size /= 1024
@@ -85,8 +85,8 @@ def show_current_limits():
             for course in courses:
                 print(f"Course: {course.title}")
                 print(f"  Max Students: {course.max_students}")
-                print(f"  Enrolled: {len(course.enrollments)}")
-                print(f"  Available: {course.max_students - len(course.enrollments)}")
+                print(f"  Enrolled: {course.enrolled_count}")
+                print(f"  Available: {course.max_students - course.enrolled_count}")
                 print()
                 
         except Exception as e:
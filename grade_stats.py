@@ -0,0 +1,151 @@
+"""
+Grade aggregation for the grade pages and dashboards.
+
+The grades, profile and certificates pages all need per-course totals for
+one student. Rather than loading every Grade row and summing in Python,
+course_grade_summaries() asks the database for them in a single GROUP BY
+query joined to Course, so the cost depends on the number of courses the
+student has grades in, not on the number of graded items. The recent
+grade feeds likewise rank grades per course with a window function instead
+of querying each course in turn.
+"""
+
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models import Course, Grade
+
+LETTERS = ('A', 'B', 'C', 'D', 'F')
+
+# Same thresholds as Grade.get_letter_grade()
+LETTER_THRESHOLDS = (('A', 90), ('B', 80), ('C', 70), ('D', 60))
+
+# How many individual grades the grades page lists per course
+RECENT_GRADES_PER_COURSE = 20
+
+
+def letter_grade(score):
+    """SQL expression mapping a score to its letter grade"""
+    return db.case(
+        (score.is_(None), 'N/A'),
+        *[(score >= threshold, letter) for letter, threshold in LETTER_THRESHOLDS],
+        else_='F'
+    )
+
+
+def course_grade_summaries(user_id):
+    """Per-course grade totals for a student, ordered by course title.
+
+    Each entry is a dict with the Course, the number of grades, how many of
+    them have a score, the average score (None if nothing is scored), the
+    most recent graded_at, the letter grade of the average, the number of
+    quiz grades and a count per letter grade.
+    """
+    is_quiz = Grade.assignment_name.like('%Quiz:%')
+    letter = letter_grade(Grade.score)
+    average = db.func.avg(Grade.score)
+
+    rows = db.session.execute(
+        db.select(
+            Course,
+            db.func.count(Grade.id).label('grade_count'),
+            db.func.count(Grade.score).label('graded_count'),
+            average.label('average'),
+            db.func.max(Grade.graded_at).label('last_graded_at'),
+            letter_grade(average).label('letter_grade'),
+            db.func.count(db.case((is_quiz, 1))).label('quiz_count'),
+            *[db.func.count(db.case((letter == grade, 1))).label(f'{grade}_count')
+              for grade in LETTERS]
+        )
+        .join(Grade, Grade.course_id == Course.id)
+        .where(Grade.user_id == user_id)
+        .group_by(Course.id)
+        .order_by(Course.title)
+    ).all()
+
+    summaries = []
+    for row in rows:
+        summaries.append({
+            'course': row.Course,
+            'grade_count': row.grade_count,
+            'graded_count': row.graded_count,
+            'average': row.average,
+            'last_graded_at': row.last_graded_at,
+            'letter_grade': row.letter_grade,
+            'quiz_count': row.quiz_count,
+            'letter_counts': {grade: getattr(row, f'{grade}_count') for grade in LETTERS},
+        })
+    return summaries
+
+
+def overall_grade_summary(summaries):
+    """Combine per-course summaries into the student's overall totals"""
+    grade_count = sum(s['grade_count'] for s in summaries)
+    graded_count = sum(s['graded_count'] for s in summaries)
+    quiz_count = sum(s['quiz_count'] for s in summaries)
+    score_total = sum(s['average'] * s['graded_count'] for s in summaries if s['graded_count'])
+    return {
+        'course_count': len(summaries),
+        'grade_count': grade_count,
+        'quiz_count': quiz_count,
+        'assignment_count': grade_count - quiz_count,
+        'average': score_total / graded_count if graded_count else 0.0,
+        'letter_counts': {grade: sum(s['letter_counts'][grade] for s in summaries)
+                          for grade in LETTERS},
+    }
+
+
+def course_average_grades(course_ids):
+    """Average score per course, rounded like Course.get_average_grade()"""
+    rows = db.session.execute(
+        db.select(Grade.course_id, db.func.avg(Grade.score))
+        .where(Grade.course_id.in_(course_ids), Grade.score >= 0)
+        .group_by(Grade.course_id)
+    ).all()
+    return {course_id: round(average, 2) for course_id, average in rows}
+
+
+def recent_grades_by_course(user_id, per_course=RECENT_GRADES_PER_COURSE):
+    """The most recent grades in each course, newest first, keyed by course id"""
+    ranked = _ranked_grades(Grade.user_id == user_id)
+
+    grades = db.session.execute(
+        db.select(Grade)
+        .join(ranked, ranked.c.id == Grade.id)
+        .where(ranked.c.position <= per_course)
+        .order_by(Grade.course_id, ranked.c.position)
+    ).scalars().all()
+
+    by_course = {}
+    for grade in grades:
+        by_course.setdefault(grade.course_id, []).append(grade)
+    return by_course
+
+
+def recent_grades_for_courses(course_ids, per_course, limit):
+    """A feed of the newest grades across several courses.
+
+    ``course_ids`` may be a list or a SELECT of ids. At most ``per_course``
+    grades are taken from any one course, so a busy section cannot crowd
+    the others out of the feed. The grades come back newest first with
+    their course already loaded.
+    """
+    ranked = _ranked_grades(Grade.course_id.in_(course_ids))
+
+    return db.session.execute(
+        db.select(Grade)
+        .join(ranked, ranked.c.id == Grade.id)
+        .options(joinedload(Grade.course))
+        .where(ranked.c.position <= per_course)
+        .order_by(Grade.graded_at.desc(), Grade.id.desc())
+        .limit(limit)
+    ).scalars().all()
+
+
+def _ranked_grades(criteria):
+    # Number each course's grades from newest to oldest
+    position = db.func.row_number().over(
+        partition_by=Grade.course_id,
+        order_by=(Grade.graded_at.desc(), Grade.id.desc())
+    ).label('position')
+    return db.select(Grade.id, position).where(criteria).subquery()
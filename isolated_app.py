@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Helpers for running EduTrack against a throwaway database.
+
+The main app is bound to lms.db at import time, so tests and benchmarks
+build a second Flask app that shares the same views and templates but
+talks to its own SQLite file (or an in-memory database).
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import event, text
+
+from app import app as main_app
+from database import db
+from stats_cache import report_cache, quiz_summary_cache
+from quiz_cache import quiz_cache
+from quiz_autosave import autosave_buffer
+from quiz_analysis import clear_analysis_cache
+
+
+def make_isolated_app(database_uri=None):
+    """Create an app with every EduTrack route bound to a fresh database.
+
+    When no URI is given a temporary SQLite file is used, which (unlike
+    ``sqlite://``) can be shared by several threads.
+    """
+    if database_uri is None:
+        handle, path = tempfile.mkstemp(prefix='edutrack-', suffix='.db')
+        os.close(handle)
+        database_uri = f"sqlite:///{path}"
+
+    isolated = Flask(main_app.import_name, root_path=main_app.root_path)
+    isolated.request_class = main_app.request_class
+    isolated.config.update(main_app.config)
+    isolated.config.update(
+        TESTING=True,
+        SECRET_KEY='isolated-test-key',
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_ENGINE_OPTIONS={},
+    )
+
+    for rule in main_app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        isolated.add_url_rule(rule.rule, rule.endpoint,
+                              main_app.view_functions[rule.endpoint],
+                              methods=rule.methods)
+
+    db.init_app(isolated)
+    with isolated.app_context():
+        db.create_all()
+
+    # In-process caches may hold values computed from another database
+    report_cache.invalidate()
+    quiz_summary_cache.invalidate()
+    quiz_cache.clear()
+    autosave_buffer.clear()
+    clear_analysis_cache()
+    return isolated
+
+
+def drop_isolated_app(isolated):
+    """Dispose of the engine and remove the SQLite file, if any"""
+    with isolated.app_context():
+        url = db.engine.url
+        db.session.remove()
+        db.engine.dispose()
+    if url.database and url.database != ':memory:' and os.path.exists(url.database):
+        os.remove(url.database)
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed on the current app's engine"""
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+
+
+def query_plan(statement):
+    """Return SQLite's EXPLAIN QUERY PLAN detail lines for a statement"""
+    compiled = statement.compile(dialect=db.engine.dialect,
+                                 compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return [row[-1] for row in rows]
+
+
+def full_table_scans(statement):
+    """Plan steps that read a whole table instead of searching an index"""
+    return [detail for detail in query_plan(statement)
+            if detail.startswith('SCAN ') and ' USING ' not in detail]
+
+
+def login_as(client, user):
+    """Put a user into the test client's session the same way login() does"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['username'] = user.username
+        sess['role'] = user.role
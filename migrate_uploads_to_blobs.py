@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Move existing uploads into the content-addressed blob store.
+
+Files saved before the blob store existed live directly in the upload
+folder as uploads/<name>, one copy per material or submission even when
+the bytes are the same. This hashes each of them, keeps one copy per
+distinct content under blobs/, points the rows at it by sha256 and removes
+the old files. It is safe to run again after an interruption.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from blob_store import fold_legacy_uploads
+from file_uploads import format_size
+
+def print_report(report):
+    print(f"{report['files']} file(s), {report['duplicates']} duplicate(s), "
+          f"{report['missing']} missing")
+    print(f"Disk used: {format_size(report['bytes_before'])} before, "
+          f"{format_size(report['bytes_after'])} after")
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        if len(sys.argv) > 1 and sys.argv[1] == '--show-only':
+            print_report(fold_legacy_uploads(dry_run=True))
+        else:
+            try:
+                report = fold_legacy_uploads()
+                print("✅ Moved uploads into the blob store")
+                print_report(report)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error moving uploads: {e}")
+                sys.exit(1)
@@ -35,21 +35,19 @@ class User(db.Model):
         return [enrollment.course for enrollment in self.enrollments]
     
     def get_course_progress(self, course_id):
-        """Calculate progress based on completed materials"""
-        # Get total materials for the course
-        total_materials = CourseMaterial.query.filter_by(course_id=course_id).count()
-        if total_materials == 0:
-            return 0
-        
-        # Get completed materials
-        completed_materials = StudyProgress.query.filter_by(
+        """Progress based on completed materials, as kept on the enrollment"""
+        progress = db.session.query(Enrollment.progress).filter_by(
             user_id=self.id,
-            course_id=course_id,
-            completion_status='completed'
-        ).count()
-        
-        return (completed_materials / total_materials) * 100
-    
+            course_id=course_id
+        ).scalar()
+        return progress or 0
+
+    def get_progress_by_course(self):
+        """Progress percentage for every enrolled course, keyed by course id"""
+        return dict(db.session.query(
+            Enrollment.course_id, Enrollment.progress
+        ).filter(Enrollment.user_id == self.id).all())
+
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -64,11 +62,16 @@ class Quiz(db.Model):
     passing_score = db.Column(db.Integer, default=70)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by quiz_cache.bump_quiz_version
+    questions_per_attempt = db.Column(db.Integer)  # Draw this many from the pool; None means every question
+    shuffle_options = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     # Relationships
     questions = db.relationship('QuizQuestion', backref='quiz', lazy=True, cascade='all, delete-orphan')
     attempts = db.relationship('QuizAttempt', backref='quiz', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (db.Index('ix_quiz_course', 'course_id'),)
+    
     def __repr__(self):
         return f'<Quiz {self.title}>'
 
@@ -86,6 +89,8 @@ class QuizQuestion(db.Model):
     points = db.Column(db.Integer, default=1)
     order_num = db.Column(db.Integer, default=0)
     
+    __table_args__ = (db.Index('ix_quiz_question_quiz_order', 'quiz_id', 'order_num'),)
+    
     def __repr__(self):
         return f'<QuizQuestion {self.id}>'
 
@@ -100,12 +105,24 @@ class QuizAttempt(db.Model):
     percentage = db.Column(db.Float, default=0.0)
     passed = db.Column(db.Boolean, default=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deadline = db.Column(db.DateTime)  # UTC, like started_at; open attempts past it are auto-submitted
+    question_ids = db.Column(db.JSON(none_as_null=True))  # Questions drawn for this attempt, in display order; None means all
+    shuffle_seed = db.Column(db.Integer)  # Seeds the option permutations; None means options are not shuffled
     completed_at = db.Column(db.DateTime)
     
     # Relationships
     user = db.relationship('User', backref='quiz_attempts', lazy=True)
     answers = db.relationship('QuizAnswer', backref='attempt', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_quiz_attempt_quiz_user', 'quiz_id', 'user_id'),
+        db.Index('ix_quiz_attempt_open_deadline', 'completed_at', 'deadline'),
+        # At most one open attempt per student and quiz
+        db.Index('uq_quiz_attempt_open', 'quiz_id', 'user_id', unique=True,
+                 sqlite_where=db.text('completed_at IS NULL'),
+                 postgresql_where=db.text('completed_at IS NULL')),
+    )
+    
     def __repr__(self):
         return f'<QuizAttempt {self.id}>'
 
@@ -122,6 +139,8 @@ class QuizAnswer(db.Model):
     # Relationships
     question = db.relationship('QuizQuestion', backref='answers', lazy=True)
     
+    __table_args__ = (db.Index('ix_quiz_answer_attempt_question', 'attempt_id', 'question_id'),)
+    
     def __repr__(self):
         return f'<QuizAnswer {self.id}>'
 
@@ -136,6 +155,7 @@ class Course(db.Model):
     duration_weeks = db.Column(db.Integer, nullable=False)
     difficulty = db.Column(db.String(20), nullable=False)  # Beginner, Intermediate, Advanced
     max_students = db.Column(db.Integer, default=30)
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by enrollments.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -147,7 +167,7 @@ class Course(db.Model):
     quizzes = db.relationship('Quiz', backref='course', lazy=True, cascade='all, delete-orphan')
     
     def get_enrolled_count(self):
-        return len(self.enrollments)
+        return self.enrolled_count or 0
     
     def is_full(self):
         return self.get_enrolled_count() >= self.max_students
@@ -169,9 +189,14 @@ class Enrollment(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
     progress = db.Column(db.Float, default=0.0)  # Percentage (0-100)
+    completed_materials = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by enrollments.py
+    total_materials = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Maintained by enrollments.py
     status = db.Column(db.String(20), default='active')  # active, completed, dropped
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'course_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_id'),
+        db.Index('ix_enrollment_course', 'course_id'),
+    )
     
     def __repr__(self):
         return f'<Enrollment User:{self.user_id} Course:{self.course_id}>'
@@ -187,6 +212,12 @@ class Grade(db.Model):
     max_score = db.Column(db.Float, default=100.0)
     feedback = db.Column(db.Text)
     graded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    quiz_attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id', ondelete='SET NULL'))  # Set for quiz grades
+    
+    __table_args__ = (
+        db.Index('ix_grade_user_course', 'user_id', 'course_id'),
+        db.Index('ix_grade_quiz_attempt', 'quiz_attempt_id'),
+    )
     
     def get_letter_grade(self):
         if self.score is None:
@@ -214,13 +245,30 @@ class CourseMaterial(db.Model):
     description = db.Column(db.Text)
     file_path = db.Column(db.String(500))
     file_type = db.Column(db.String(50))  # pdf, video, document, etc.
+    file_size = db.Column(db.BigInteger)  # Bytes; counts towards the course's upload quota
+    sha256 = db.Column(db.String(64))  # Content hash; the bytes live in the blob store under it
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     order_index = db.Column(db.Integer, default=0)  # For organizing materials in sequence
     
+    __table_args__ = (db.Index('ix_course_material_course_order', 'course_id', 'order_index'),
+                      db.Index('ix_course_material_sha256', 'sha256'))
+    
     def __repr__(self):
         return f'<CourseMaterial {self.title}>'
 
+class Blob(db.Model):
+    """One stored file content, shared by every upload with the same bytes"""
+    __tablename__ = 'blob'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Materials and submissions using it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs:{self.ref_count}>'
+
 class Announcement(db.Model):
     __tablename__ = 'announcement'
     
@@ -231,6 +279,8 @@ class Announcement(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (db.Index('ix_announcement_course_created', 'course_id', 'created_at'),)
+    
     def __repr__(self):
         return f'<Announcement {self.title}>'
 
@@ -248,10 +298,13 @@ class Assignment(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    max_file_bytes = db.Column(db.BigInteger)  # Largest submission file; None uses ASSIGNMENT_MAX_BYTES
     
     # Relationships
     submissions = db.relationship('AssignmentSubmission', backref='assignment', lazy=True)
     
+    __table_args__ = (db.Index('ix_assignment_course_active_due', 'course_id', 'is_active', 'due_date'),)
+    
     def __repr__(self):
         return f'<Assignment {self.title}>'
 
@@ -263,6 +316,8 @@ class AssignmentSubmission(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     submission_text = db.Column(db.Text)
     file_path = db.Column(db.String(500))  # For file uploads
+    file_size = db.Column(db.BigInteger)  # Bytes
+    sha256 = db.Column(db.String(64))  # Content hash; the bytes live in the blob store under it
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     score = db.Column(db.Float)  # Graded score
     feedback = db.Column(db.Text)  # Teacher feedback
@@ -270,6 +325,9 @@ class AssignmentSubmission(db.Model):
     graded_at = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='submitted')  # submitted, graded, late
     
+    __table_args__ = (db.Index('ix_assignment_submission_assignment_user', 'assignment_id', 'user_id'),
+                      db.Index('ix_assignment_submission_sha256', 'sha256'))
+    
     def is_late(self):
         if self.assignment and self.assignment.due_date:
             return self.submitted_at > self.assignment.due_date
@@ -290,7 +348,11 @@ class StudyProgress(db.Model):
     last_accessed = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text)  # Student's personal notes
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'material_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'material_id'),
+        db.Index('ix_study_progress_user_course_status', 'user_id', 'course_id', 'completion_status'),
+        db.Index('ix_study_progress_material', 'material_id'),
+    )
     
     def __repr__(self):
         return f'<StudyProgress User:{self.user_id} Material:{self.material_id}>'
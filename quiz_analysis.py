@@ -0,0 +1,276 @@
+"""
+Quiz item analysis.
+
+For the results overview a teacher sees, per question, its difficulty (the
+share of attempts that got it right), its discrimination (the
+point-biserial correlation between getting it right and the attempt's
+score as a share of its maximum) and how often each option was picked.
+All of these follow from a handful of running sums, so they are computed
+with GROUP BY aggregates over QuizAnswer rather than by loading answers
+into Python.
+
+Each question is measured over the attempts it was shown to: every
+attempt of a quiz without a pool, and for a pooled quiz only the attempts
+that drew it. Attempts that saw every question are summed once for all
+questions; only the drawn ids of pooled attempts are read to add each one
+to the questions it saw.
+
+The sums are cached per quiz and version stamp together with the set of
+attempt ids already counted. On each view one cheap query checks whether
+the quiz's completed attempts changed; new attempts are folded into the
+sums incrementally, and anything else (a re-grade bumps the version,
+deleted attempts change the fingerprint) triggers a full recount.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+from database import db
+from models import QuizAttempt, QuizAnswer
+from quiz_cache import quiz_cache, quiz_stamp
+from quiz_grading import VALID_ANSWERS
+
+# Quizzes whose statistics are kept in memory per process
+ANALYSIS_CACHE_SIZE = 128
+
+# Attempt ids per IN list when folding new attempts in
+ANALYSIS_CHUNK_SIZE = 500
+
+# Percentage ranges shown in the score distribution, highest first
+SCORE_BANDS = (('A', 90), ('B', 80), ('C', 70), ('D', 60), ('F', 0))
+
+
+class ItemStats:
+    """Running sums for one quiz version, enough to derive every statistic"""
+
+    def __init__(self, stamp):
+        self.stamp = stamp
+        self.counted = set()        # attempt ids folded in so far
+        self.fingerprint = (0, 0)   # (count, sum of ids) of counted attempts
+        self.attempts = 0
+        self.passed = 0
+        self.percentage_sum = 0.0
+        self.highest = None
+        self.lowest = None
+        self.bands = {band: 0 for band, _ in SCORE_BANDS}
+        # Attempts shown every question: count, sum and sum of squares of score / max_score
+        self.everyone = {'seen': 0, 'fraction_sum': 0.0, 'fraction_sq_sum': 0.0}
+        # question_id -> the same sums over pooled attempts that drew it, plus
+        # 'correct', 'correct_fraction_sum' and 'choices': {letter: count} over all attempts
+        self.questions = {}
+
+    def copy(self):
+        clone = ItemStats(self.stamp)
+        clone.__dict__.update(self.__dict__)
+        clone.counted = set(self.counted)
+        clone.bands = dict(self.bands)
+        clone.everyone = dict(self.everyone)
+        clone.questions = {qid: dict(q, choices=dict(q['choices']))
+                           for qid, q in self.questions.items()}
+        return clone
+
+
+_cache = OrderedDict()  # quiz_id -> ItemStats
+_cache_lock = threading.Lock()
+
+
+def clear_analysis_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def quiz_item_analysis(quiz):
+    """Summary, score distribution and per-question statistics for a quiz.
+
+    Returns a dict with ``summary`` (attempts, passed, average, highest,
+    lowest), ``bands`` (attempt count per letter band) and ``items``, one
+    dict per question in quiz order.
+    """
+    stats = refresh_item_stats(quiz)
+    return _report(quiz, stats)
+
+
+def refresh_item_stats(quiz):
+    """Cached running sums for the quiz, brought up to date"""
+    stamp = quiz_stamp(quiz)
+    with _cache_lock:
+        cached = _cache.get(quiz.id)
+        if cached is not None:
+            _cache.move_to_end(quiz.id)
+
+    completed = db.and_(QuizAttempt.quiz_id == quiz.id, QuizAttempt.completed_at.isnot(None))
+    fingerprint = tuple(db.session.execute(
+        db.select(db.func.count(QuizAttempt.id), db.func.coalesce(db.func.sum(QuizAttempt.id), 0))
+        .where(completed)
+    ).one())
+    if cached is not None and cached.stamp == stamp and cached.fingerprint == fingerprint:
+        return cached
+
+    attempt_ids = set(db.session.scalars(db.select(QuizAttempt.id).where(completed)))
+    if cached is not None and cached.stamp == stamp and cached.counted <= attempt_ids:
+        # Only new attempts since the last refresh need counting
+        stats = cached.copy()
+        new_ids = sorted(attempt_ids - cached.counted)
+        for start in range(0, len(new_ids), ANALYSIS_CHUNK_SIZE):
+            _fold(stats, QuizAttempt.id.in_(new_ids[start:start + ANALYSIS_CHUNK_SIZE]))
+    else:
+        stats = ItemStats(stamp)
+        _fold(stats, completed)
+    stats.counted = attempt_ids
+    stats.fingerprint = (len(attempt_ids), sum(attempt_ids))
+
+    with _cache_lock:
+        _cache[quiz.id] = stats
+        _cache.move_to_end(quiz.id)
+        while len(_cache) > ANALYSIS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return stats
+
+
+def _no_answers():
+    return {
+        'seen': 0, 'fraction_sum': 0.0, 'fraction_sq_sum': 0.0,
+        'correct': 0, 'correct_fraction_sum': 0.0,
+        'choices': {letter: 0 for letter in VALID_ANSWERS},
+    }
+
+
+def _question(stats, question_id):
+    if question_id not in stats.questions:
+        stats.questions[question_id] = _no_answers()
+    return stats.questions[question_id]
+
+
+def _fold(stats, criteria):
+    # Add the attempts matching ``criteria`` to the running sums: one
+    # aggregate over the attempts, one GROUP BY over their answers and,
+    # for pooled attempts only, their drawn question ids
+    band = db.case(*[(QuizAttempt.percentage >= floor, name) for name, floor in SCORE_BANDS[:-1]],
+                   else_=SCORE_BANDS[-1][0])
+    # Pooled attempts are marked out of different maximums, so scores are compared as shares
+    fraction = db.case((QuizAttempt.max_score > 0, QuizAttempt.score / QuizAttempt.max_score),
+                       else_=0.0)
+    unpooled = QuizAttempt.question_ids.is_(None)
+    totals = db.session.execute(
+        db.select(
+            db.func.count(QuizAttempt.id).label('attempts'),
+            db.func.count(db.case((QuizAttempt.passed, 1))).label('passed'),
+            db.func.coalesce(db.func.sum(QuizAttempt.percentage), 0).label('percentage_sum'),
+            db.func.count(db.case((unpooled, 1))).label('unpooled'),
+            db.func.coalesce(db.func.sum(db.case((unpooled, fraction))), 0).label('fraction_sum'),
+            db.func.coalesce(db.func.sum(db.case((unpooled, fraction * fraction))), 0)
+            .label('fraction_sq_sum'),
+            db.func.max(QuizAttempt.percentage).label('highest'),
+            db.func.min(QuizAttempt.percentage).label('lowest'),
+            *[db.func.count(db.case((band == name, 1))).label(f'band_{name}')
+              for name, _ in SCORE_BANDS]
+        ).where(criteria)
+    ).one()
+    if not totals.attempts:
+        return
+
+    stats.attempts += totals.attempts
+    stats.passed += totals.passed
+    stats.percentage_sum += totals.percentage_sum
+    stats.everyone['seen'] += totals.unpooled
+    stats.everyone['fraction_sum'] += totals.fraction_sum
+    stats.everyone['fraction_sq_sum'] += totals.fraction_sq_sum
+    stats.highest = totals.highest if stats.highest is None else max(stats.highest, totals.highest)
+    stats.lowest = totals.lowest if stats.lowest is None else min(stats.lowest, totals.lowest)
+    for name, _ in SCORE_BANDS:
+        stats.bands[name] += getattr(totals, f'band_{name}')
+
+    rows = db.session.execute(
+        db.select(
+            QuizAnswer.question_id,
+            db.func.count(db.case((QuizAnswer.is_correct, 1))).label('correct'),
+            db.func.coalesce(db.func.sum(db.case((QuizAnswer.is_correct, fraction),
+                                                 else_=0)), 0).label('correct_fraction_sum'),
+            *[db.func.count(db.case((QuizAnswer.selected_answer == letter, 1))).label(f'choice_{letter}')
+              for letter in VALID_ANSWERS]
+        )
+        .join(QuizAttempt, QuizAttempt.id == QuizAnswer.attempt_id)
+        .where(criteria)
+        .group_by(QuizAnswer.question_id)
+    ).all()
+    for row in rows:
+        question = _question(stats, row.question_id)
+        question['correct'] += row.correct
+        question['correct_fraction_sum'] += row.correct_fraction_sum
+        for letter in VALID_ANSWERS:
+            question['choices'][letter] += getattr(row, f'choice_{letter}')
+
+    if totals.unpooled == totals.attempts:
+        return
+    drawn = db.session.execute(
+        db.select(QuizAttempt.question_ids, fraction.label('fraction'))
+        .where(criteria, QuizAttempt.question_ids.isnot(None))
+    )
+    for question_ids, share in drawn:
+        for question_id in question_ids:
+            question = _question(stats, question_id)
+            question['seen'] += 1
+            question['fraction_sum'] += share
+            question['fraction_sq_sum'] += share * share
+
+
+def point_biserial(n, correct, score_sum, score_sq_sum, correct_score_sum):
+    """Point-biserial correlation between an item and the attempts' scores.
+
+    (M1 - M0) / s * sqrt(p * q), where M1 and M0 are the mean totals of
+    attempts that got the item right and wrong, s is the population
+    standard deviation of the totals and p the share that got it right.
+    None when it is undefined (everyone right, everyone wrong or no spread).
+    """
+    if not n or correct in (0, n):
+        return None
+    variance = score_sq_sum / n - (score_sum / n) ** 2
+    if variance <= 1e-12:
+        return None
+    p = correct / n
+    mean_right = correct_score_sum / correct
+    mean_wrong = (score_sum - correct_score_sum) / (n - correct)
+    return (mean_right - mean_wrong) / math.sqrt(variance) * math.sqrt(p * (1 - p))
+
+
+def _report(quiz, stats):
+    n = stats.attempts
+    summary = {
+        'attempts': n,
+        'passed': stats.passed,
+        'average': round(stats.percentage_sum / n, 1) if n else 0,
+        'highest': round(stats.highest, 1) if n else 0,
+        'lowest': round(stats.lowest, 1) if n else 0,
+    }
+
+    snapshot = quiz_cache.get(quiz)
+    items = []
+    for question in snapshot.questions:
+        counts = stats.questions.get(question.id) or _no_answers()
+        # Only the attempts this question was shown to count towards it
+        seen = stats.everyone['seen'] + counts['seen']
+        correct = counts['correct']
+        choices = counts['choices']
+        correct_answer = snapshot.answer_key.questions[question.id][0]
+        answered = sum(choices.values())
+        items.append({
+            'question': question,
+            'correct_answer': correct_answer,
+            'seen': seen,
+            'difficulty': correct / seen if seen else None,
+            'discrimination': point_biserial(
+                seen, correct,
+                stats.everyone['fraction_sum'] + counts['fraction_sum'],
+                stats.everyone['fraction_sq_sum'] + counts['fraction_sq_sum'],
+                counts['correct_fraction_sum']),
+            'choices': [{
+                'letter': letter,
+                'text': getattr(question, f'option_{letter.lower()}'),
+                'count': choices[letter],
+                'share': choices[letter] / seen if seen else 0.0,
+                'is_correct': letter == correct_answer,
+            } for letter in VALID_ANSWERS],
+            'unanswered': seen - answered,
+        })
+    return {'summary': summary, 'bands': dict(stats.bands), 'items': items}
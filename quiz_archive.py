@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Quiz archives: streaming export and import of quizzes with their attempts.
+
+An archive is a sequence of records, one per row of Quiz, QuizQuestion,
+QuizAttempt or QuizAnswer, written as JSON Lines or as CSV with a
+``type`` column. Each quiz is followed by its questions, then its
+attempts, then their answers, so an importer only ever needs to look back
+at ids it has already written.
+
+Export reads each table in keyset-paginated chunks of plain rows, never
+ORM objects, and yields records as it goes. Import buffers up to
+ARCHIVE_CHUNK_SIZE records of one type and writes them with a single
+executemany INSERT, remapping archive ids to the new ids.
+Memory is bounded by the chunk size plus the id maps for quizzes,
+questions and attempts; answers, usually the bulk of an archive, are
+never held beyond one chunk.
+
+Attempts refer to students by username so an archive can move between
+instances; attempts by students who do not exist here are skipped along
+with their answers. So are attempts that were still open when the archive
+was written: on the new quiz they would either be closed at once by the
+deadline sweeper, with whatever they held, or stand in the way of the
+student's own attempt. Only finished work is carried over.
+
+Usage:
+    python quiz_archive.py export COURSE_ID archive.jsonl
+    python quiz_archive.py import COURSE_ID archive.csv
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from database import db
+from models import User, Quiz, QuizQuestion, QuizAttempt, QuizAnswer
+from quiz_cache import quiz_cache
+from quiz_grading import insert_quiz_grades
+
+# Rows per SELECT page on export and per INSERT on import
+ARCHIVE_CHUNK_SIZE = 1000
+
+ARCHIVE_FORMATS = ('jsonl', 'csv')
+
+QUIZ_FIELDS = ('id', 'title', 'description', 'time_limit_minutes', 'passing_score',
+               'is_active', 'created_at', 'questions_per_attempt', 'shuffle_options')
+QUESTION_FIELDS = ('id', 'quiz_id', 'question_text', 'option_a', 'option_b', 'option_c',
+                   'option_d', 'correct_answer', 'points', 'order_num')
+ATTEMPT_FIELDS = ('id', 'quiz_id', 'username', 'score', 'max_score', 'percentage', 'passed',
+                  'started_at', 'deadline', 'completed_at', 'question_ids', 'shuffle_seed')
+ANSWER_FIELDS = ('id', 'attempt_id', 'question_id', 'selected_answer', 'is_correct',
+                 'points_earned')
+
+RECORD_FIELDS = {'quiz': QUIZ_FIELDS, 'question': QUESTION_FIELDS,
+                 'attempt': ATTEMPT_FIELDS, 'answer': ANSWER_FIELDS}
+
+# Every field in CSV column order, after ``type``
+CSV_COLUMNS = ('type',) + tuple(dict.fromkeys(
+    field for fields in RECORD_FIELDS.values() for field in fields))
+
+_INT_FIELDS = {'id', 'quiz_id', 'attempt_id', 'question_id', 'time_limit_minutes',
+               'passing_score', 'questions_per_attempt', 'points', 'order_num', 'shuffle_seed'}
+_FLOAT_FIELDS = {'score', 'max_score', 'percentage', 'points_earned'}
+_BOOL_FIELDS = {'is_active', 'shuffle_options', 'passed', 'is_correct'}
+_DATETIME_FIELDS = {'created_at', 'started_at', 'deadline', 'completed_at'}
+_JSON_FIELDS = {'question_ids'}
+
+
+class ArchiveFormatError(ValueError):
+    """Raised when an archive cannot be imported; ``line`` is where it went wrong"""
+
+    def __init__(self, line, message):
+        self.line = line
+        super().__init__(f'Line {line}: {message}')
+
+
+def export_records(quiz_ids, chunk_size=None):
+    """Yield the archive records for the given quizzes, in archive order"""
+    chunk_size = chunk_size or ARCHIVE_CHUNK_SIZE
+    for quiz_id in sorted(quiz_ids):
+        quiz = db.session.execute(
+            db.select(*_columns(Quiz, QUIZ_FIELDS)).where(Quiz.id == quiz_id)
+        ).one_or_none()
+        if quiz is None:
+            continue
+        yield _record('quiz', quiz)
+
+        yield from (_record('question', row) for row in _pages(
+            db.select(*_columns(QuizQuestion, QUESTION_FIELDS))
+            .where(QuizQuestion.quiz_id == quiz_id),
+            QuizQuestion.id, chunk_size))
+
+        attempt_columns = [User.username if field == 'username' else getattr(QuizAttempt, field)
+                           for field in ATTEMPT_FIELDS]
+        yield from (_record('attempt', row) for row in _pages(
+            db.select(*attempt_columns)
+            .join(User, User.id == QuizAttempt.user_id)
+            .where(QuizAttempt.quiz_id == quiz_id),
+            QuizAttempt.id, chunk_size))
+
+        yield from (_record('answer', row) for row in _pages(
+            db.select(*_columns(QuizAnswer, ANSWER_FIELDS))
+            .join(QuizAttempt, QuizAttempt.id == QuizAnswer.attempt_id)
+            .where(QuizAttempt.quiz_id == quiz_id),
+            QuizAnswer.id, chunk_size))
+
+
+def _columns(model, fields):
+    return [getattr(model, field) for field in fields]
+
+
+def _pages(stmt, key, chunk_size):
+    # Keyset pagination: each page starts after the last id of the one
+    # before, so no page costs more than the first and rows are not kept
+    last = None
+    while True:
+        page = stmt if last is None else stmt.where(key > last)
+        rows = db.session.execute(page.order_by(key).limit(chunk_size)).all()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1].id
+
+
+def _record(kind, row):
+    return {'type': kind, **row._asdict()}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def jsonl_lines(records):
+    """Serialise records as JSON Lines, one string per record"""
+    for record in records:
+        yield json.dumps(record, default=_encode) + '\n'
+
+
+def csv_lines(records):
+    """Serialise records as CSV with a header row, one string per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for record in records:
+        writer.writerow([_csv_value(record.get(column)) for column in CSV_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return json.dumps(value)
+    return value
+
+
+def archive_lines(records, archive_format):
+    """Serialise records in ``archive_format`` ('jsonl' or 'csv')"""
+    if archive_format == 'csv':
+        return csv_lines(records)
+    return jsonl_lines(records)
+
+
+def read_records(source, archive_format):
+    """Yield (line number, record) from an archive.
+
+    ``source`` is a text stream or a binary upload stream. Values are
+    converted back to Python types.
+    """
+    if not isinstance(source, io.TextIOBase):
+        source = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+    line_number = 0
+    try:
+        if archive_format == 'csv':
+            reader = csv.DictReader(source)
+            for record in reader:
+                line_number = reader.line_num
+                yield line_number, _decode(line_number, record)
+        else:
+            for line_number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise ArchiveFormatError(line_number, 'not a JSON object') from None
+                if not isinstance(record, dict):
+                    raise ArchiveFormatError(line_number, 'not a JSON object')
+                yield line_number, _decode(line_number, record)
+    except UnicodeDecodeError:
+        raise ArchiveFormatError(line_number + 1, 'archive is not UTF-8 text') from None
+
+
+def _decode(line_number, record):
+    kind = record.get('type')
+    fields = RECORD_FIELDS.get(kind)
+    if fields is None:
+        raise ArchiveFormatError(line_number, f'unknown record type {kind!r}')
+    decoded = {'type': kind}
+    for field in fields:
+        value = record.get(field)
+        try:
+            decoded[field] = _convert(field, value)
+        except (TypeError, ValueError):
+            raise ArchiveFormatError(line_number, f'bad value for {field}: {value!r}') from None
+    if decoded['id'] is None:
+        raise ArchiveFormatError(line_number, f'{kind} record has no id')
+    return decoded
+
+
+def _convert(field, value):
+    if not isinstance(value, str):
+        return value
+    if field in _JSON_FIELDS:
+        return json.loads(value) if value else None
+    if field in _DATETIME_FIELDS:
+        return datetime.fromisoformat(value) if value else None
+    if field in _INT_FIELDS:
+        return int(value) if value else None
+    if field in _FLOAT_FIELDS:
+        return float(value) if value else None
+    if field in _BOOL_FIELDS:
+        return value.lower() in ('1', 'true') if value else None
+    return value
+
+
+def import_archive(records, course_id, chunk_size=None):
+    """Import (line number, record) pairs into a course.
+
+    Does not commit; if ArchiveFormatError is raised the caller should roll
+    back. Returns a dict of counts: quizzes, questions, attempts, answers,
+    the skipped_attempts / skipped_answers of unknown students or of
+    attempts still open (open_attempts of those skipped attempts).
+    """
+    importer = _ArchiveImporter(course_id, chunk_size or ARCHIVE_CHUNK_SIZE)
+    for line_number, record in records:
+        importer.add(line_number, record)
+    importer.flush()
+    return importer.counts
+
+
+class _ArchiveImporter:
+    # Records are buffered per type and written when the type changes or a
+    # chunk fills up; archive order guarantees every id a record refers to
+    # has been written (and remapped) before the record is buffered
+
+    def __init__(self, course_id, chunk_size):
+        self.course_id = course_id
+        self.chunk_size = chunk_size
+        self.quiz_ids = {}
+        self.question_ids = {}
+        self.attempt_ids = {}
+        self.skipped_attempt_ids = set()
+        self.kind = None
+        self.pending = []
+        self.counts = {'quizzes': 0, 'questions': 0, 'attempts': 0, 'answers': 0,
+                       'skipped_attempts': 0, 'skipped_answers': 0, 'open_attempts': 0}
+
+    def add(self, line_number, record):
+        kind = record.pop('type')
+        if kind != self.kind or len(self.pending) >= self.chunk_size:
+            self.flush()
+            self.kind = kind
+        getattr(self, f'_check_{kind}')(line_number, record)
+        self.pending.append(record)
+
+    def _check_quiz(self, line_number, record):
+        if not record['title']:
+            raise ArchiveFormatError(line_number, 'quiz has no title')
+
+    def _check_question(self, line_number, record):
+        self._require(line_number, self.quiz_ids, record['quiz_id'], 'quiz')
+        if record['correct_answer'] not in ('A', 'B', 'C', 'D'):
+            raise ArchiveFormatError(line_number, f'bad correct_answer {record["correct_answer"]!r}')
+
+    def _check_attempt(self, line_number, record):
+        self._require(line_number, self.quiz_ids, record['quiz_id'], 'quiz')
+        if not record['username']:
+            raise ArchiveFormatError(line_number, 'attempt has no username')
+
+    def _check_answer(self, line_number, record):
+        if record['attempt_id'] not in self.skipped_attempt_ids:
+            self._require(line_number, self.attempt_ids, record['attempt_id'], 'attempt')
+        self._require(line_number, self.question_ids, record['question_id'], 'question')
+
+    @staticmethod
+    def _require(line_number, id_map, old_id, kind):
+        if old_id not in id_map:
+            raise ArchiveFormatError(line_number, f'{kind} {old_id} does not appear earlier in the archive')
+
+    def flush(self):
+        if self.pending:
+            getattr(self, f'_write_{self.kind}')(self.pending)
+        self.pending = []
+
+    def _insert(self, model, records, rows):
+        # Write one chunk and map its archive ids to the new ids, in row order
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # SQLite cannot batch RETURNING in parameter order, but it gives
+            # each new row the id after the largest and lets one transaction
+            # write at a time, so the chunk holds the highest ids in order
+            db.session.execute(db.insert(model), rows)
+            new_ids = db.session.scalars(
+                db.select(model.id).order_by(model.id.desc()).limit(len(rows))
+            ).all()[::-1]
+        else:
+            new_ids = db.session.scalars(
+                db.insert(model).returning(model.id, sort_by_parameter_order=True), rows
+            ).all()
+        return dict(zip((record['id'] for record in records), new_ids))
+
+    def _write_quiz(self, records):
+        rows = [{**{field: record[field] for field in QUIZ_FIELDS if field != 'id'},
+                 'course_id': self.course_id} for record in records]
+        for row in rows:
+            row['shuffle_options'] = bool(row['shuffle_options'])
+            row['created_at'] = row['created_at'] or datetime.utcnow()
+        new_ids = self._insert(Quiz, records, rows)
+        for quiz_id in new_ids.values():
+            # The id may have belonged to a deleted quiz this process cached
+            quiz_cache.evict(quiz_id)
+        self.quiz_ids.update(new_ids)
+        self.counts['quizzes'] += len(rows)
+
+    def _write_question(self, records):
+        rows = [{**{field: record[field] for field in QUESTION_FIELDS if field != 'id'},
+                 'quiz_id': self.quiz_ids[record['quiz_id']]} for record in records]
+        self.question_ids.update(self._insert(QuizQuestion, records, rows))
+        self.counts['questions'] += len(rows)
+
+    def _write_attempt(self, records):
+        users = dict(db.session.execute(
+            db.select(User.username, User.id)
+            .where(User.username.in_({record['username'] for record in records}))
+        ).all())
+        kept, rows = [], []
+        for record in records:
+            user_id = users.get(record['username'])
+            if user_id is None or record['completed_at'] is None:
+                self.skipped_attempt_ids.add(record['id'])
+                self.counts['open_attempts'] += user_id is not None
+                continue
+            row = {field: record[field] for field in ATTEMPT_FIELDS
+                   if field not in ('id', 'username')}
+            row['quiz_id'] = self.quiz_ids[record['quiz_id']]
+            row['user_id'] = user_id
+            if row['question_ids'] is not None:
+                row['question_ids'] = [self.question_ids[qid] for qid in row['question_ids']
+                                       if qid in self.question_ids]
+            kept.append(record)
+            rows.append(row)
+        self.counts['skipped_attempts'] += len(records) - len(rows)
+        if not rows:
+            return
+        new_ids = self._insert(QuizAttempt, kept, rows)
+        self.attempt_ids.update(new_ids)
+        # Completed attempts get their gradebook entry, as when submitted
+        insert_quiz_grades(QuizAttempt.id.in_(list(new_ids.values())))
+        self.counts['attempts'] += len(rows)
+
+    def _write_answer(self, records):
+        rows = [{**{field: record[field] for field in ANSWER_FIELDS if field != 'id'},
+                 'attempt_id': self.attempt_ids[record['attempt_id']],
+                 'question_id': self.question_ids[record['question_id']]}
+                for record in records if record['attempt_id'] in self.attempt_ids]
+        self.counts['skipped_answers'] += len(records) - len(rows)
+        if rows:
+            db.session.execute(db.insert(QuizAnswer), rows)
+        self.counts['answers'] += len(rows)
+
+
+def archive_format_for(filename):
+    """'csv' for .csv files, otherwise 'jsonl'"""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from app import app
+    from models import Course
+
+    parser = argparse.ArgumentParser(description='Export or import a course\'s quizzes')
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('course_id', type=int)
+    parser.add_argument('path', help='archive file; .csv for CSV, anything else for JSON Lines')
+    args = parser.parse_args()
+    archive_format = archive_format_for(args.path)
+
+    with app.app_context():
+        if db.session.get(Course, args.course_id) is None:
+            parser.error(f'course {args.course_id} does not exist')
+        if args.action == 'export':
+            quiz_ids = db.session.scalars(
+                db.select(Quiz.id).where(Quiz.course_id == args.course_id)).all()
+            with open(args.path, 'w', encoding='utf-8', newline='') as out:
+                out.writelines(archive_lines(export_records(quiz_ids), archive_format))
+            print(f'Exported {len(quiz_ids)} quizzes to {args.path}')
+        else:
+            with open(args.path, encoding='utf-8-sig', newline='') as source:
+                counts = import_archive(read_records(source, archive_format), args.course_id)
+            db.session.commit()
+            print(', '.join(f'{count} {name.replace("_", " ")}' for name, count in counts.items()))
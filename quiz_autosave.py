@@ -0,0 +1,157 @@
+"""
+Quiz autosave.
+
+While a student works through a quiz the page posts each changed answer to
+the autosave endpoint. Rather than writing every click, the endpoint drops
+answers into AutosaveBuffer, an in-memory map of attempt -> question ->
+letter where later answers to the same question overwrite earlier ones. A
+background thread flushes the buffer every AUTOSAVE_FLUSH_SECONDS, writing
+the answers of many attempts at once with one DELETE and one executemany
+INSERT per batch.
+
+The buffer is per process and is lost if the process dies, so at worst a
+few seconds of clicks go unsaved; the final submission still carries the
+full form, and grading merges it with whatever was stored.
+"""
+
+import threading
+
+from background import run_periodically
+from database import db
+from models import QuizAttempt, QuizAnswer
+
+# How often buffered answers are written to the database
+AUTOSAVE_FLUSH_SECONDS = 3
+
+# Answers per DELETE/INSERT pair when flushing
+AUTOSAVE_BATCH_SIZE = 1000
+
+
+class AutosaveBuffer:
+    """Thread-safe, write-coalescing buffer of unsaved quiz answers"""
+
+    def __init__(self):
+        self._pending = {}  # attempt_id -> {question_id: letter}
+        self._lock = threading.Lock()
+
+    def save(self, attempt_id, answers):
+        """Queue answers for an attempt; replaces any queued answer to the same question"""
+        if not answers:
+            return
+        with self._lock:
+            self._pending.setdefault(attempt_id, {}).update(answers)
+
+    def pending(self, attempt_id):
+        """Answers queued for an attempt that have not been written yet"""
+        with self._lock:
+            return dict(self._pending.get(attempt_id, {}))
+
+    def take(self, attempt_id):
+        """Remove and return an attempt's queued answers, e.g. on final submit"""
+        with self._lock:
+            return self._pending.pop(attempt_id, {})
+
+    def restore(self, attempt_id, answers):
+        """Queue taken answers again, e.g. when the submit rolled back.
+
+        Answers queued since they were taken win over them.
+        """
+        if not answers:
+            return
+        with self._lock:
+            newer = self._pending.get(attempt_id, {})
+            self._pending[attempt_id] = {**answers, **newer}
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(answers) for answers in self._pending.values())
+
+    def flush(self, batch_size=AUTOSAVE_BATCH_SIZE):
+        """Write everything queued so far and commit. Returns the answers written.
+
+        Answers for attempts that have been submitted in the meantime are
+        dropped. The open attempts are locked until the commit, so a submit
+        waits for the flush and grades what it wrote, or wins and the flush
+        leaves its graded answers alone. If the write fails the answers are
+        queued again, unless newer answers for the same question arrived in
+        the meantime.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            open_ids = set(db.session.scalars(
+                db.select(QuizAttempt.id).where(QuizAttempt.id.in_(list(pending)),
+                                                QuizAttempt.completed_at.is_(None))
+                .with_for_update()
+            ))
+            rows = [{'attempt_id': attempt_id, 'question_id': question_id,
+                     'selected_answer': letter, 'is_correct': False, 'points_earned': 0.0}
+                    for attempt_id, answers in pending.items() if attempt_id in open_ids
+                    for question_id, letter in answers.items()]
+            for start in range(0, len(rows), batch_size):
+                store_answers(rows[start:start + batch_size], open_only=True)
+            db.session.commit()
+            return len(rows)
+        except Exception:
+            db.session.rollback()
+            for attempt_id, answers in pending.items():
+                self.restore(attempt_id, answers)
+            raise
+
+
+autosave_buffer = AutosaveBuffer()
+
+
+def store_answers(rows, open_only=False):
+    """Replace the stored answers for the (attempt, question) pairs in ``rows``.
+
+    Two statements however many rows there are. With ``open_only`` both
+    statements skip attempts that have been submitted, checked by the
+    statement itself; SQLite has no row locks to keep a submit out between
+    the caller's check and the write. Does not commit.
+    """
+    if not rows:
+        return
+    pairs = [(row['attempt_id'], row['question_id']) for row in rows]
+    delete = db.delete(QuizAnswer).where(
+        db.tuple_(QuizAnswer.attempt_id, QuizAnswer.question_id).in_(pairs))
+    insert = db.insert(QuizAnswer)
+    if open_only:
+        open_attempts = db.select(QuizAttempt.id).where(QuizAttempt.completed_at.is_(None))
+        delete = delete.where(QuizAnswer.attempt_id.in_(open_attempts))
+        attempt_id = db.bindparam('attempt_id', type_=db.Integer)
+        # A Core insert: the ORM bulk path cannot run INSERT ... SELECT per row
+        insert = db.insert(QuizAnswer.__table__).from_select(
+            ['attempt_id', 'question_id', 'selected_answer', 'is_correct', 'points_earned'],
+            db.select(attempt_id, db.bindparam('question_id', type_=db.Integer),
+                      db.bindparam('selected_answer', type_=db.String),
+                      db.bindparam('is_correct', type_=db.Boolean),
+                      db.bindparam('points_earned', type_=db.Float))
+            .where(db.exists().where(QuizAttempt.id == attempt_id,
+                                     QuizAttempt.completed_at.is_(None)))
+        )
+    db.session.execute(delete.execution_options(synchronize_session=False))
+    db.session.execute(insert, rows)
+
+
+def saved_answers(attempt_id):
+    """Everything saved for an attempt so far, stored or still buffered"""
+    stored = dict(db.session.execute(
+        db.select(QuizAnswer.question_id, QuizAnswer.selected_answer)
+        .where(QuizAnswer.attempt_id == attempt_id)
+    ).all())
+    stored.update(autosave_buffer.pending(attempt_id))
+    return stored
+
+
+def ensure_autosave_flusher(app, interval=AUTOSAVE_FLUSH_SECONDS):
+    """Start this process's flusher thread if it is not running yet"""
+    # Whatever is still buffered is written when the process shuts down cleanly
+    run_periodically(app, 'quiz-autosave', interval, autosave_buffer.flush, run_at_exit=True)
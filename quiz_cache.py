@@ -0,0 +1,129 @@
+"""
+Per-process cache of published quiz content.
+
+Questions rarely change once a quiz is published, yet every take_quiz GET
+and POST used to reload them. QuizCache keeps an immutable snapshot of each
+quiz's questions and answer key, keyed by quiz id plus a version stamp, in a
+small LRU. Anything that changes a quiz's questions calls
+bump_quiz_version(), so every process sees a new version stamp and reloads
+on its next lookup; stale snapshots are simply never matched again.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+from database import db
+from models import Quiz, QuizQuestion
+from quiz_grading import AnswerKey
+
+QUIZ_CACHE_SIZE = 256
+
+QuestionView = namedtuple('QuestionView', [
+    'id', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d',
+    'points', 'order_num',
+])
+
+# by_id maps question id to its QuestionView, for looking up drawn questions
+QuizSnapshot = namedtuple('QuizSnapshot', ['quiz_id', 'stamp', 'questions', 'by_id', 'answer_key'])
+
+
+class QuizCache:
+    """Thread-safe LRU of QuizSnapshot objects with hit/miss counters"""
+
+    def __init__(self, max_size=QUIZ_CACHE_SIZE):
+        self.max_size = max_size
+        self._snapshots = OrderedDict()  # quiz_id -> QuizSnapshot
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, quiz):
+        """Snapshot for the quiz's current version, loading it on a miss"""
+        stamp = quiz_stamp(quiz)
+        with self._lock:
+            snapshot = self._snapshots.get(quiz.id)
+            if snapshot is not None and snapshot.stamp == stamp:
+                self._snapshots.move_to_end(quiz.id)
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+
+        snapshot = load_snapshot(quiz.id, stamp)
+
+        with self._lock:
+            self._snapshots[quiz.id] = snapshot
+            self._snapshots.move_to_end(quiz.id)
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+                self.evictions += 1
+        return snapshot
+
+    def evict(self, quiz_id):
+        with self._lock:
+            self._snapshots.pop(quiz_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._snapshots),
+                'max_size': self.max_size,
+            }
+
+
+quiz_cache = QuizCache()
+
+
+def quiz_stamp(quiz):
+    # created_at tells a recreated quiz apart from a deleted one with the same id
+    return (quiz.version, quiz.created_at)
+
+
+def load_snapshot(quiz_id, stamp):
+    """Read a quiz's questions once and freeze them with their answer key"""
+    rows = db.session.execute(
+        db.select(QuizQuestion)
+        .where(QuizQuestion.quiz_id == quiz_id)
+        .order_by(QuizQuestion.order_num, QuizQuestion.id)
+    ).scalars().all()
+    questions = tuple(QuestionView(
+        id=q.id,
+        question_text=q.question_text,
+        option_a=q.option_a,
+        option_b=q.option_b,
+        option_c=q.option_c,
+        option_d=q.option_d,
+        points=q.points if q.points is not None else 1,
+        order_num=q.order_num,
+    ) for q in rows)
+    answer_key = AnswerKey(quiz_id, {q.id: (q.correct_answer, q.points if q.points is not None else 1)
+                                     for q in rows})
+    by_id = MappingProxyType({q.id: q for q in questions})
+    return QuizSnapshot(quiz_id, stamp, questions, by_id, answer_key)
+
+
+def bump_quiz_version(quiz):
+    """Move a quiz to a new version so every process reloads its questions.
+
+    Runs in the caller's transaction; the old snapshot is dropped from this
+    process right away and ignored by others once the new version commits.
+    """
+    db.session.execute(
+        db.update(Quiz)
+        .where(Quiz.id == quiz.id)
+        .values(version=Quiz.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(quiz, ['version'])
+    quiz_cache.evict(quiz.id)
@@ -0,0 +1,119 @@
+"""
+Server-side quiz deadlines.
+
+An attempt is created when the student opens a quiz, with a deadline taken
+from the quiz's time limit. The browser timer is only a convenience: once
+the deadline (plus DEADLINE_GRACE_SECONDS for a submit already in flight)
+has passed, autosaves are refused, a late submission is graded on the
+answers saved in time, and a background sweeper closes attempts nobody
+submitted.
+
+The sweeper works in batches. It claims up to SWEEP_BATCH_SIZE expired
+attempts with one conditional UPDATE, so several workers sweeping at once
+never grade the same attempt twice, and grades the whole batch with a
+fixed number of set-based statements. Autosaves are accepted until the
+grace period ends, and every worker flushes its buffer at least once per
+AUTOSAVE_FLUSH_SECONDS, so the sweeper waits that much longer again: an
+answer buffered in any worker just before autosaves close is stored
+before the sweeper gets to it.
+"""
+
+from datetime import datetime, timedelta
+
+from background import run_periodically
+from database import db
+from models import QuizAttempt
+from quiz_autosave import autosave_buffer, AUTOSAVE_FLUSH_SECONDS
+from quiz_grading import grade_stored_attempts
+from stats_cache import quiz_summary_cache, invalidate_on_commit
+
+# Allowance for a submission sent just before the deadline
+DEADLINE_GRACE_SECONDS = 30
+
+# How often each worker looks for expired attempts
+SWEEP_INTERVAL_SECONDS = 15
+
+# How long after its deadline an open attempt is swept: the grace period,
+# then one autosave flush for answers still buffered in other workers
+SWEEP_DELAY_SECONDS = DEADLINE_GRACE_SECONDS + AUTOSAVE_FLUSH_SECONDS
+
+# Attempts claimed and graded per transaction
+SWEEP_BATCH_SIZE = 500
+
+
+def seconds_remaining(attempt, now=None):
+    """Whole seconds left on an attempt, or None if it has no time limit"""
+    if attempt.deadline is None:
+        return None
+    now = now or datetime.utcnow()
+    return max(0, int((attempt.deadline - now).total_seconds()))
+
+
+def is_expired(attempt, now=None):
+    """True once an attempt is past its deadline and the grace period"""
+    if attempt.deadline is None:
+        return False
+    now = now or datetime.utcnow()
+    return now > attempt.deadline + timedelta(seconds=DEADLINE_GRACE_SECONDS)
+
+
+def sweep_expired_attempts(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Auto-submit every expired open attempt, one batch per transaction.
+
+    Returns the number of attempts closed by this call.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=SWEEP_DELAY_SECONDS)
+    # Store this worker's buffered answers before grading from the table
+    autosave_buffer.flush()
+
+    closed = 0
+    while True:
+        batch = close_expired_batch(cutoff, batch_size)
+        if batch is None:
+            return closed
+        closed += batch
+
+
+def close_expired_batch(cutoff, batch_size=SWEEP_BATCH_SIZE):
+    """Claim and grade one batch of attempts whose deadline is before ``cutoff``.
+
+    Commits. Returns how many attempts this worker closed, or None when no
+    expired attempts are left.
+    """
+    candidates = db.session.scalars(
+        db.select(QuizAttempt.id)
+        .where(QuizAttempt.completed_at.is_(None),
+               QuizAttempt.deadline < cutoff)
+        .order_by(QuizAttempt.deadline)
+        .limit(batch_size)
+    ).all()
+    if not candidates:
+        db.session.rollback()
+        return None
+
+    completed_at = datetime.utcnow()
+    claim = (
+        db.update(QuizAttempt)
+        .where(QuizAttempt.id.in_(candidates), QuizAttempt.completed_at.is_(None))
+        .values(completed_at=completed_at)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        claimed = db.session.scalars(claim.returning(QuizAttempt.id)).all()
+    else:
+        db.session.execute(claim)
+        claimed = db.session.scalars(
+            db.select(QuizAttempt.id).where(QuizAttempt.id.in_(candidates),
+                                            QuizAttempt.completed_at == completed_at)
+        ).all()
+
+    grade_stored_attempts(claimed, completed_at)
+    invalidate_on_commit(quiz_summary_cache)
+    db.session.commit()
+    return len(claimed)
+
+
+def ensure_deadline_sweeper(app, interval=SWEEP_INTERVAL_SECONDS):
+    """Start this process's sweeper thread if it is not running yet"""
+    run_periodically(app, 'quiz-deadline-sweeper', interval, sweep_expired_attempts)
@@ -0,0 +1,391 @@
+"""
+Quiz grading engine.
+
+A quiz's answer key is loaded with one query and every response is scored
+against it in a single pass, honoring each question's points. The attempt,
+its answers and the matching Grade are written in the caller's transaction
+with a fixed number of statements, regardless of how many questions the
+quiz has; answers already autosaved against an open attempt are graded in
+place rather than sent again. When an answer key changes, regrade_quiz()
+re-scores every attempt on the quiz with set-based UPDATEs.
+"""
+
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models import Quiz, QuizQuestion, QuizAttempt, QuizAnswer, Grade
+from quiz_autosave import store_answers
+
+VALID_ANSWERS = ('A', 'B', 'C', 'D')
+
+
+class AnswerKey:
+    """Correct answers and points for every question of one quiz"""
+
+    def __init__(self, quiz_id, questions):
+        self.quiz_id = quiz_id
+        # question_id -> (correct_answer, points), read-only so it can be shared
+        self.questions = MappingProxyType(dict(questions))
+        self.max_score = sum(points for _, points in questions.values())
+
+    @classmethod
+    def load(cls, quiz_id):
+        rows = db.session.execute(
+            db.select(QuizQuestion.id, QuizQuestion.correct_answer, QuizQuestion.points)
+            .where(QuizQuestion.quiz_id == quiz_id)
+        ).all()
+        return cls(quiz_id, {
+            question_id: (correct_answer, points if points is not None else 1)
+            for question_id, correct_answer, points in rows
+        })
+
+    def __len__(self):
+        return len(self.questions)
+
+
+def responses_from_form(form):
+    """Pull ``question_<id>`` fields out of a submitted quiz form"""
+    responses = {}
+    for field, value in form.items():
+        if field.startswith('question_'):
+            try:
+                responses[int(field[len('question_'):])] = value
+            except ValueError:
+                continue
+    return responses
+
+
+def score_responses(answer_key, responses):
+    """Score responses against the key in one pass.
+
+    ``responses`` maps question id to the selected letter. Unanswered
+    questions, answers to questions outside the quiz and letters other than
+    A-D are skipped. Returns (answer rows ready for a bulk insert, score).
+    """
+    rows = []
+    score = 0
+    for question_id, selected in responses.items():
+        key = answer_key.questions.get(question_id)
+        if key is None or selected not in VALID_ANSWERS:
+            continue
+        correct_answer, points = key
+        is_correct = selected == correct_answer
+        points_earned = points if is_correct else 0
+        score += points_earned
+        rows.append({
+            'question_id': question_id,
+            'selected_answer': selected,
+            'is_correct': is_correct,
+            'points_earned': points_earned,
+        })
+    return rows, score
+
+
+def percentage(score, max_score):
+    return (score / max_score) * 100 if max_score else 0.0
+
+
+def grade_feedback(score, max_score):
+    return f"Quiz completed with {score:g}/{max_score:g} points"
+
+
+def start_attempt(quiz, user_id, draw=None):
+    """The student's open attempt on a quiz, created if they have none.
+
+    A new attempt gets its deadline from the quiz's time limit plus the
+    fields returned by ``draw()`` (question_ids, shuffle_seed, max_score),
+    which is only called when an attempt is created. Answers are autosaved
+    against the attempt until it is submitted. Two requests starting
+    the same quiz at once get the same attempt: the insert skips on the
+    open-attempt unique index and the winner's row is selected instead.
+    Does not commit.
+    """
+    attempt = _open_attempt(quiz.id, user_id)
+    if attempt is None:
+        started_at = datetime.utcnow()
+        insert = sqlite.insert if db.session.get_bind().dialect.name == 'sqlite' else postgresql.insert
+        db.session.execute(
+            insert(QuizAttempt)
+            .values(quiz_id=quiz.id, user_id=user_id, started_at=started_at,
+                    deadline=attempt_deadline(quiz, started_at), **(draw() if draw else {}))
+            .on_conflict_do_nothing(index_elements=['quiz_id', 'user_id'],
+                                    index_where=QuizAttempt.completed_at.is_(None))
+        )
+        attempt = _open_attempt(quiz.id, user_id)
+    elif attempt.deadline is None and quiz.time_limit_minutes:
+        # Opened before deadlines were recorded; the clock starts now
+        attempt.deadline = attempt_deadline(quiz, datetime.utcnow())
+    return attempt
+
+
+def _open_attempt(quiz_id, user_id):
+    return db.session.execute(
+        db.select(QuizAttempt)
+        .where(QuizAttempt.quiz_id == quiz_id,
+               QuizAttempt.user_id == user_id,
+               QuizAttempt.completed_at.is_(None))
+    ).scalar()
+
+
+def attempt_deadline(quiz, started_at):
+    """When an attempt started at ``started_at`` (UTC) runs out of time"""
+    if not quiz.time_limit_minutes:
+        return None
+    return started_at + timedelta(minutes=quiz.time_limit_minutes)
+
+
+def submit_attempt(quiz, user_id, responses, answer_key=None, attempt=None):
+    """Grade a submission and stage the attempt, answers and Grade.
+
+    With an open ``attempt`` from start_attempt(), answers already stored
+    by autosave are graded in place and only responses that differ from
+    them are written; if the attempt turns out to have been submitted
+    already, nothing is written and None is returned. Without an attempt a
+    new one is created. Does not commit; the caller owns the transaction so
+    the writes succeed or fail together. Returns the QuizAttempt.
+    """
+    if answer_key is None:
+        answer_key = AnswerKey.load(quiz.id)
+    completed_at = datetime.utcnow()
+
+    if attempt is None:
+        rows, score = score_responses(answer_key, responses)
+        attempt = QuizAttempt(quiz_id=quiz.id, user_id=user_id)
+        _finish(attempt, quiz, score, answer_key.max_score, completed_at)
+        db.session.add(attempt)
+        db.session.flush()
+        for row in rows:
+            row['attempt_id'] = attempt.id
+        if rows:
+            db.session.execute(db.insert(QuizAnswer), rows)
+    else:
+        # Claim the attempt so a double submit cannot grade it twice
+        claimed = db.session.execute(
+            db.update(QuizAttempt)
+            .where(QuizAttempt.id == attempt.id, QuizAttempt.completed_at.is_(None))
+            .values(completed_at=completed_at)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            return None
+        stored = dict(db.session.execute(
+            db.select(QuizAnswer.question_id, QuizAnswer.selected_answer)
+            .where(QuizAnswer.attempt_id == attempt.id)
+        ).all())
+        rows, score = score_responses(answer_key, {**stored, **responses})
+        changed = [dict(row, attempt_id=attempt.id) for row in rows
+                   if stored.get(row['question_id']) != row['selected_answer']]
+        store_answers(changed)
+        # Autosave stores answers as wrong; mark the right ones among them
+        changed_ids = {row['question_id'] for row in changed}
+        _mark_correct(attempt.id, {row['question_id']: row['points_earned'] for row in rows
+                                   if row['is_correct'] and row['question_id'] not in changed_ids})
+        _finish(attempt, quiz, score, answer_key.max_score, completed_at)
+
+    # Create a Grade record for the grades page
+    db.session.add(Grade(
+        user_id=user_id,
+        course_id=quiz.course_id,
+        assignment_name=f"Quiz: {quiz.title}",
+        score=attempt.percentage,
+        max_score=100.0,
+        feedback=grade_feedback(score, answer_key.max_score),
+        graded_at=completed_at,
+        quiz_attempt_id=attempt.id
+    ))
+    return attempt
+
+
+def grade_stored_attempts(attempt_ids, completed_at):
+    """Grade open attempts from whatever answers they have stored.
+
+    Used to close attempts whose time ran out. The caller must already
+    have claimed the attempts (set their completed_at). Runs as a fixed
+    number of set-based statements however many attempts are given:
+    answers are marked, totals and pass/fail are filled in, and one Grade
+    per attempt is inserted with INSERT ... SELECT. Does not commit.
+    """
+    if not attempt_ids:
+        return
+    in_batch = QuizAttempt.id.in_(attempt_ids)
+    _mark_answers(QuizAnswer.attempt_id.in_(attempt_ids))
+
+    earned = db.select(db.func.coalesce(db.func.sum(QuizAnswer.points_earned), 0)).where(
+        QuizAnswer.attempt_id == QuizAttempt.id
+    ).scalar_subquery()
+    max_points = db.select(db.func.coalesce(db.func.sum(_question_points()), 0)).where(
+        QuizQuestion.quiz_id == QuizAttempt.quiz_id
+    ).scalar_subquery()
+    db.session.execute(
+        db.update(QuizAttempt)
+        .where(in_batch)
+        .values(score=earned,
+                # Pooled attempts were given their own maximum when drawn
+                max_score=db.case((QuizAttempt.question_ids.is_(None), max_points),
+                                  else_=QuizAttempt.max_score))
+        .execution_options(synchronize_session=False)
+    )
+
+    passing_score = db.select(Quiz.passing_score).where(
+        Quiz.id == QuizAttempt.quiz_id
+    ).scalar_subquery()
+    new_percentage = db.case((QuizAttempt.max_score > 0,
+                              QuizAttempt.score * 100.0 / QuizAttempt.max_score), else_=0.0)
+    db.session.execute(
+        db.update(QuizAttempt)
+        .where(in_batch)
+        .values(percentage=new_percentage, passed=new_percentage >= passing_score)
+        .execution_options(synchronize_session=False)
+    )
+
+    insert_quiz_grades(in_batch, graded_at=completed_at)
+    _expire_quiz_rows()
+
+
+def insert_quiz_grades(criteria, graded_at=None):
+    """Insert the gradebook entry for each completed attempt matching ``criteria``.
+
+    One INSERT ... SELECT. Grades are dated ``graded_at``, or when their
+    attempt was completed if it is not given. Does not commit.
+    """
+    db.session.execute(db.insert(Grade).from_select(
+        ['user_id', 'course_id', 'assignment_name', 'score', 'max_score',
+         'feedback', 'graded_at', 'quiz_attempt_id'],
+        db.select(QuizAttempt.user_id, Quiz.course_id, db.literal('Quiz: ') + Quiz.title,
+                  QuizAttempt.percentage, db.literal(100.0),
+                  _sql_grade_feedback(QuizAttempt.score, QuizAttempt.max_score),
+                  QuizAttempt.completed_at if graded_at is None else db.literal(graded_at),
+                  QuizAttempt.id)
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)
+        .where(criteria, QuizAttempt.completed_at.isnot(None))
+    ))
+
+
+def _finish(attempt, quiz, score, max_score, completed_at):
+    attempt.score = score
+    attempt.max_score = max_score
+    attempt.percentage = percentage(score, max_score)
+    attempt.passed = attempt.percentage >= quiz.passing_score
+    attempt.completed_at = completed_at
+
+
+def regrade_quiz(quiz):
+    """Re-score every attempt on a quiz after its answer key changed.
+
+    Runs as a fixed number of set-based UPDATEs, however many attempts
+    there are: answers are re-marked by joining to quiz_question, attempt
+    totals are re-summed from the answers, then percentages, pass/fail and
+    the linked Grade rows follow. Does not commit. Returns the number of
+    attempts re-graded.
+    """
+    max_score = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(_question_points()), 0))
+        .where(QuizQuestion.quiz_id == quiz.id)
+    ).scalar()
+
+    # 1. Re-mark each answer against its question's current key and points
+    _mark_answers(QuizQuestion.quiz_id == quiz.id)
+
+    # 2. Re-total each attempt from its answers
+    earned = db.select(db.func.coalesce(db.func.sum(QuizAnswer.points_earned), 0)).where(
+        QuizAnswer.attempt_id == QuizAttempt.id
+    ).scalar_subquery()
+    attempts = db.session.execute(
+        db.update(QuizAttempt)
+        .where(QuizAttempt.quiz_id == quiz.id)
+        .values(score=earned,
+                max_score=db.case((QuizAttempt.question_ids.is_(None), max_score),
+                                  else_=QuizAttempt.max_score))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    _rescore_pooled_attempts(quiz)
+
+    # 3. Percentages and pass/fail from the new totals
+    new_percentage = db.case((QuizAttempt.max_score > 0,
+                              QuizAttempt.score * 100.0 / QuizAttempt.max_score), else_=0.0)
+    db.session.execute(
+        db.update(QuizAttempt)
+        .where(QuizAttempt.quiz_id == quiz.id)
+        .values(percentage=new_percentage,
+                passed=new_percentage >= quiz.passing_score)
+        .execution_options(synchronize_session=False)
+    )
+
+    # 4. Carry the new percentages over to the linked grades
+    db.session.execute(
+        db.update(Grade)
+        .where(Grade.quiz_attempt_id == QuizAttempt.id,
+               QuizAttempt.quiz_id == quiz.id)
+        .values(score=QuizAttempt.percentage,
+                feedback=_sql_grade_feedback(QuizAttempt.score, QuizAttempt.max_score))
+        .execution_options(synchronize_session=False)
+    )
+
+    _expire_quiz_rows()
+    return attempts
+
+
+def _mark_correct(attempt_id, points_by_question):
+    if not points_by_question:
+        return
+    db.session.execute(
+        db.update(QuizAnswer)
+        .where(QuizAnswer.attempt_id == attempt_id,
+               QuizAnswer.question_id.in_(list(points_by_question)))
+        .values(is_correct=True,
+                points_earned=db.case(points_by_question, value=QuizAnswer.question_id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _question_points():
+    # Legacy questions have no points and are worth one, as in AnswerKey
+    return db.func.coalesce(QuizQuestion.points, 1)
+
+
+def _mark_answers(criteria):
+    # Mark answers right or wrong by joining them to their questions
+    is_correct = QuizAnswer.selected_answer == QuizQuestion.correct_answer
+    db.session.execute(
+        db.update(QuizAnswer)
+        .where(QuizAnswer.question_id == QuizQuestion.id, criteria)
+        .values(is_correct=is_correct,
+                points_earned=db.case((is_correct, _question_points()), else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _rescore_pooled_attempts(quiz):
+    # Attempts that drew from a pool are out of the points of their own
+    # questions; one executemany UPDATE sets them all
+    pooled = db.session.execute(
+        db.select(QuizAttempt.id, QuizAttempt.question_ids)
+        .where(QuizAttempt.quiz_id == quiz.id, QuizAttempt.question_ids.isnot(None))
+    ).all()
+    if not pooled:
+        return
+    points = dict(db.session.execute(
+        db.select(QuizQuestion.id, _question_points())
+        .where(QuizQuestion.quiz_id == quiz.id)
+    ).all())
+    db.session.execute(db.update(QuizAttempt), [
+        {'id': attempt_id, 'max_score': sum(points.get(qid, 0) for qid in question_ids)}
+        for attempt_id, question_ids in pooled
+    ])
+
+
+def _sql_grade_feedback(score, max_score):
+    # Scores are whole numbers of points, so this matches grade_feedback()
+    def whole(value):
+        return db.cast(db.cast(value, db.Integer), db.String)
+    return (db.literal('Quiz completed with ') + whole(score) + '/'
+            + whole(max_score) + ' points')
+
+
+def _expire_quiz_rows():
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, (QuizAnswer, QuizAttempt, Grade)):
+            db.session.expire(obj)
@@ -0,0 +1,188 @@
+"""
+Quiz text import.
+
+Teachers paste or upload quizzes in the plain-text format shown on the
+create-quiz page: a title line, then questions ending in ``?`` each
+followed by ``A)``-``D)`` options with ``[CORRECT]`` after the right one.
+The parser reads the source a line at a time and yields questions as soon
+as they are complete, so a bank of thousands of questions is never held in
+memory as a whole; import_quiz() writes them to the database in
+fixed-size executemany INSERTs. Problems are collected with the line they
+occur on instead of being guessed around.
+"""
+
+import io
+
+from database import db
+from models import Quiz, QuizQuestion
+
+OPTION_LETTERS = ('A', 'B', 'C', 'D')
+CORRECT_MARKER = '[CORRECT]'
+
+# Rows per INSERT when importing questions
+IMPORT_CHUNK_SIZE = 500
+
+# Errors listed back to the teacher; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class QuizFormatError(ValueError):
+    """Raised when quiz text has errors; ``errors`` holds (line, message) pairs"""
+
+    def __init__(self, errors, error_count=None):
+        self.errors = errors
+        self.error_count = error_count if error_count is not None else len(errors)
+        super().__init__('; '.join(f'Line {line}: {message}' for line, message in errors))
+
+
+def quiz_lines(source):
+    """Iterate over the lines of pasted text or an uploaded binary file"""
+    if isinstance(source, str):
+        return io.StringIO(source)
+    # utf-8-sig drops the byte order mark some editors put on text files
+    return io.TextIOWrapper(source, encoding='utf-8-sig', newline=None)
+
+
+class QuizTextParser:
+    """Streaming parser for the quiz text format.
+
+    Iterating over parse() yields one dict per complete, valid question with
+    question_text, options, correct_answer and the line it started on. The
+    title is available once the first line has been read, and ``errors`` /
+    ``error_count`` once iteration has finished.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.title = None
+        self.errors = []
+        self.error_count = 0
+        self.question_count = 0
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+    def parse(self):
+        current = None
+        line_number = 0
+        try:
+            for line_number, raw in enumerate(self.lines, start=1):
+                line = raw.strip()
+                if not line:
+                    continue
+
+                # First non-empty line is the quiz title
+                if self.title is None:
+                    self.title = line
+                    continue
+
+                if line.endswith('?'):
+                    if current is not None and self._check(current):
+                        yield current
+                    current = {'question_text': line, 'options': {},
+                               'correct_answer': None, 'line': line_number}
+                    continue
+
+                letter = line[0].upper()
+                if letter in OPTION_LETTERS and line[1:2] == ')':
+                    if current is None:
+                        self.error(line_number, 'option appears before any question')
+                    else:
+                        self._add_option(current, letter, line[2:].strip(), line_number)
+                    continue
+
+                self.error(line_number, 'expected a question ending in "?" or an option A) to D)')
+        except UnicodeDecodeError:
+            self.error(line_number + 1, 'file is not UTF-8 text')
+            return
+
+        if current is not None and self._check(current):
+            yield current
+        if self.title is None:
+            self.error(1, 'quiz text is empty')
+        elif not self.question_count and not self.error_count:
+            self.error(line_number, 'no questions found')
+
+    def _add_option(self, question, letter, text, line_number):
+        if letter in question['options']:
+            self.error(line_number, f'option {letter}) is listed twice')
+            return
+        if CORRECT_MARKER in text:
+            if question['correct_answer']:
+                self.error(line_number, f'more than one option is marked {CORRECT_MARKER}')
+            else:
+                question['correct_answer'] = letter
+            text = text.replace(CORRECT_MARKER, '').strip()
+        question['options'][letter] = text
+
+    def _check(self, question):
+        line_number = question['line']
+        ok = True
+        if len(question['options']) < 2:
+            self.error(line_number, 'question needs at least two options')
+            ok = False
+        if not question['correct_answer']:
+            self.error(line_number, f'no option is marked {CORRECT_MARKER}')
+            ok = False
+        if ok:
+            self.question_count += 1
+        return ok
+
+
+def parse_quiz(source):
+    """Parse a whole quiz into a dict of title and questions.
+
+    Convenient for small quizzes and previews; raises QuizFormatError if
+    the text has any errors. Large banks should go through import_quiz()
+    instead.
+    """
+    parser = QuizTextParser(quiz_lines(source))
+    questions = list(parser.parse())
+    if parser.error_count:
+        raise QuizFormatError(parser.errors, parser.error_count)
+    return {'title': parser.title, 'questions': questions}
+
+
+def import_quiz(source, course_id, chunk_size=None, **quiz_fields):
+    """Create a quiz from pasted text or an uploaded file.
+
+    Questions are inserted in chunks of ``chunk_size`` (IMPORT_CHUNK_SIZE
+    by default) as they are parsed.
+    Writing stops at the first error but parsing carries on so every
+    problem in the source is reported. Does not commit; if QuizFormatError
+    is raised the caller should roll back. Returns the new Quiz.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    parser = QuizTextParser(quiz_lines(source))
+    quiz = None
+    rows = []
+    for order_num, question in enumerate(parser.parse(), start=1):
+        if parser.error_count:
+            continue
+        if quiz is None:
+            quiz = Quiz(title=parser.title, course_id=course_id, **quiz_fields)
+            db.session.add(quiz)
+            db.session.flush()  # Get the quiz ID
+        options = question['options']
+        rows.append({
+            'quiz_id': quiz.id,
+            'question_text': question['question_text'],
+            'option_a': options.get('A', ''),
+            'option_b': options.get('B', ''),
+            'option_c': options.get('C', ''),
+            'option_d': options.get('D', ''),
+            'correct_answer': question['correct_answer'],
+            'points': 1,
+            'order_num': order_num,
+        })
+        if len(rows) >= chunk_size:
+            db.session.execute(db.insert(QuizQuestion), rows)
+            rows = []
+
+    if parser.error_count:
+        raise QuizFormatError(parser.errors, parser.error_count)
+    if rows:
+        db.session.execute(db.insert(QuizQuestion), rows)
+    return quiz
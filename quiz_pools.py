@@ -0,0 +1,111 @@
+"""
+Question pools and shuffled options.
+
+A quiz with ``questions_per_attempt`` set is a pool: each attempt draws
+that many of its questions at random, so students sitting side by side
+see different papers. With ``shuffle_options`` the four options of every
+question are also shown in an order of their own per attempt.
+
+The draw is made once, when the attempt is opened, and stored on it: the
+drawn question ids in display order, plus a seed from which each
+question's option permutation is re-derived. Sampling k of n questions
+with random.sample is O(k), so it stays cheap for pools of tens of
+thousands of questions. The form uses displayed letters; answers are
+mapped back to the authored letters before they are stored or graded, so
+answer keys, re-grading and item analysis never see the shuffle.
+"""
+
+import random
+import secrets
+from collections import namedtuple
+
+from quiz_grading import AnswerKey, VALID_ANSWERS, start_attempt
+
+DisplayedQuestion = namedtuple('DisplayedQuestion', ['id', 'question_text', 'options', 'points'])
+
+
+def draw_attempt(quiz, snapshot):
+    """Choose question ids and an option seed for a new attempt.
+
+    Returns (question_ids, shuffle_seed); either is None when the quiz
+    does not use pooling or option shuffling.
+    """
+    question_ids = None
+    k = quiz.questions_per_attempt
+    if k and k < len(snapshot.questions):
+        question_ids = [q.id for q in random.SystemRandom().sample(snapshot.questions, k)]
+    shuffle_seed = secrets.randbits(31) if quiz.shuffle_options else None
+    return question_ids, shuffle_seed
+
+
+def open_attempt(quiz, user_id, snapshot):
+    """The student's open attempt and its layout, drawing a paper for a new one.
+
+    Does not commit. Returns (attempt, AttemptLayout).
+    """
+    def draw():
+        question_ids, shuffle_seed = draw_attempt(quiz, snapshot)
+        fields = {'question_ids': question_ids, 'shuffle_seed': shuffle_seed}
+        if question_ids is not None:
+            # A pooled attempt is marked out of the questions it drew
+            fields['max_score'] = sum(snapshot.answer_key.questions[qid][1] for qid in question_ids)
+        return fields
+
+    attempt = start_attempt(quiz, user_id, draw)
+    return attempt, AttemptLayout(attempt, snapshot)
+
+
+def option_order(shuffle_seed, question_id):
+    """Authored letters in the order they are shown for one question"""
+    if shuffle_seed is None:
+        return VALID_ANSWERS
+    letters = list(VALID_ANSWERS)
+    random.Random(f'{shuffle_seed}:{question_id}').shuffle(letters)
+    return tuple(letters)
+
+
+class AttemptLayout:
+    """The paper one attempt sees, rebuilt from its stored draw and seed"""
+
+    def __init__(self, attempt, snapshot):
+        self.shuffle_seed = attempt.shuffle_seed
+        if attempt.question_ids is None:
+            chosen = snapshot.questions
+            self.answer_key = snapshot.answer_key
+        else:
+            # Questions deleted since the draw are dropped
+            chosen = [snapshot.by_id[qid] for qid in attempt.question_ids if qid in snapshot.by_id]
+            self.answer_key = AnswerKey(snapshot.quiz_id, {
+                q.id: snapshot.answer_key.questions[q.id] for q in chosen
+            })
+
+        self._orders = {}
+        self.questions = []
+        for question in chosen:
+            order = option_order(self.shuffle_seed, question.id)
+            self._orders[question.id] = order
+            self.questions.append(DisplayedQuestion(
+                id=question.id,
+                question_text=question.question_text,
+                options=tuple((shown, getattr(question, f'option_{authored.lower()}'))
+                              for shown, authored in zip(VALID_ANSWERS, order)),
+                points=question.points,
+            ))
+
+    def to_authored(self, responses):
+        """Map {question_id: displayed letter} to authored letters, dropping the rest"""
+        mapped = {}
+        for question_id, letter in responses.items():
+            order = self._orders.get(question_id)
+            if order is not None and letter in VALID_ANSWERS:
+                mapped[question_id] = order[VALID_ANSWERS.index(letter)]
+        return mapped
+
+    def to_displayed(self, answers):
+        """Map {question_id: authored letter} to the letters shown on this paper"""
+        shown = {}
+        for question_id, letter in answers.items():
+            order = self._orders.get(question_id)
+            if order is not None and letter in order:
+                shown[question_id] = VALID_ANSWERS[order.index(letter)]
+        return shown
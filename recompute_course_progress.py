@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Rebuild Enrollment.progress and its completed/total material counters.
+
+Progress is adjusted incrementally whenever a material is added or removed
+or a student marks one complete, but enrollments written outside the app
+(old scripts, manual SQL, restores) can be out of step. Run this to
+recompute every enrollment, or a single course, in two bulk UPDATEs.
+
+Usage: python recompute_course_progress.py [course_id]
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from enrollments import recompute_progress
+
+if __name__ == '__main__':
+    course_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    with app.app_context():
+        try:
+            updated = recompute_progress(course_id)
+            db.session.commit()
+            scope = f"course {course_id}" if course_id is not None else "all courses"
+            print(f"✅ Recomputed progress for {updated} enrollment(s) in {scope}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error recomputing course progress: {e}")
+            sys.exit(1)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Rebuild Course.enrolled_count from the enrollment table.
+
+The counter is kept up to date by every enroll/unenroll path, but rows
+written outside the app (manual SQL, old scripts, restores) can leave it
+out of step. Run this to recompute every course in a single bulk UPDATE.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models import Course, Enrollment
+from enrollments import reconcile_enrolled_counts
+
+def show_drift():
+    """List courses whose counter disagrees with the enrollment table"""
+    actual = db.func.count(Enrollment.id)
+    rows = db.session.query(
+        Course.id, Course.title, Course.enrolled_count, actual
+    ).outerjoin(
+        Enrollment, Enrollment.course_id == Course.id
+    ).group_by(Course.id).having(Course.enrolled_count != actual).all()
+
+    for course_id, title, counted, enrolled in rows:
+        print(f"Course {course_id} ({title}): counter={counted}, enrollments={enrolled}")
+    return len(rows)
+
+if __name__ == '__main__':
+    with app.app_context():
+        if len(sys.argv) > 1 and sys.argv[1] == '--show-only':
+            drifted = show_drift()
+            print(f"{drifted} course(s) out of sync")
+        else:
+            try:
+                drifted = reconcile_enrolled_counts()
+                db.session.commit()
+                print(f"✅ Reconciled enrollment counters ({drifted} course(s) corrected)")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error reconciling enrollment counters: {e}")
+                sys.exit(1)
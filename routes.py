@@ -1,82 +1,32 @@
-from flask import render_template, request, redirect, url_for, flash, session, current_app
+from flask import render_template, request, redirect, url_for, flash, session, current_app, abort
 from database import db
-from models import User, Course, Enrollment, Grade, CourseMaterial, Announcement, Assignment, AssignmentSubmission, StudyProgress, Quiz, QuizQuestion, QuizAttempt, QuizAnswer, UserDeletionRequest
+from models import User, Course, Enrollment, Grade, CourseMaterial, Announcement, Assignment, AssignmentSubmission, StudyProgress, Quiz, QuizAttempt, UserDeletionRequest
+from grade_stats import course_grade_summaries, overall_grade_summary, recent_grades_by_course, RECENT_GRADES_PER_COURSE
+from stats_cache import report_cache, quiz_summary_cache, invalidate_on_commit
+from quiz_grading import submit_attempt, responses_from_form
+from quiz_autosave import autosave_buffer, saved_answers, ensure_autosave_flusher
+from quiz_deadlines import is_expired, seconds_remaining, ensure_deadline_sweeper
+from quiz_cache import quiz_cache, bump_quiz_version
+from quiz_import import parse_quiz, import_quiz, QuizFormatError
+from quiz_pools import AttemptLayout, open_attempt
+from enrollments import enroll_student, completion_changed, ALREADY_ENROLLED, COURSE_FULL
+from file_uploads import stage_uploads, stored_name, submission_upload_limit, format_size, UploadError
+from blob_store import store_blob
 from datetime import datetime
+from sqlalchemy import and_
+from sqlalchemy.orm import joinedload, contains_eager
+from werkzeug.exceptions import RequestEntityTooLarge
 import random
 import re
 import time
 
 def parse_quiz_text(quiz_text):
+    """Parse pasted quiz text into a title and questions.
+
+    See quiz_import for the format; raises QuizFormatError with
+    line-numbered errors instead of guessing at missing answers.
     """
-    Parse quiz text in the format:
-    Quiz Title
-    
-    Question 1?
-    A) Option A
-    B) Option B
-    C) Option C
-    D) Option D
-    
-    Question 2?
-    A) Option A
-    B) Option B
-    C) Option C
-    D) Option D
-    """
-    lines = quiz_text.strip().split('\n')
-    quiz_data = {
-        'title': '',
-        'questions': []
-    }
-    
-    current_question = None
-    question_num = 0
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # First non-empty line is the quiz title
-        if not quiz_data['title']:
-            quiz_data['title'] = line
-            continue
-            
-        # Check if this is a question (ends with ?)
-        if line.endswith('?'):
-            if current_question:
-                quiz_data['questions'].append(current_question)
-            
-            current_question = {
-                'question_text': line,
-                'options': {},
-                'correct_answer': None
-            }
-            question_num += 1
-            continue
-            
-        # Check if this is an option (starts with A), B), C), D))
-        if line.startswith(('A)', 'B)', 'C)', 'D)')):
-            option_letter = line[0]
-            option_text = line[2:].strip()
-            
-            # Check if this option is marked as correct
-            if '[CORRECT]' in option_text:
-                current_question['correct_answer'] = option_letter
-                # Remove [CORRECT] from the display text
-                option_text = option_text.replace('[CORRECT]', '').strip()
-            
-            current_question['options'][option_letter] = option_text
-            
-            # If no correct answer is specified yet, use the first option as fallback
-            if not current_question['correct_answer']:
-                current_question['correct_answer'] = option_letter
-    
-    # Add the last question
-    if current_question:
-        quiz_data['questions'].append(current_question)
-    
-    return quiz_data
+    return parse_quiz(quiz_text)
 
 def index():
     featured_courses = Course.query.limit(8).all()
@@ -144,6 +94,7 @@ def register():
         
         try:
             db.session.add(user)
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
@@ -193,36 +144,45 @@ def dashboard():
     elif user.role == 'admin':
         return redirect(url_for('admin_dashboard'))
     
-    # Student dashboard
-    enrolled_courses = user.get_enrolled_courses()
+    # Student dashboard - enrollments come back with their courses in one query
+    enrollments = Enrollment.query.options(
+        joinedload(Enrollment.course)
+    ).filter_by(user_id=user.id).all()
+    enrolled_courses = [enrollment.course for enrollment in enrollments]
+
+    # All active assignments for the enrolled courses, left-joined to this
+    # student's submission so the page costs the same however many there are
+    assignment_rows = db.session.query(Assignment, AssignmentSubmission).join(
+        Enrollment,
+        Enrollment.course_id == Assignment.course_id
+    ).outerjoin(
+        AssignmentSubmission,
+        and_(AssignmentSubmission.assignment_id == Assignment.id,
+             AssignmentSubmission.user_id == user.id)
+    ).filter(
+        Enrollment.user_id == user.id,
+        Assignment.is_active == True
+    ).all()
+
     recent_assignments = []
     upcoming_deadlines = []
-    
-    for course in enrolled_courses:
-        # Get assignments for enrolled courses
-        course_assignments = Assignment.query.filter_by(course_id=course.id, is_active=True).all()
-        for assignment in course_assignments:
-            # Check if student has submitted
-            submission = AssignmentSubmission.query.filter_by(
-                assignment_id=assignment.id,
-                user_id=user.id
-            ).first()
-            
-            if not submission:
-                upcoming_deadlines.append(assignment)
-            else:
-                recent_assignments.append({
-                    'assignment': assignment,
-                    'submission': submission
-                })
-    
+    for assignment, submission in assignment_rows:
+        if not submission:
+            upcoming_deadlines.append(assignment)
+        else:
+            recent_assignments.append({
+                'assignment': assignment,
+                'submission': submission
+            })
+
     # Sort by due date
     upcoming_deadlines.sort(key=lambda x: x.due_date)
-    recent_assignments.sort(key=lambda x: x.submission.submitted_at, reverse=True)
-    
+    recent_assignments.sort(key=lambda x: x['submission'].submitted_at, reverse=True)
+
     return render_template('dashboard.html',
                          user=user,
                          enrolled_courses=enrolled_courses,
+                         course_progress={e.course_id: e.progress or 0 for e in enrollments},
                          recent_assignments=recent_assignments[:5],
                          upcoming_deadlines=upcoming_deadlines[:5])
 
@@ -246,28 +206,9 @@ def course_detail(course_id):
             ).first()
             enrolled = enrollment is not None
             
-            # Debug: Print enrollment status
-            print(f"DEBUG: User {user.username} (ID: {user.id}) enrollment status for course {course_id}: {enrolled}")
-            if enrollment:
-                print(f"DEBUG: Enrollment found - ID: {enrollment.id}, Status: {enrollment.status}")
-            
-            # Calculate progress for enrolled students
+            # Progress is kept up to date on the enrollment itself
             if enrolled and user.role == 'student':
-                # Get total materials for the course
-                total_materials = CourseMaterial.query.filter_by(course_id=course_id).count()
-                if total_materials > 0:
-                    # Get completed materials
-                    completed_materials = StudyProgress.query.filter_by(
-                        user_id=user.id,
-                        course_id=course_id,
-                        completion_status='completed'
-                    ).count()
-                    progress = (completed_materials / total_materials) * 100
-                    print(f"DEBUG: Progress calculated: {progress}% ({completed_materials}/{total_materials} materials completed)")
-                else:
-                    print(f"DEBUG: No materials found for course {course_id}")
-            else:
-                print(f"DEBUG: User not enrolled or not a student. Role: {user.role}, Enrolled: {enrolled}")
+                progress = enrollment.progress or 0
     
     # Get course materials and assignments
     materials = CourseMaterial.query.filter_by(course_id=course_id).order_by(CourseMaterial.order_index).all()
@@ -296,52 +237,26 @@ def enroll_course(course_id):
     
     course = Course.query.get_or_404(course_id)
     
-    # Check if already enrolled
-    existing_enrollment = Enrollment.query.filter_by(
-        user_id=user.id,
-        course_id=course_id
-    ).first()
+    # The insert and the seat claim run in one transaction; the database
+    # decides whether the student got in, was already in, or the course is full
+    try:
+        outcome = enroll_student(user.id, course_id)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred during enrollment: {str(e)}', 'danger')
+        return redirect(url_for('course_detail', course_id=course_id))
     
-    if existing_enrollment:
+    if outcome == ALREADY_ENROLLED:
         flash('You are already enrolled in this course', 'info')
         return redirect(url_for('course_detail', course_id=course_id))
     
-    # Check if course is full
-    if course.is_full():
+    if outcome == COURSE_FULL:
         flash('This course is full and cannot accept more enrollments', 'danger')
         return redirect(url_for('course_detail', course_id=course_id))
     
-    # Create enrollment
-    enrollment = Enrollment(
-        user_id=user.id,
-        course_id=course_id
-    )
-    
-    try:
-        db.session.add(enrollment)
-        db.session.commit()
-        
-        # Force session to flush and commit
-        db.session.flush()
-        
-        # Verify enrollment was created
-        verification = Enrollment.query.filter_by(
-            user_id=user.id,
-            course_id=course_id
-        ).first()
-        
-        if verification:
-            flash(f'Successfully enrolled in {course.title}!', 'success')
-            # Redirect with success parameter to trigger auto-refresh
-            return redirect(url_for('course_detail', course_id=course_id, enrolled='success'))
-        else:
-            flash('Enrollment created but verification failed. Please refresh the page.', 'warning')
-            
-    except Exception as e:
-        db.session.rollback()
-        flash(f'An error occurred during enrollment: {str(e)}', 'danger')
-    
-    return redirect(url_for('course_detail', course_id=course_id))
+    flash(f'Successfully enrolled in {course.title}!', 'success')
+    # Redirect with success parameter to trigger auto-refresh
+    return redirect(url_for('course_detail', course_id=course_id, enrolled='success'))
 
 def study_material(material_id):
     if 'user_id' not in session:
@@ -423,8 +338,6 @@ def mark_complete(material_id):
         notes = request.form.get('notes', '').strip()
         study_time = int(request.form.get('study_time', 0))
         
-        print(f"DEBUG: Action: {action}, Notes: {notes}, Study Time: {study_time}")
-        
         # Get or create study progress
         study_progress = StudyProgress.query.filter_by(
             user_id=user.id,
@@ -438,9 +351,7 @@ def mark_complete(material_id):
                 material_id=material_id
             )
             db.session.add(study_progress)
-            print(f"DEBUG: Created new StudyProgress for user {user.id}, material {material_id}")
-        else:
-            print(f"DEBUG: Found existing StudyProgress: {study_progress.id}")
+        was_completed = study_progress.completion_status == 'completed'
         
         # Update study progress
         study_progress.notes = notes
@@ -450,23 +361,19 @@ def mark_complete(material_id):
         if action == 'mark_complete':
             study_progress.completion_status = 'completed'
             flash('Material marked as complete!', 'success')
-            print(f"DEBUG: Marked as complete")
         elif action == 'mark_incomplete':
             study_progress.completion_status = 'in_progress'
             flash('Material marked as in progress!', 'success')
-            print(f"DEBUG: Marked as in progress")
         elif action == 'save_notes':
             flash('Notes saved successfully!', 'success')
-            print(f"DEBUG: Notes saved")
-        else:
-            print(f"DEBUG: Unknown action: {action}")
         
         try:
+            # Keep the enrollment's progress in step with the status change
+            completion_changed(user.id, course.id, was_completed,
+                               study_progress.completion_status == 'completed')
             db.session.commit()
-            print(f"DEBUG: Database commit successful")
         except Exception as e:
             db.session.rollback()
-            print(f"DEBUG: Database error: {e}")
             flash('An error occurred while updating study progress', 'danger')
     
     return redirect(url_for('study_material', material_id=material_id))
@@ -504,28 +411,49 @@ def submit_assignment(assignment_id):
         flash('You have already submitted this assignment', 'info')
         return redirect(url_for('course_detail', course_id=course.id))
     
+    upload_limit = submission_upload_limit(assignment)
     if request.method == 'POST':
-        submission_text = request.form.get('submission_text', '').strip()
+        # Submitted when the request arrived, not when a slow upload finished
+        submitted_at = datetime.utcnow()
+        
+        # Files stream to disk in chunks, so a deadline rush does not fill worker
+        # memory, and the database connection goes back to the pool meanwhile
+        db.session.close()
+        stage_uploads(upload_limit)
+        try:
+            form, files = request.form, request.files
+        except RequestEntityTooLarge:
+            flash(f'That file is too large. Submissions can be up to {format_size(upload_limit)}.', 'danger')
+            return _submit_assignment_form(assignment, upload_limit)
+        
+        submission_text = form.get('submission_text', '').strip()
         file_path = None
+        stored = None
         
         # Handle file upload
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename:
-                # Simple file handling - in production, use proper file storage
-                filename = f"{assignment_id}_{user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
+        file = files.get('file')
+        if file and file.filename:
+            filename = stored_name(f"{assignment_id}_{user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}", file.filename)
+            try:
+                stored = store_blob(file, max_bytes=upload_limit)
                 file_path = f"uploads/{filename}"
+            except (UploadError, OSError) as e:
+                flash(f'Error saving file: {str(e)}', 'danger')
+                return _submit_assignment_form(assignment, upload_limit)
         
         if not submission_text and not file_path:
             flash('Please provide either text submission or upload a file', 'danger')
-            return render_template('submit_assignment.html', assignment=assignment)
+            return _submit_assignment_form(assignment, upload_limit)
         
         # Create submission
         submission = AssignmentSubmission(
-            assignment_id=assignment_id,
+            assignment=assignment,
             user_id=user.id,
             submission_text=submission_text,
             file_path=file_path,
+            file_size=stored.size if stored else None,
+            sha256=stored.sha256 if stored else None,
+            submitted_at=submitted_at,
             status='submitted'
         )
         
@@ -539,10 +467,15 @@ def submit_assignment(assignment_id):
             flash('Assignment submitted successfully!', 'success')
             return redirect(url_for('course_detail', course_id=course.id))
         except Exception as e:
+            # A newly stored blob has no row now; the blob collector removes it
             db.session.rollback()
             flash('An error occurred while submitting the assignment. Please try again.', 'danger')
     
-    return render_template('submit_assignment.html', assignment=assignment, now=datetime.now())
+    return _submit_assignment_form(assignment, upload_limit)
+
+def _submit_assignment_form(assignment, upload_limit):
+    return render_template('submit_assignment.html', assignment=assignment, now=datetime.now(),
+                           max_size=format_size(upload_limit))
 
 def view_grades():
     if 'user_id' not in session:
@@ -554,39 +487,15 @@ def view_grades():
         flash('Only students can view grades', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Get all grades for the user
-    grades = Grade.query.filter_by(user_id=user.id).all()
-    
-    # Group grades by course
-    course_grades = {}
-    for grade in grades:
-        course_id = grade.course_id
-        if course_id not in course_grades:
-            course_grades[course_id] = []
-        course_grades[course_id].append(grade)
-    
-    # Get course details
-    courses = Course.query.filter(Course.id.in_(course_grades.keys())).all()
-    course_dict = {course.id: course for course in courses}
-    
-    # Calculate course averages - use course ID as key to match grades_by_course structure
-    course_averages = {}
-    for course_id, grades_list in course_grades.items():
-        if grades_list:
-            total_score = sum(grade.score for grade in grades_list if grade.score is not None)
-            valid_grades = [grade for grade in grades_list if grade.score is not None]
-            if valid_grades:
-                course_averages[course_id] = total_score / len(valid_grades)
-            else:
-                course_averages[course_id] = 0.0
-        else:
-            course_averages[course_id] = 0.0
+    # Per-course totals come from one GROUP BY; only the latest grades are listed
+    summaries = course_grade_summaries(user.id)
     
     return render_template('grades.html',
                          user=user,
-                         grades_by_course=course_grades,
-                         courses=course_dict,
-                         course_averages=course_averages)
+                         course_summaries=summaries,
+                         overall=overall_grade_summary(summaries),
+                         recent_grades=recent_grades_by_course(user.id),
+                         recent_limit=RECENT_GRADES_PER_COURSE)
 
 def profile():
     if 'user_id' not in session:
@@ -641,25 +550,26 @@ def profile():
             db.session.rollback()
             flash('An error occurred while updating your profile. Please try again.', 'danger')
     
-    # Get user's enrolled courses
-    enrolled_courses = user.get_enrolled_courses()
+    # Get user's enrolled courses along with their progress
+    enrollments = Enrollment.query.options(
+        joinedload(Enrollment.course)
+    ).filter_by(user_id=user.id).all()
+    enrolled_courses = [enrollment.course for enrollment in enrollments]
     
     # Calculate overall GPA
-    grades = Grade.query.filter_by(user_id=user.id).all()
-    overall_gpa = 0.0
-    if grades:
-        total_score = sum(grade.score for grade in grades if grade.score is not None)
-        valid_grades = [grade for grade in grades if grade.score is not None]
-        if valid_grades:
-            overall_gpa = total_score / len(valid_grades)
+    overall = overall_grade_summary(course_grade_summaries(user.id))
     
     # Get recent grades for activity feed
-    recent_grades = Grade.query.filter_by(user_id=user.id).order_by(Grade.graded_at.desc()).limit(5).all()
+    recent_grades = Grade.query.options(
+        joinedload(Grade.course)
+    ).filter_by(user_id=user.id).order_by(Grade.graded_at.desc()).limit(5).all()
     
     return render_template('profile.html', 
                          user=user,
                          enrolled_courses=enrolled_courses,
-                         overall_gpa=overall_gpa,
+                         course_progress={e.course_id: e.progress or 0 for e in enrollments},
+                         total_grades=overall['grade_count'],
+                         overall_gpa=overall['average'],
                          recent_grades=recent_grades)
 
 def logout():
@@ -684,55 +594,42 @@ def create_quiz(course_id):
     
     if request.method == 'POST':
         quiz_text = request.form.get('quiz_text', '').strip()
+        quiz_file = request.files.get('quiz_file')
         time_limit = int(request.form.get('time_limit', 30))
         passing_score = int(request.form.get('passing_score', 70))
-        
-        if not quiz_text:
-            flash('Please enter quiz content', 'danger')
+        # Blank or 0 means every student gets every question
+        questions_per_attempt = request.form.get('questions_per_attempt', type=int) or None
+        shuffle_options = request.form.get('shuffle_options') == 'on'
+        
+        # An uploaded file wins over pasted text and is read as a stream
+        if quiz_file and quiz_file.filename:
+            source = quiz_file.stream
+        elif quiz_text:
+            source = quiz_text
+        else:
+            flash('Please enter quiz content or upload a quiz file', 'danger')
             return render_template('create_quiz.html', course=course)
         
         try:
-            # Parse the quiz text
-            quiz_data = parse_quiz_text(quiz_text)
-            
-            if not quiz_data['questions']:
-                flash('No valid questions found in the quiz text', 'danger')
-                return render_template('create_quiz.html', course=course)
-            
-            # Validate that all questions have correct answers
-            for i, question_data in enumerate(quiz_data['questions']):
-                if not question_data['correct_answer']:
-                    flash(f'Question {i+1} does not have a correct answer specified. Please add [CORRECT] to one option.', 'danger')
-                    return render_template('create_quiz.html', course=course)
-            
-            # Create the quiz
-            quiz = Quiz(
-                title=quiz_data['title'],
-                course_id=course_id,
-                time_limit_minutes=time_limit,
-                passing_score=passing_score
-            )
-            db.session.add(quiz)
-            db.session.flush()  # Get the quiz ID
-            
-            # Create questions
-            for i, question_data in enumerate(quiz_data['questions']):
-                question = QuizQuestion(
-                    quiz_id=quiz.id,
-                    question_text=question_data['question_text'],
-                    option_a=question_data['options'].get('A', ''),
-                    option_b=question_data['options'].get('B', ''),
-                    option_c=question_data['options'].get('C', ''),
-                    option_d=question_data['options'].get('D', ''),
-                    correct_answer=question_data['correct_answer'],
-                    order_num=i + 1
-                )
-                db.session.add(question)
-            
+            quiz = import_quiz(source, course_id,
+                               time_limit_minutes=time_limit,
+                               passing_score=passing_score,
+                               questions_per_attempt=questions_per_attempt,
+                               shuffle_options=shuffle_options)
+            # The id may have belonged to a deleted quiz this process cached
+            bump_quiz_version(quiz)
+            invalidate_on_commit(quiz_summary_cache, course_id)
             db.session.commit()
             flash(f'Quiz "{quiz.title}" created successfully!', 'success')
             return redirect(url_for('course_detail', course_id=course_id))
             
+        except QuizFormatError as e:
+            db.session.rollback()
+            problems = '; '.join(f'Line {line}: {message}' for line, message in e.errors)
+            if e.error_count > len(e.errors):
+                problems += f' (and {e.error_count - len(e.errors)} more)'
+            flash(f'The quiz was not created because of {e.error_count} problem(s): {problems}', 'danger')
+            return render_template('create_quiz.html', course=course, quiz_text=quiz_text)
         except Exception as e:
             db.session.rollback()
             flash(f'An error occurred while creating the quiz: {str(e)}', 'danger')
@@ -763,81 +660,99 @@ def take_quiz(quiz_id):
         return redirect(url_for('dashboard'))
     
     # Check if already attempted
-    existing_attempt = QuizAttempt.query.filter_by(
-        quiz_id=quiz_id,
-        user_id=user.id
+    existing_attempt = QuizAttempt.query.filter(
+        QuizAttempt.quiz_id == quiz_id,
+        QuizAttempt.user_id == user.id,
+        QuizAttempt.completed_at.isnot(None)
     ).first()
     
     if existing_attempt:
         flash('You have already taken this quiz', 'info')
         return redirect(url_for('quiz_results', attempt_id=existing_attempt.id))
     
+    # Questions and answer key come from the per-process quiz cache
+    snapshot = quiz_cache.get(quiz)
+    # Answers are autosaved against the open attempt until it is submitted;
+    # the layout is the paper drawn for it, in the order it is shown
+    attempt, layout = open_attempt(quiz, user.id, snapshot)
+    if attempt.deadline is not None:
+        ensure_deadline_sweeper(current_app._get_current_object())
+    
+    if is_expired(attempt):
+        # Time ran out: grade only the answers saved before the deadline
+        submit_attempt(quiz, user.id, autosave_buffer.take(attempt.id),
+                       answer_key=layout.answer_key, attempt=attempt)
+        invalidate_on_commit(quiz_summary_cache, quiz.course_id)
+        db.session.commit()
+        flash('Time is up for this quiz. Your saved answers have been submitted.', 'warning')
+        return redirect(url_for('quiz_results', attempt_id=attempt.id))
+    
     if request.method == 'POST':
-        # Process quiz submission
-        print(f"DEBUG: Quiz submission received for quiz {quiz_id}")
-        print(f"DEBUG: Form data: {dict(request.form)}")
-        score = 0
-        
-        # Get questions directly from database
-        questions = QuizQuestion.query.filter_by(quiz_id=quiz_id).all()
-        max_score = len(questions)
-        print(f"DEBUG: Found {max_score} questions")
-        
-        # Create attempt
-        attempt = QuizAttempt(
-            quiz_id=quiz_id,
-            user_id=user.id,
-            max_score=max_score,
-            completed_at=datetime.now()
-        )
-        db.session.add(attempt)
-        db.session.flush()
-        print(f"DEBUG: Created attempt {attempt.id}")
-        
-        # Process answers
-        for question in questions:
-            selected_answer = request.form.get(f'question_{question.id}')
-            print(f"DEBUG: Question {question.id}: selected={selected_answer}, correct={question.correct_answer}")
-            if selected_answer:
-                is_correct = selected_answer == question.correct_answer
-                points_earned = 1 if is_correct else 0
-                score += points_earned
-                
-                answer = QuizAnswer(
-                    attempt_id=attempt.id,
-                    question_id=question.id,
-                    selected_answer=selected_answer,
-                    is_correct=is_correct,
-                    points_earned=points_earned
-                )
-                db.session.add(answer)
-        
-        # Calculate final score
-        attempt.score = score
-        attempt.percentage = (score / max_score) * 100
-        attempt.passed = attempt.percentage >= quiz.passing_score
-        
-        # Create a Grade record for the grades page
-        grade = Grade(
-            user_id=user.id,
-            course_id=quiz.course_id,
-            assignment_name=f"Quiz: {quiz.title}",
-            score=attempt.percentage,
-            max_score=100.0,
-            feedback=f"Quiz completed with {score}/{max_score} correct answers",
-            graded_at=datetime.now()
-        )
-        db.session.add(grade)
+        # Grade what autosave already stored plus anything newer in the form
+        buffered = autosave_buffer.take(attempt.id)
+        responses = {**buffered, **layout.to_authored(responses_from_form(request.form))}
+        submitted = submit_attempt(quiz, user.id, responses,
+                                   answer_key=layout.answer_key, attempt=attempt)
+        invalidate_on_commit(quiz_summary_cache, quiz.course_id)
         
         try:
             db.session.commit()
-            flash('Quiz submitted successfully!', 'success')
+            if submitted is None:
+                flash('You have already taken this quiz', 'info')
+            else:
+                flash('Quiz submitted successfully!', 'success')
             return redirect(url_for('quiz_results', attempt_id=attempt.id))
         except Exception as e:
             db.session.rollback()
+            # Nothing was written; keep the answers for the next flush
+            autosave_buffer.restore(attempt.id, buffered)
             flash('An error occurred while submitting the quiz', 'danger')
+            attempt, layout = open_attempt(quiz, user.id, snapshot)
     
-    return render_template('take_quiz.html', quiz=quiz)
+    db.session.commit()
+    return render_template('take_quiz.html', quiz=quiz, questions=layout.questions,
+                           attempt=attempt,
+                           saved_answers=layout.to_displayed(saved_answers(attempt.id)),
+                           seconds_remaining=seconds_remaining(attempt))
+
+def autosave_quiz(quiz_id):
+    """Store partial answers for the student's open attempt (JSON)"""
+    if 'user_id' not in session or session.get('role') != 'student':
+        return {'status': 'error', 'message': 'Please log in as a student'}, 401
+    
+    row = db.session.execute(
+        db.select(QuizAttempt, Quiz)
+        .join(Quiz, Quiz.id == QuizAttempt.quiz_id)
+        .where(QuizAttempt.quiz_id == quiz_id,
+               QuizAttempt.user_id == session['user_id'],
+               QuizAttempt.completed_at.is_(None))
+        .order_by(QuizAttempt.id)
+        .limit(1)
+    ).first()
+    if row is None:
+        return {'status': 'error', 'message': 'No open attempt for this quiz'}, 409
+    attempt, quiz = row
+    if is_expired(attempt):
+        return {'status': 'error', 'message': 'Time is up for this quiz'}, 409
+    
+    payload = request.get_json(silent=True) or {}
+    answers = payload.get('answers')
+    if not isinstance(answers, dict):
+        return {'status': 'error', 'message': 'Expected {"answers": {question_id: letter}}'}, 400
+    
+    # Only keep answers to questions on this attempt's paper, and only valid
+    # letters, stored as the authored letters they were shown as
+    responses = {}
+    for question_id, letter in answers.items():
+        try:
+            responses[int(question_id)] = letter
+        except (TypeError, ValueError):
+            continue
+    accepted = AttemptLayout(attempt, quiz_cache.get(quiz)).to_authored(responses)
+    
+    autosave_buffer.save(attempt.id, accepted)
+    ensure_autosave_flusher(current_app._get_current_object())
+    return {'status': 'success', 'saved': len(accepted), 'attempt_id': attempt.id}
 
 def quiz_results(attempt_id):
     if 'user_id' not in session:
@@ -851,6 +766,12 @@ def quiz_results(attempt_id):
     
     attempt = QuizAttempt.query.get_or_404(attempt_id)
     
+    # An attempt still in progress has no results yet
+    if attempt.completed_at is None:
+        if attempt.user_id == user.id:
+            return redirect(url_for('take_quiz', quiz_id=attempt.quiz_id))
+        abort(404)
+    
     # Check if user owns this attempt or is the teacher
     if attempt.user_id != user.id:
         course = Course.query.get(attempt.quiz.course_id)
@@ -896,6 +817,7 @@ def request_account_deletion():
         
         try:
             db.session.add(deletion_request)
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('Account deletion request submitted successfully. An admin will review it.', 'success')
             return redirect(url_for('profile'))
@@ -945,34 +867,26 @@ def certificates():
     # Get user's completed courses (courses with passing grades)
     completed_courses = []
     if user.role == 'student':
-        # Get all grades for the user
-        grades = Grade.query.filter_by(user_id=user.id).all()
-        
-        # Group grades by course and check if course is completed
-        course_grades = {}
-        for grade in grades:
-            if grade.course_id not in course_grades:
-                course_grades[grade.course_id] = []
-            course_grades[grade.course_id].append(grade)
-        
-        # Check which courses are completed (have passing grades)
-        for course_id, grades_list in course_grades.items():
-            if grades_list:
-                # Calculate average grade for the course
-                valid_grades = [g.score for g in grades_list if g.score is not None]
-                if valid_grades:
-                    avg_grade = sum(valid_grades) / len(valid_grades)
-                    if avg_grade >= 70:  # Passing threshold
-                        course = Course.query.get(course_id)
-                        if course:
-                            completed_courses.append({
-                                'course': course,
-                                'average_grade': avg_grade,
-                                'completed_date': max(g.graded_at for g in grades_list if g.graded_at),
-                                'certificate_id': f"CERT-{course_id}-{user.id}-{int(time.time())}"
-                            })
-    
-    return render_template('certificates.html', user=user, completed_courses=completed_courses)
+        # A course is completed once its average grade is passing
+        for summary in course_grade_summaries(user.id):
+            if summary['graded_count'] and summary['average'] >= 70:  # Passing threshold
+                completed_courses.append({
+                    'course': summary['course'],
+                    'average_grade': summary['average'],
+                    'completed_date': summary['last_graded_at'],
+                    'certificate_id': f"CERT-{summary['course'].id}-{user.id}-{int(time.time())}"
+                })
+    
+    # JSON-safe copy for the certificate viewer script
+    certificate_data = [{
+        'certificate_id': cert['certificate_id'],
+        'course': {'id': cert['course'].id, 'title': cert['course'].title},
+        'average_grade': cert['average_grade'],
+        'completed_date': cert['completed_date'].isoformat() if cert['completed_date'] else None,
+    } for cert in completed_courses]
+    
+    return render_template('certificates.html', user=user, completed_courses=completed_courses,
+                           certificate_data=certificate_data)
 
 def schedule():
     """User schedule page"""
@@ -990,16 +904,18 @@ def schedule():
     upcoming_deadlines = []
     
     if user.role == 'student':
-        # Get enrolled courses
-        enrollments = Enrollment.query.filter_by(user_id=user.id, status='active').all()
+        # Get enrolled courses and their progress in one query
+        enrollments = Enrollment.query.options(
+            joinedload(Enrollment.course)
+        ).filter_by(user_id=user.id, status='active').all()
         for enrollment in enrollments:
-            course = Course.query.get(enrollment.course_id)
+            course = enrollment.course
             if course:
                 enrolled_courses.append({
                     'course': course,
                     'enrollment': enrollment,
                     'next_session': None,  # You can implement session scheduling logic
-                    'progress': enrollment.progress
+                    'progress': enrollment.progress or 0
                 })
         
         # Get upcoming assignment deadlines
@@ -1010,12 +926,14 @@ def schedule():
         ).filter(
             Enrollment.user_id == user.id,
             Assignment.due_date > datetime.now()
+        ).options(
+            contains_eager(Assignment.course)
         ).order_by(Assignment.due_date).limit(10).all()
         
         for assignment in assignments:
             upcoming_deadlines.append({
                 'assignment': assignment,
-                'course': Course.query.get(assignment.course_id),
+                'course': assignment.course,
                 'days_remaining': (assignment.due_date - datetime.now()).days
             })
     
@@ -1,3 +1,3 @@
 #!/bin/bash
 echo "Starting EduTrack with gunicorn..."
-gunicorn app:app --bind 0.0.0.0:$PORT --workers 1 --timeout 120 
\ No newline at end of file
+gunicorn app:app --bind 0.0.0.0:$PORT --workers 1 --worker-class gthread --threads 8 --timeout 120 
\ No newline at end of file
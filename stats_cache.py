@@ -0,0 +1,80 @@
+"""
+In-process caches for expensive report queries.
+
+Each cache holds computed values for a fixed number of seconds. Code that
+changes the underlying rows calls invalidate_on_commit() before committing
+so the next reader recomputes from the committed data; if the transaction
+rolls back the cached values are left alone. The caches are per process,
+so with several workers each one may serve a value up to ``ttl`` seconds
+old after another worker's write.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# How long the admin dashboard and analytics reports may be served from cache
+REPORT_TTL_SECONDS = 300
+
+
+class TTLCache:
+    """Thread-safe key/value cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the cached value for ``key``, computing it if missing or stale"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            generation = self._generation
+
+        value = compute()
+
+        with self._lock:
+            # An invalidation that raced with compute() makes the value suspect
+            if generation == self._generation:
+                self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when none is given"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+report_cache = TTLCache(REPORT_TTL_SECONDS)
+
+# Per-course quiz summaries for the teacher's manage-quizzes page, keyed by
+# course id; quiz submissions and answer-key edits invalidate them
+quiz_summary_cache = TTLCache(REPORT_TTL_SECONDS)
+
+
+def invalidate_on_commit(cache, key=None):
+    """Invalidate ``cache`` once the current database transaction commits"""
+    from database import db
+
+    db.session.info.setdefault('invalidate_on_commit', set()).add((cache, key))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for cache, key in session.info.pop('invalidate_on_commit', ()):
+        cache.invalidate(key)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('invalidate_on_commit', None)
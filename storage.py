@@ -0,0 +1,223 @@
+"""
+Where uploaded files are kept.
+
+storage() returns the backend for the current app, chosen by the
+STORAGE_BACKEND setting:
+
+- 'local' (the default) keeps files under the upload folder.
+- 's3' keeps them in an S3-compatible bucket (AWS S3, MinIO, R2, ...), for
+  deploys whose local disk does not outlive the instance. It needs boto3,
+  which is only imported when this backend is used.
+
+Both take '/'-separated keys relative to their root, such as
+blobs/ab/cd/<sha256>. Uploads are still received and hashed in the local
+staging directory (see file_uploads); save() then moves the finished file
+in, which for S3 is a streamed upload that switches to a multipart upload
+above S3_MULTIPART_THRESHOLD. Reads are streamed, and download_url() gives
+a presigned URL when the bucket can serve a download itself, so app
+workers never proxy large files.
+"""
+
+import mimetypes
+import os
+import shutil
+from collections import namedtuple
+from urllib.parse import quote
+
+from flask import current_app
+from werkzeug.security import safe_join
+
+from file_uploads import upload_folder
+
+# S3 uploads above this size are sent in parts of S3_PART_SIZE
+DEFAULT_S3_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_S3_PART_SIZE = 16 * 1024 * 1024
+
+# How long a presigned download link stays valid
+DEFAULT_S3_PRESIGN_EXPIRES = 15 * 60
+
+StoredObject = namedtuple('StoredObject', ['key', 'size', 'modified'])
+
+
+class LocalStorage:
+    """Files in a directory on the local disk"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return f'LocalStorage({self.root!r})'
+
+    def _path(self, key):
+        # None for keys that would leave the root, e.g. ../app.py
+        return safe_join(self.root, *key.split('/'))
+
+    def local_path(self, key):
+        """Path of a stored file on this machine"""
+        path = self._path(key)
+        if path is None:
+            raise ValueError(f'Invalid storage key: {key}')
+        return path
+
+    def save(self, key, incoming):
+        """Move a finished IncomingFile in under ``key``"""
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        incoming.keep(path)
+
+    def save_path(self, key, source):
+        """Copy a local file in under ``key``, as a hard link where possible"""
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Not on the same filesystem; copy through a temporary name
+            partial = path + '.part'
+            shutil.copyfile(source, partial)
+            os.replace(partial, path)
+
+    def exists(self, key):
+        path = self._path(key)
+        return path is not None and os.path.isfile(path)
+
+    def open(self, key):
+        """A binary stream of the stored file"""
+        return open(self.local_path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix=''):
+        """StoredObjects under a key prefix such as 'blobs/'"""
+        start = self.local_path(prefix.rstrip('/')) if prefix.strip('/') else self.root
+        for directory, subdirs, names in os.walk(start):
+            # Skip the upload staging directory and other hidden ones
+            subdirs[:] = [name for name in subdirs if not name.startswith('.')]
+            for name in names:
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield StoredObject(key, stat.st_size, stat.st_mtime)
+
+    def download_url(self, key, download_name, as_attachment=False):
+        """Local files are sent by the app (or its front proxy)"""
+        return None
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, optionally under a key prefix"""
+
+    def __init__(self, client, bucket, prefix='', multipart_threshold=DEFAULT_S3_MULTIPART_THRESHOLD,
+                 part_size=DEFAULT_S3_PART_SIZE, presign_expires=DEFAULT_S3_PRESIGN_EXPIRES,
+                 presign_downloads=True):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.presign_expires = presign_expires
+        self.presign_downloads = presign_downloads
+
+    @classmethod
+    def from_config(cls, config):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND 's3' needs boto3: pip install boto3") from None
+        # Credentials come from the usual AWS_* environment variables or instance role
+        client = boto3.client('s3', endpoint_url=config.get('S3_ENDPOINT_URL') or None,
+                              region_name=config.get('S3_REGION') or None)
+        return cls(client, config['S3_BUCKET'], config.get('S3_PREFIX', ''),
+                   multipart_threshold=config.get('S3_MULTIPART_THRESHOLD', DEFAULT_S3_MULTIPART_THRESHOLD),
+                   part_size=config.get('S3_PART_SIZE', DEFAULT_S3_PART_SIZE),
+                   presign_expires=config.get('S3_PRESIGN_EXPIRES', DEFAULT_S3_PRESIGN_EXPIRES),
+                   presign_downloads=config.get('S3_PRESIGN_DOWNLOADS', True))
+
+    def __repr__(self):
+        return f"S3Storage('s3://{self.bucket}/{self.prefix}')"
+
+    def local_path(self, key):
+        return None
+
+    def save(self, key, incoming):
+        """Upload a finished IncomingFile under ``key``, then discard it"""
+        try:
+            self.save_path(key, incoming.path)
+        finally:
+            incoming.close()
+
+    def save_path(self, key, source):
+        """Upload a local file under ``key``, in parts if it is large"""
+        from boto3.s3.transfer import TransferConfig
+
+        transfer = TransferConfig(multipart_threshold=self.multipart_threshold,
+                                  multipart_chunksize=self.part_size)
+        self.client.upload_file(source, self.bucket, self.prefix + key, Config=transfer)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def open(self, key):
+        """A streaming body (read(), iter_chunks()) of the stored object"""
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def list(self, prefix=''):
+        """StoredObjects under a key prefix such as 'blobs/', a page at a time"""
+        pages = self.client.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket, Prefix=self.prefix + prefix)
+        for page in pages:
+            for item in page.get('Contents', ()):
+                yield StoredObject(item['Key'][len(self.prefix):], item['Size'],
+                                   item['LastModified'].timestamp())
+
+    def download_url(self, key, download_name, as_attachment=False):
+        """A presigned GET link that names the download, valid for presign_expires.
+
+        None when presigned downloads are turned off (S3_PRESIGN_DOWNLOADS),
+        e.g. for a bucket clients cannot reach; the app then streams the object.
+        """
+        if not self.presign_downloads:
+            return None
+        disposition = 'attachment' if as_attachment else 'inline'
+        params = {
+            'Bucket': self.bucket,
+            'Key': self.prefix + key,
+            'ResponseContentDisposition': f"{disposition}; filename*=UTF-8''{quote(download_name)}",
+            'ResponseContentType': mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+        }
+        return self.client.generate_presigned_url('get_object', Params=params,
+                                                  ExpiresIn=self.presign_expires)
+
+
+_s3_backends = {}
+
+
+def storage():
+    """The storage backend configured for the current app"""
+    config = current_app.config
+    backend = config.get('STORAGE_BACKEND') or 'local'
+    if backend == 'local':
+        return LocalStorage(upload_folder())
+    if backend != 's3':
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; use 'local' or 's3'")
+    # Clients are reused across requests; building one is slow
+    settings = (config['S3_BUCKET'], config.get('S3_PREFIX', ''), config.get('S3_ENDPOINT_URL'),
+                config.get('S3_REGION'))
+    if settings not in _s3_backends:
+        _s3_backends[settings] = S3Storage.from_config(config)
+    return _s3_backends[settings]
@@ -1,8 +1,18 @@
-from flask import render_template, request, redirect, url_for, flash, session, current_app
+from flask import render_template, request, redirect, url_for, flash, session, Response, stream_with_context
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import RequestEntityTooLarge
 from database import db
-from models import User, Course, CourseMaterial, Announcement, Assignment, AssignmentSubmission, StudyProgress, Grade, Enrollment, CourseDeletionRequest, Quiz, QuizQuestion, QuizAttempt, QuizAnswer
+from models import User, Course, CourseMaterial, Announcement, Assignment, AssignmentSubmission, StudyProgress, Grade, Enrollment, CourseDeletionRequest, Quiz, QuizQuestion, QuizAttempt
+from quiz_grading import regrade_quiz
+from file_uploads import stage_uploads, stored_name, material_upload_limit, submission_upload_limit, format_size, UploadError
+from blob_store import store_blob, release_blob
+from quiz_cache import bump_quiz_version
+from quiz_analysis import quiz_item_analysis
+from quiz_archive import export_records, archive_lines, read_records, import_archive, archive_format_for, ArchiveFormatError, ARCHIVE_FORMATS
+from grade_stats import course_average_grades, recent_grades_for_courses
+from stats_cache import report_cache, quiz_summary_cache, invalidate_on_commit
+from enrollments import remove_enrollment, remove_course_enrollments, material_added, material_removed
 from datetime import datetime
-import os
 
 def teacher_dashboard():
     if 'user_id' not in session or session.get('role') != 'teacher':
@@ -25,23 +35,22 @@ def teacher_dashboard():
     # Get teacher user object
     teacher = User.query.get(teacher_id)
     
-    # Calculate total students across all courses
-    total_students = sum(len(course.enrollments) for course in teacher_courses)
+    # Calculate total students across all courses from the enrollment counters
+    total_students = db.session.query(
+        db.func.coalesce(db.func.sum(Course.enrolled_count), 0)
+    ).filter(Course.instructor_id == teacher_id).scalar()
     
-    # Get recent grades for the teacher's courses
-    recent_grades = []
-    for course in teacher_courses:
-        grades = Grade.query.filter_by(course_id=course.id).order_by(Grade.graded_at.desc()).limit(3).all()
-        recent_grades.extend(grades)
-    
-    # Sort by graded date and limit to 5 most recent
-    recent_grades = sorted(recent_grades, key=lambda x: x.graded_at, reverse=True)[:5]
+    # Get the 5 most recent grades, taking at most 3 from any one course
+    teacher_course_ids = db.select(Course.id).where(Course.instructor_id == teacher_id)
+    recent_grades = recent_grades_for_courses(teacher_course_ids, per_course=3, limit=5)
+    course_averages = course_average_grades(teacher_course_ids)
     
     return render_template('teacher/dashboard.html', 
                          user=teacher,
                          teacher_courses=teacher_courses,
                          total_students=total_students,
                          recent_grades=recent_grades,
+                         course_averages=course_averages,
                          recent_assignments=recent_assignments,
                          pending_submissions=pending_submissions)
 
@@ -73,6 +82,7 @@ def create_course():
         
         try:
             db.session.add(course)
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('Course created successfully!', 'success')
             return redirect(url_for('teacher_dashboard'))
@@ -93,20 +103,24 @@ def manage_course(course_id):
         return redirect(url_for('teacher_dashboard'))
     
     # Get course statistics and enrolled students data
-    enrollments = course.enrollments
+    enrollments = Enrollment.query.options(
+        joinedload(Enrollment.student)
+    ).filter_by(course_id=course_id).order_by(Enrollment.id).all()
     assignments = Assignment.query.filter_by(course_id=course_id).all()
     materials = CourseMaterial.query.filter_by(course_id=course_id).order_by(CourseMaterial.order_index).all()
     
+    # Load every grade in the course at once and group them by student
+    grades_by_student = {}
+    for grade in Grade.query.filter_by(course_id=course_id).all():
+        grades_by_student.setdefault(grade.user_id, []).append(grade)
+    
     # Prepare enrolled students data with grades for the template
     enrolled_students_data = []
     for enrollment in enrollments:
-        student = enrollment.student
-        # Get grades for this student in this course
-        grades = Grade.query.filter_by(user_id=student.id, course_id=course_id).all()
         enrolled_students_data.append({
-            'student': student,
+            'student': enrollment.student,
             'enrollment': enrollment,
-            'grades': grades
+            'grades': grades_by_student.get(enrollment.user_id, [])
         })
     
     return render_template('teacher/manage_course.html',
@@ -125,46 +139,42 @@ def upload_material(course_id):
         flash('Access denied. You can only upload materials to your own courses.', 'danger')
         return redirect(url_for('teacher_dashboard'))
     
+    upload_limit = material_upload_limit(course_id)
     if request.method == 'POST':
-        title = request.form['title'].strip()
-        description = request.form['description'].strip()
-        order_index = int(request.form.get('order_index', 0))
+        # Files stream to disk in chunks, capped at what the course may still store
+        stage_uploads(upload_limit)
+        try:
+            form, files = request.form, request.files
+        except RequestEntityTooLarge:
+            flash(f'That file is too large. This course can take files of up to {format_size(upload_limit)}.', 'danger')
+            return _upload_material_form(course, upload_limit)
+        
+        title = form['title'].strip()
+        description = form['description'].strip()
+        order_index = int(form.get('order_index', 0))
         
         if not title:
             flash('Title is required', 'danger')
-            return render_template('teacher/upload_material.html', course=course)
+            return _upload_material_form(course, upload_limit)
         
         # Handle file upload
         file_path = None
         file_type = None
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and file.filename:
-                # Create uploads directory if it doesn't exist
-                upload_dir = os.path.join(current_app.root_path, 'uploads')
-                if not os.path.exists(upload_dir):
-                    os.makedirs(upload_dir)
-                
-                # Generate unique filename
-                filename = f"{course_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-                file_path = os.path.join(upload_dir, filename)
-                file_type = file.filename.split('.')[-1].lower() if '.' in file.filename else 'unknown'
-                
-                # Save the file
-                try:
-                    file.save(file_path)
-                    # Store relative path for database
-                    file_path = f"uploads/{filename}"
-                    
-                    # Debug: Print file information
-                    print(f"DEBUG: File saved successfully")
-                    print(f"DEBUG: Full file path: {file_path}")
-                    print(f"DEBUG: File type: {file_type}")
-                    print(f"DEBUG: File exists: {os.path.exists(file_path)}")
-                    
-                except Exception as e:
-                    flash(f'Error saving file: {str(e)}', 'danger')
-                    return render_template('teacher/upload_material.html', course=course)
+        stored = None
+        file = files.get('file')
+        if file and file.filename:
+            # Generate unique filename
+            filename = stored_name(f"{course_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}", file.filename)
+            file_type = file.filename.split('.')[-1].lower() if '.' in file.filename else 'unknown'
+            
+            # Keep the streamed file in the blob store, once per distinct content
+            try:
+                stored = store_blob(file, max_bytes=upload_limit)
+                # The stored name is what downloads are named after
+                file_path = f"uploads/{filename}"
+            except (UploadError, OSError) as e:
+                flash(f'Error saving file: {str(e)}', 'danger')
+                return _upload_material_form(course, upload_limit)
         
         material = CourseMaterial(
             course_id=course_id,
@@ -172,20 +182,55 @@ def upload_material(course_id):
             description=description,
             file_path=file_path,
             file_type=file_type,
+            file_size=stored.size if stored else None,
+            sha256=stored.sha256 if stored else None,
             uploaded_by=session['user_id'],
             order_index=order_index
         )
         
         try:
             db.session.add(material)
+            material_added(course_id)
             db.session.commit()
             flash('Material uploaded successfully!', 'success')
             return redirect(url_for('manage_course', course_id=course_id))
         except Exception as e:
+            # A newly stored blob has no row now; the blob collector removes it
             db.session.rollback()
             flash('An error occurred while uploading the material.', 'danger')
     
-    return render_template('teacher/upload_material.html', course=course)
+    return _upload_material_form(course, upload_limit)
+
+def _upload_material_form(course, upload_limit):
+    return render_template('teacher/upload_material.html', course=course,
+                           max_size=format_size(upload_limit))
+
+def delete_material(material_id):
+    """Delete a course material along with its study progress records"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        flash('Access denied. Teacher login required.', 'danger')
+        return redirect(url_for('login'))
+    
+    material = CourseMaterial.query.get_or_404(material_id)
+    course = material.course
+    
+    if course.instructor_id != session['user_id']:
+        flash('Access denied. You can only delete materials from your own courses.', 'danger')
+        return redirect(url_for('teacher_dashboard'))
+    
+    try:
+        # Adjust enrollment progress while the completion records still exist
+        material_removed(course.id, material.id)
+        StudyProgress.query.filter_by(material_id=material.id).delete(synchronize_session=False)
+        release_blob(material.sha256)
+        db.session.delete(material)
+        db.session.commit()
+        flash(f'Material "{material.title}" deleted successfully!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while deleting the material.', 'danger')
+    
+    return redirect(url_for('manage_course', course_id=course.id))
 
 def create_assignment(course_id):
     if 'user_id' not in session or session.get('role') != 'teacher':
@@ -204,16 +249,17 @@ def create_assignment(course_id):
         max_score = float(request.form['max_score'])
         assignment_type = request.form['assignment_type']
         instructions = request.form['instructions'].strip()
+        max_file_bytes = _max_file_bytes(request.form)
         
         if not all([title, description, due_date_str, max_score]):
             flash('Title, description, due date, and max score are required', 'danger')
-            return render_template('teacher/create_assignment.html', course=course)
+            return _create_assignment_form(course)
         
         try:
             due_date = datetime.strptime(due_date_str, '%Y-%m-%dT%H:%M')
         except ValueError:
             flash('Invalid due date format', 'danger')
-            return render_template('teacher/create_assignment.html', course=course)
+            return _create_assignment_form(course)
         
         assignment = Assignment(
             course_id=course_id,
@@ -223,6 +269,7 @@ def create_assignment(course_id):
             max_score=max_score,
             assignment_type=assignment_type,
             instructions=instructions,
+            max_file_bytes=max_file_bytes,
             created_by=session['user_id']
         )
         
@@ -235,7 +282,19 @@ def create_assignment(course_id):
             db.session.rollback()
             flash('An error occurred while creating the assignment.', 'danger')
     
-    return render_template('teacher/create_assignment.html', course=course)
+    return _create_assignment_form(course)
+
+def _create_assignment_form(course):
+    return render_template('teacher/create_assignment.html', course=course,
+                           default_max_size=format_size(submission_upload_limit()))
+
+def _max_file_bytes(form):
+    """The submission size limit from the assignment form, or None for the default"""
+    try:
+        megabytes = float(form.get('max_file_mb') or 0)
+    except ValueError:
+        return None
+    return int(megabytes * 1024 * 1024) if megabytes > 0 else None
 
 def grade_assignment(submission_id=None, course_id=None, student_id=None):
     if 'user_id' not in session or session.get('role') != 'teacher':
@@ -414,7 +473,7 @@ def unenroll_student(course_id, student_id):
         ).delete()
         
         # Delete enrollment
-        db.session.delete(enrollment)
+        remove_enrollment(enrollment)
         db.session.commit()
         
         flash(f'Student {student.first_name} {student.last_name} has been unenrolled from {course.title}.', 'success')
@@ -469,10 +528,9 @@ def unenroll_all_students(course_id):
                     user_id=student_id,
                     course_id=course_id
                 ).delete()
-                
-                # Delete enrollment
-                db.session.delete(enrollment)
             
+            # Delete the enrollments and release their seats
+            remove_course_enrollments(course_id)
             db.session.commit()
             flash(f'Successfully unenrolled {student_count} student(s) from {course.title}.', 'success')
             
@@ -519,6 +577,7 @@ def request_course_deletion(course_id):
         
         try:
             db.session.add(deletion_request)
+            invalidate_on_commit(report_cache)
             db.session.commit()
             flash('Course deletion request submitted successfully. An admin will review it.', 'success')
             return redirect(url_for('manage_course', course_id=course_id))
@@ -541,7 +600,7 @@ def delete_course(course_id):
     
     if request.method == 'POST':
         # Check if there are enrolled students
-        if len(course.enrollments) > 0:
+        if course.get_enrolled_count() > 0:
             flash('Cannot delete course with enrolled students. Please unenroll all students first.', 'danger')
             return redirect(url_for('manage_course', course_id=course_id))
         
@@ -566,6 +625,7 @@ def delete_course(course_id):
             
             # Delete the course itself
             db.session.delete(course)
+            invalidate_on_commit(report_cache)
             db.session.commit()
             
             flash(f'Course "{course_title}" has been deleted successfully.', 'success')
@@ -592,27 +652,54 @@ def manage_quizzes(course_id):
         flash('Access denied. You can only manage quizzes for your own courses.', 'danger')
         return redirect(url_for('teacher_dashboard'))
     
-    # Get all quizzes for this course with attempt statistics
-    quizzes = Quiz.query.filter_by(course_id=course_id).order_by(Quiz.created_at.desc()).all()
-    
-    quiz_stats = []
-    for quiz in quizzes:
-        attempts = QuizAttempt.query.filter_by(quiz_id=quiz.id).all()
-        total_attempts = len(attempts)
-        passed_attempts = len([a for a in attempts if a.passed])
-        avg_score = sum([a.percentage for a in attempts]) / total_attempts if total_attempts > 0 else 0
-        
-        quiz_stats.append({
-            'quiz': quiz,
-            'total_attempts': total_attempts,
-            'passed_attempts': passed_attempts,
-            'avg_score': round(avg_score, 1)
-        })
+    # Attempt statistics for every quiz in one grouped query, cached per course
+    quiz_stats = quiz_summary_cache.get(course_id, lambda: _course_quiz_summaries(course_id))
     
     return render_template('teacher/manage_quizzes.html', 
                          course=course, 
                          quiz_stats=quiz_stats)
 
+def _course_quiz_summaries(course_id):
+    """Attempts, passes, average score and question count per quiz, newest quiz first"""
+    attempt_totals = db.select(
+        QuizAttempt.quiz_id,
+        db.func.count(QuizAttempt.id).label('total_attempts'),
+        db.func.count(db.case((QuizAttempt.passed, 1))).label('passed_attempts'),
+        db.func.avg(QuizAttempt.percentage).label('avg_score')
+    ).where(QuizAttempt.completed_at.isnot(None)).group_by(QuizAttempt.quiz_id).subquery()
+    question_counts = db.select(
+        QuizQuestion.quiz_id,
+        db.func.count(QuizQuestion.id).label('question_count')
+    ).group_by(QuizQuestion.quiz_id).subquery()
+    
+    rows = db.session.execute(
+        db.select(Quiz,
+                  attempt_totals.c.total_attempts,
+                  attempt_totals.c.passed_attempts,
+                  attempt_totals.c.avg_score,
+                  question_counts.c.question_count)
+        .outerjoin(attempt_totals, attempt_totals.c.quiz_id == Quiz.id)
+        .outerjoin(question_counts, question_counts.c.quiz_id == Quiz.id)
+        .where(Quiz.course_id == course_id)
+        .order_by(Quiz.created_at.desc())
+    ).all()
+    
+    # Plain dicts, so the cached copy does not hold on to ORM objects
+    return [{
+        'quiz': {
+            'id': quiz.id,
+            'title': quiz.title,
+            'created_at': quiz.created_at,
+            'time_limit_minutes': quiz.time_limit_minutes,
+            'passing_score': quiz.passing_score,
+            'is_active': quiz.is_active,
+        },
+        'question_count': question_count or 0,
+        'total_attempts': total_attempts or 0,
+        'passed_attempts': passed_attempts or 0,
+        'avg_score': round(avg_score or 0, 1),
+    } for quiz, total_attempts, passed_attempts, avg_score, question_count in rows]
+
 def quiz_results_overview(quiz_id):
     """View all student results for a specific quiz"""
     if 'user_id' not in session or session.get('role') != 'teacher':
@@ -626,25 +713,101 @@ def quiz_results_overview(quiz_id):
         flash('Access denied. You can only view results for quizzes in your own courses.', 'danger')
         return redirect(url_for('teacher_dashboard'))
     
-    # Get all attempts for this quiz with student details
-    attempts = QuizAttempt.query.filter_by(quiz_id=quiz_id).order_by(QuizAttempt.completed_at.desc()).all()
-    
-    # Calculate quiz statistics
-    total_attempts = len(attempts)
-    passed_attempts = len([a for a in attempts if a.passed])
-    avg_score = sum([a.percentage for a in attempts]) / total_attempts if total_attempts > 0 else 0
-    highest_score = max([a.percentage for a in attempts]) if attempts else 0
-    lowest_score = min([a.percentage for a in attempts]) if attempts else 0
+    # One page of completed attempts with student details; the statistics
+    # below never read this list
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
+    attempts_pagination = QuizAttempt.query.options(joinedload(QuizAttempt.user)).filter(
+        QuizAttempt.quiz_id == quiz_id,
+        QuizAttempt.completed_at.isnot(None)
+    ).order_by(QuizAttempt.completed_at.desc(), QuizAttempt.id.desc()).paginate(
+        page=page,
+        per_page=per_page,
+        error_out=False
+    )
+    
+    # Summary, score bands and per-question statistics from cached aggregates
+    analysis = quiz_item_analysis(quiz)
+    summary = analysis['summary']
     
     return render_template('teacher/quiz_results_overview.html',
                          quiz=quiz,
                          course=course,
-                         attempts=attempts,
-                         total_attempts=total_attempts,
-                         passed_attempts=passed_attempts,
-                         avg_score=round(avg_score, 1),
-                         highest_score=round(highest_score, 1),
-                         lowest_score=round(lowest_score, 1))
+                         attempts=attempts_pagination.items,
+                         pagination=attempts_pagination,
+                         total_attempts=summary['attempts'],
+                         passed_attempts=summary['passed'],
+                         avg_score=summary['average'],
+                         highest_score=summary['highest'],
+                         lowest_score=summary['lowest'],
+                         score_bands=analysis['bands'],
+                         item_analysis=analysis['items'])
+
+def export_quizzes(course_id):
+    """Download a course's quizzes, or one of them, with all attempts and answers"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        flash('Access denied. Teacher login required.', 'danger')
+        return redirect(url_for('login'))
+    
+    course = Course.query.get_or_404(course_id)
+    if course.instructor_id != session['user_id']:
+        flash('Access denied. You can only export quizzes from your own courses.', 'danger')
+        return redirect(url_for('teacher_dashboard'))
+    
+    archive_format = request.args.get('format', 'jsonl')
+    if archive_format not in ARCHIVE_FORMATS:
+        archive_format = 'jsonl'
+    query = db.select(Quiz.id).where(Quiz.course_id == course_id)
+    quiz_id = request.args.get('quiz_id', type=int)
+    if quiz_id is not None:
+        query = query.where(Quiz.id == quiz_id)
+    quiz_ids = db.session.scalars(query).all()
+    
+    # Rows are read and written a chunk at a time while the response streams
+    filename = f'course-{course_id}-quizzes.{archive_format}'
+    return Response(
+        stream_with_context(archive_lines(export_records(quiz_ids), archive_format)),
+        mimetype='text/csv' if archive_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def import_quizzes(course_id):
+    """Import quizzes with their attempts from an uploaded archive"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        flash('Access denied. Teacher login required.', 'danger')
+        return redirect(url_for('login'))
+    
+    course = Course.query.get_or_404(course_id)
+    if course.instructor_id != session['user_id']:
+        flash('Access denied. You can only import quizzes into your own courses.', 'danger')
+        return redirect(url_for('teacher_dashboard'))
+    
+    archive = request.files.get('archive')
+    if not archive or not archive.filename:
+        flash('Please choose a quiz archive to import', 'danger')
+        return redirect(url_for('manage_quizzes', course_id=course_id))
+    
+    try:
+        records = read_records(archive.stream, archive_format_for(archive.filename))
+        counts = import_archive(records, course_id)
+        invalidate_on_commit(quiz_summary_cache, course_id)
+        invalidate_on_commit(report_cache)
+        db.session.commit()
+        message = (f'Imported {counts["quizzes"]} quizzes with {counts["questions"]} questions, '
+                   f'{counts["attempts"]} attempts and {counts["answers"]} answers.')
+        unknown = counts['skipped_attempts'] - counts['open_attempts']
+        if unknown:
+            message += f' {unknown} attempts by unknown students were skipped.'
+        if counts['open_attempts']:
+            message += f' {counts["open_attempts"]} unfinished attempts were skipped.'
+        flash(message, 'success')
+    except ArchiveFormatError as e:
+        db.session.rollback()
+        flash(f'Could not import the archive. {e}', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error importing quizzes: {str(e)}', 'danger')
+    
+    return redirect(url_for('manage_quizzes', course_id=course_id))
 
 def edit_quiz_answers(quiz_id):
     """Edit correct answers and scoring for a quiz"""
@@ -671,29 +834,11 @@ def edit_quiz_answers(quiz_id):
                     question.correct_answer = correct_answer
                     question.points = points
             
-            # Recalculate all existing attempts with new answers
-            attempts = QuizAttempt.query.filter_by(quiz_id=quiz_id).all()
-            for attempt in attempts:
-                total_score = 0
-                max_score = 0
-                
-                for answer in attempt.answers:
-                    question = answer.question
-                    max_score += question.points
-                    
-                    if answer.selected_answer == question.correct_answer:
-                        answer.is_correct = True
-                        answer.points_earned = question.points
-                        total_score += question.points
-                    else:
-                        answer.is_correct = False
-                        answer.points_earned = 0
-                
-                # Update attempt scores
-                attempt.score = total_score
-                attempt.max_score = max_score
-                attempt.percentage = (total_score / max_score * 100) if max_score > 0 else 0
-                attempt.passed = attempt.percentage >= quiz.passing_score
+            # Re-grade all existing attempts and their grades with the new answers
+            regrade_quiz(quiz)
+            # Cached question lists, answer keys and summaries are now stale
+            bump_quiz_version(quiz)
+            invalidate_on_commit(quiz_summary_cache, quiz.course_id)
             
             db.session.commit()
             flash('Quiz answers updated successfully! All existing attempts have been re-graded.', 'success')
@@ -721,6 +866,8 @@ def delete_quiz(quiz_id):
     if request.method == 'POST':
         quiz_title = quiz.title
         try:
+            bump_quiz_version(quiz)
+            invalidate_on_commit(quiz_summary_cache, quiz.course_id)
             db.session.delete(quiz)
             db.session.commit()
             flash(f'Quiz "{quiz_title}" has been deleted successfully.', 'success')
@@ -775,16 +922,17 @@ def edit_assignment(assignment_id):
         assignment_type = request.form['assignment_type']
         instructions = request.form['instructions'].strip()
         is_active = 'is_active' in request.form
+        max_file_bytes = _max_file_bytes(request.form)
         
         if not all([title, description, due_date_str, max_score]):
             flash('Title, description, due date, and max score are required', 'danger')
-            return render_template('teacher/edit_assignment.html', assignment=assignment, course=course)
+            return _edit_assignment_form(assignment, course)
         
         try:
             due_date = datetime.strptime(due_date_str, '%Y-%m-%dT%H:%M')
         except ValueError:
             flash('Invalid due date format', 'danger')
-            return render_template('teacher/edit_assignment.html', assignment=assignment, course=course)
+            return _edit_assignment_form(assignment, course)
         
         # Update assignment
         assignment.title = title
@@ -794,6 +942,7 @@ def edit_assignment(assignment_id):
         assignment.assignment_type = assignment_type
         assignment.instructions = instructions
         assignment.is_active = is_active
+        assignment.max_file_bytes = max_file_bytes
         
         try:
             db.session.commit()
@@ -803,7 +952,11 @@ def edit_assignment(assignment_id):
             db.session.rollback()
             flash('An error occurred while updating the assignment.', 'danger')
     
-    return render_template('teacher/edit_assignment.html', assignment=assignment, course=course)
+    return _edit_assignment_form(assignment, course)
+
+def _edit_assignment_form(assignment, course):
+    return render_template('teacher/edit_assignment.html', assignment=assignment, course=course,
+                           default_max_size=format_size(submission_upload_limit()))
 
 def delete_assignment(assignment_id):
     """Delete an assignment and all its submissions"""
@@ -826,6 +979,7 @@ def delete_assignment(assignment_id):
             # Delete the assignment
             db.session.delete(assignment)
             db.session.commit()
+            # Submission files are released when the collector recounts references
             
             flash(f'Assignment "{assignment.title}" deleted successfully!', 'success')
             return redirect(url_for('manage_assignments', course_id=course.id))
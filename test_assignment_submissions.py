@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for streamed, size-capped assignment submission files
+"""
+
+import hashlib
+import io
+import os
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+from blob_store import blob_key
+from database import db
+from isolated_app import login_as
+from models import User, Assignment, AssignmentSubmission, Blob
+from storage import storage
+
+KB = 1024
+
+
+@pytest.fixture
+def submit(isolated_app, tmp_path, seed_course):
+    isolated_app.config.update(UPLOAD_FOLDER=str(tmp_path), ASSIGNMENT_MAX_BYTES=256 * KB)
+    with isolated_app.app_context():
+        teacher, student, course = seed_course()
+        assignment = Assignment(course_id=course.id, title='Essay', description='Write it',
+                                due_date=datetime.utcnow() + timedelta(days=1),
+                                created_by=teacher.id)
+        db.session.add(assignment)
+        db.session.commit()
+        client = isolated_app.test_client()
+        login_as(client, student)
+
+        def post(data, filename='essay.pdf', text=''):
+            return client.post(f'/submit/{assignment.id}', data={
+                'submission_text': text, 'file': (data if hasattr(data, 'read') else io.BytesIO(data), filename),
+            }, content_type='multipart/form-data')
+
+        yield post, assignment.id
+
+
+def test_submitted_file_is_stored_with_size_and_hash(isolated_app, submit):
+    post, assignment_id = submit
+    data = os.urandom(100 * KB)
+    assert post(data, 'my essay.pdf').status_code == 302
+
+    submission = db.session.scalars(db.select(AssignmentSubmission)).one()
+    assert submission.status == 'submitted'
+    assert submission.file_size == len(data)
+    assert submission.sha256 == hashlib.sha256(data).hexdigest()
+    assert submission.file_path.startswith(f'uploads/{assignment_id}_') and submission.file_path.endswith('_my_essay.pdf')
+    assert db.session.get(Blob, submission.sha256).ref_count == 1
+
+    # The student and the course instructor can download it
+    url = f'/submission/{submission.id}/file'
+    for user_id in (submission.user_id, submission.assignment.course.instructor_id):
+        client = isolated_app.test_client()
+        login_as(client, db.session.get(User, user_id))
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data == data
+
+
+def test_submission_files_are_private(isolated_app, submit, make_user):
+    post, assignment_id = submit
+    post(b'my answers', 'answers.txt')
+    submission = db.session.scalars(db.select(AssignmentSubmission)).one()
+    classmate = make_user('classmate', 'student')
+    db.session.commit()
+
+    anonymous = isolated_app.test_client()
+    other = isolated_app.test_client()
+    login_as(other, classmate)
+    for client in (anonymous, other):
+        assert client.get(f'/submission/{submission.id}/file').status_code == 404
+        # Nor through the public upload route, by its stored name
+        assert client.get('/' + submission.file_path).status_code == 404
+
+
+def test_files_over_the_assignment_limit_are_refused(isolated_app, submit):
+    post, assignment_id = submit
+    response = post(os.urandom(300 * KB))
+    assert response.status_code == 200
+    assert b'larger than 256.0 KB' in response.data
+    assert b'Max size: 256.0 KB' in response.data
+    assert post(os.urandom(400 * KB)).status_code == 200
+
+    # A per-assignment limit overrides the default
+    db.session.get(Assignment, assignment_id).max_file_bytes = 512 * KB
+    db.session.commit()
+    assert post(os.urandom(300 * KB)).status_code == 302
+    assert db.session.scalars(db.select(AssignmentSubmission.file_size)).one() == 300 * KB
+    assert os.listdir(os.path.join(isolated_app.config['UPLOAD_FOLDER'], '.incoming')) == []
+
+
+def test_late_submissions_are_marked_late(isolated_app, submit):
+    post, assignment_id = submit
+    db.session.get(Assignment, assignment_id).due_date = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+    assert post(b'', filename='', text='Sorry, it is late').status_code == 302
+    submission = db.session.scalars(db.select(AssignmentSubmission)).one()
+    assert submission.status == 'late'
+    assert submission.file_path is None
+
+
+def test_submission_memory_does_not_grow_with_file_size(isolated_app, submit, tmp_path):
+    post, assignment_id = submit
+    db.session.get(Assignment, assignment_id).max_file_bytes = 64 * 1024 * KB
+    db.session.commit()
+    source = tmp_path / 'project.zip'
+    with open(source, 'wb') as out:
+        for _ in range(32):
+            out.write(os.urandom(1024 * KB))
+
+    with open(source, 'rb') as project:
+        tracemalloc.start()
+        response = post(project, 'project.zip')
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    assert response.status_code == 302
+    digest = db.session.scalars(db.select(AssignmentSubmission.sha256)).one()
+    assert storage().exists(blob_key(digest))
+    assert peak < 4 * 1024 * KB
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed blob store
+"""
+
+import hashlib
+import io
+import os
+import time
+from datetime import datetime
+
+from werkzeug.datastructures import FileStorage
+
+from blob_store import blob_key, store_blob, collect_garbage, fold_legacy_uploads, ORPHAN_GRACE_SECONDS
+from database import db
+from isolated_app import login_as
+from models import Blob, CourseMaterial, Assignment, AssignmentSubmission
+from storage import storage
+
+
+def _blob_files(folder):
+    return [name for _, _, names in os.walk(os.path.join(folder, 'blobs')) for name in names]
+
+
+def test_identical_uploads_share_one_blob(isolated_app, teacher_client, upload_material):
+    client, course_id, student = teacher_client
+    data = os.urandom(4096)
+    digest = hashlib.sha256(data).hexdigest()
+
+    assert upload_material(client, course_id, data, 'week1.pdf').status_code == 302
+    assert upload_material(client, course_id, data, 'week1-again.pdf').status_code == 302
+
+    assert _blob_files(isolated_app.config['UPLOAD_FOLDER']) == [digest]
+    assert db.session.get(Blob, digest).ref_count == 2
+    materials = db.session.scalars(db.select(CourseMaterial).order_by(CourseMaterial.id)).all()
+    assert [material.sha256 for material in materials] == [digest, digest]
+
+    # Each material still downloads under its own name
+    student_client = isolated_app.test_client()
+    login_as(student_client, student)
+    response = student_client.get(f'/download-material/{materials[1].id}')
+    assert response.data == data
+    assert 'week1-again.pdf' in response.headers['Content-Disposition']
+    response = student_client.get('/' + materials[0].file_path)
+    assert response.data == data
+
+
+def test_reference_is_taken_at_commit_after_the_bytes_are_stored(isolated_app, teacher_client):
+    data = b'reading list'
+    digest = hashlib.sha256(data).hexdigest()
+    stored = store_blob(FileStorage(io.BytesIO(data), 'list.txt'))
+    assert storage().exists(stored.key)
+    # Nothing is written to the database until the caller commits
+    assert db.session.get(Blob, digest) is None
+    db.session.commit()
+    assert db.session.get(Blob, digest).ref_count == 1
+
+    # Same bytes again; the stored copy disappears before the commit
+    store_blob(FileStorage(io.BytesIO(data), 'list-again.txt'))
+    storage().delete(blob_key(digest))
+    db.session.commit()
+    assert db.session.get(Blob, digest).ref_count == 2
+    with storage().open(blob_key(digest)) as stored_file:
+        assert stored_file.read() == data
+
+    # A rolled back upload takes no reference and leaves no staging files
+    store_blob(FileStorage(io.BytesIO(data), 'list-third.txt'))
+    db.session.rollback()
+    db.session.commit()
+    assert db.session.get(Blob, digest).ref_count == 2
+    assert os.listdir(os.path.join(isolated_app.config['UPLOAD_FOLDER'], '.incoming')) == []
+
+
+def test_blob_is_collected_after_its_last_reference_goes(isolated_app, teacher_client, upload_material):
+    client, course_id, student = teacher_client
+    data = b'shared handout'
+    digest = hashlib.sha256(data).hexdigest()
+    upload_material(client, course_id, data)
+    upload_material(client, course_id, data)
+    first, second = db.session.scalars(db.select(CourseMaterial.id).order_by(CourseMaterial.id)).all()
+
+    client.post(f'/teacher/delete-material/{first}')
+    assert db.session.get(Blob, digest).ref_count == 1
+    assert collect_garbage() == (0, 0)
+    assert storage().exists(blob_key(digest))
+
+    # Removed without going through release_blob(), as a course cascade would
+    db.session.execute(db.delete(CourseMaterial).where(CourseMaterial.id == second))
+    db.session.commit()
+    assert collect_garbage() == (1, 0)
+    assert not storage().exists(blob_key(digest))
+    assert db.session.get(Blob, digest) is None
+
+
+def test_blobs_still_in_use_are_kept_whatever_their_count(isolated_app, teacher_client, upload_material):
+    client, course_id, student = teacher_client
+    data = b'slides in use'
+    digest = hashlib.sha256(data).hexdigest()
+    upload_material(client, course_id, data)
+    # A count that missed a committed reference, as a stale recount would leave it
+    db.session.get(Blob, digest).ref_count = 0
+    db.session.commit()
+
+    assert collect_garbage() == (0, 0)
+    assert storage().exists(blob_key(digest))
+    assert db.session.get(Blob, digest).ref_count == 1
+
+
+def test_orphaned_blob_files_are_removed_after_the_grace_period(isolated_app, teacher_client):
+    orphan = storage().local_path(blob_key('ab' * 32))
+    os.makedirs(os.path.dirname(orphan))
+    with open(orphan, 'wb') as out:
+        out.write(b'left by a rolled back upload')
+
+    assert collect_garbage() == (0, 0)
+    assert collect_garbage(now=time.time() + ORPHAN_GRACE_SECONDS + 1) == (0, 1)
+    assert not os.path.exists(orphan)
+
+
+def test_legacy_uploads_are_folded_into_the_store(isolated_app, teacher_client):
+    client, course_id, student = teacher_client
+    folder = isolated_app.config['UPLOAD_FOLDER']
+    data = b'the same syllabus'
+    for name in ('a_syllabus.pdf', 'b_syllabus.pdf'):
+        with open(os.path.join(folder, name), 'wb') as out:
+            out.write(data)
+        db.session.add(CourseMaterial(course_id=course_id, title=name, file_path=f'uploads/{name}',
+                                      file_type='pdf', uploaded_by=student.id))
+    db.session.add(CourseMaterial(course_id=course_id, title='gone', file_path='uploads/gone.pdf',
+                                  file_type='pdf', uploaded_by=student.id))
+    # A submission of the same file
+    with open(os.path.join(folder, 'c_essay.pdf'), 'wb') as out:
+        out.write(data)
+    assignment = Assignment(course_id=course_id, title='Essay', description='Essay',
+                            due_date=datetime(2030, 1, 1), created_by=student.id)
+    db.session.add(assignment)
+    db.session.flush()
+    db.session.add(AssignmentSubmission(assignment_id=assignment.id, user_id=student.id,
+                                        file_path='uploads/c_essay.pdf'))
+    db.session.commit()
+
+    report = fold_legacy_uploads(dry_run=True)
+    assert report == {'files': 3, 'missing': 1, 'duplicates': 2,
+                      'bytes_before': 3 * len(data), 'bytes_after': len(data)}
+    assert os.path.exists(os.path.join(folder, 'a_syllabus.pdf'))
+
+    assert fold_legacy_uploads(batch_size=1) == report
+    digest = hashlib.sha256(data).hexdigest()
+    assert sorted(os.listdir(folder)) == ['blobs']
+    assert _blob_files(folder) == [digest]
+    assert db.session.get(Blob, digest).ref_count == 3
+    sizes = db.session.execute(
+        db.select(CourseMaterial.sha256, CourseMaterial.file_size).where(CourseMaterial.title != 'gone')
+    ).all()
+    assert sizes == [(digest, len(data))] * 2
+    assert db.session.execute(
+        db.select(AssignmentSubmission.sha256, AssignmentSubmission.file_size)
+    ).one() == (digest, len(data))
+
+    # Nothing is left to fold
+    assert fold_legacy_uploads()['files'] == 0
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Stress test: many students racing for the last seats of a course must never
+push it over max_students, and duplicate clicks must not double-enroll.
+"""
+
+import threading
+
+import pytest
+
+from database import db
+from enrollments import enroll_student, ENROLLED, ALREADY_ENROLLED, COURSE_FULL
+from models import Course, Enrollment
+
+SEATS = 10
+STUDENTS = 40
+CLICKS_PER_STUDENT = 2
+
+
+@pytest.fixture
+def seed_registration(make_user, make_course):
+    """Factory for a course of SEATS seats and STUDENTS students. Returns their ids."""
+    def seed_registration():
+        teacher = make_user('teacher', 'teacher', first_name='Sarah', last_name='Johnson')
+        students = [make_user(f'student{i}', 'student') for i in range(STUDENTS)]
+        db.session.flush()
+        course = make_course(teacher, title='Registration Day', duration_weeks=8,
+                             max_students=SEATS)
+        db.session.commit()
+        return course.id, [student.id for student in students]
+    return seed_registration
+
+
+def test_concurrent_enrollment_never_exceeds_capacity(isolated_app, seed_registration):
+    with isolated_app.app_context():
+        course_id, student_ids = seed_registration()
+
+    outcomes = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(STUDENTS * CLICKS_PER_STUDENT)
+
+    def click(user_id):
+        with isolated_app.app_context():
+            start.wait()
+            try:
+                outcome = enroll_student(user_id, course_id)
+            except Exception as e:
+                db.session.rollback()
+                with lock:
+                    errors.append(e)
+                return
+            finally:
+                db.session.remove()
+            with lock:
+                outcomes.append((user_id, outcome))
+
+    threads = [threading.Thread(target=click, args=(user_id,))
+               for user_id in student_ids for _ in range(CLICKS_PER_STUDENT)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+
+    enrolled = [user_id for user_id, outcome in outcomes if outcome == ENROLLED]
+    assert len(enrolled) == SEATS
+    assert len(set(enrolled)) == SEATS
+    assert all(outcome in (ENROLLED, ALREADY_ENROLLED, COURSE_FULL) for _, outcome in outcomes)
+
+    with isolated_app.app_context():
+        rows = Enrollment.query.filter_by(course_id=course_id).all()
+        course = db.session.get(Course, course_id)
+        assert len(rows) == SEATS
+        assert sorted(row.user_id for row in rows) == sorted(enrolled)
+        assert course.enrolled_count == SEATS
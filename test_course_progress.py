@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the incrementally maintained Enrollment.progress counters
+"""
+
+import pytest
+
+from database import db
+from enrollments import recompute_progress
+from isolated_app import login_as
+from models import CourseMaterial, Enrollment, StudyProgress
+
+
+@pytest.fixture
+def seed_course(make_user, make_course):
+    """Factory for a teacher, a student and an empty course. Returns all three."""
+    def seed_course():
+        teacher = make_user('teacher', 'teacher')
+        student = make_user('student', 'student')
+        db.session.flush()
+        course = make_course(teacher, title='Progress 101')
+        db.session.commit()
+        return teacher, student, course
+    return seed_course
+
+
+def _enrollment(student, course):
+    return Enrollment.query.filter_by(user_id=student.id, course_id=course.id).one()
+
+
+def test_progress_follows_materials_and_completion(isolated_app, seed_course):
+    with isolated_app.app_context():
+        teacher, student, course = seed_course()
+        client = isolated_app.test_client()
+
+        login_as(client, teacher)
+        for i in range(4):
+            client.post(f'/teacher/upload-material/{course.id}',
+                        data={'title': f'Week {i}', 'description': '', 'order_index': i})
+        materials = CourseMaterial.query.filter_by(course_id=course.id).order_by(CourseMaterial.id).all()
+        assert len(materials) == 4
+
+        login_as(client, student)
+        client.get(f'/enroll/{course.id}')
+        enrollment = _enrollment(student, course)
+        assert (enrollment.completed_materials, enrollment.total_materials) == (0, 4)
+
+        for material in materials[:2]:
+            client.post(f'/study/{material.id}/complete', data={'action': 'mark_complete'})
+        # Marking an already completed material again must not double count
+        client.post(f'/study/{materials[0].id}/complete', data={'action': 'mark_complete'})
+        enrollment = _enrollment(student, course)
+        assert (enrollment.completed_materials, enrollment.total_materials) == (2, 4)
+        assert enrollment.progress == 50.0
+
+        client.post(f'/study/{materials[1].id}/complete', data={'action': 'mark_incomplete'})
+        assert _enrollment(student, course).progress == 25.0
+
+        login_as(client, teacher)
+        client.post(f'/teacher/delete-material/{materials[0].id}')
+        enrollment = _enrollment(student, course)
+        assert (enrollment.completed_materials, enrollment.total_materials) == (0, 3)
+        assert enrollment.progress == 0.0
+        assert StudyProgress.query.filter_by(material_id=materials[0].id).count() == 0
+
+
+def test_recompute_rebuilds_progress(isolated_app, seed_course):
+    with isolated_app.app_context():
+        teacher, student, course = seed_course()
+        materials = [CourseMaterial(course_id=course.id, title=f'M{i}', uploaded_by=teacher.id)
+                     for i in range(3)]
+        db.session.add_all(materials)
+        db.session.add(Enrollment(user_id=student.id, course_id=course.id))
+        db.session.flush()
+        db.session.add(StudyProgress(user_id=student.id, course_id=course.id,
+                                     material_id=materials[0].id, completion_status='completed'))
+        db.session.commit()
+
+        assert recompute_progress() == 1
+        db.session.commit()
+        enrollment = _enrollment(student, course)
+        assert (enrollment.completed_materials, enrollment.total_materials) == (1, 3)
+        assert round(enrollment.progress, 2) == 33.33
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Regression test: the student dashboard must cost a fixed number of queries
+no matter how many courses and assignments the student has.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import Enrollment, Assignment, AssignmentSubmission, CourseMaterial
+
+
+@pytest.fixture
+def seed_dashboard(make_user, make_course):
+    """Factory for a student enrolled in ``course_count`` courses of assignments"""
+    def seed_dashboard(course_count, assignments_per_course):
+        teacher = make_user('teacher', 'teacher', first_name='Sarah', last_name='Johnson')
+        student = make_user('student', 'student', first_name='John', last_name='Student')
+        db.session.flush()
+
+        for c in range(course_count):
+            course = make_course(teacher, title=f'Course {c}', duration_weeks=8, max_students=30)
+            db.session.add(Enrollment(user_id=student.id, course_id=course.id))
+            db.session.add(CourseMaterial(course_id=course.id, title='Week 1',
+                                          uploaded_by=teacher.id))
+            for a in range(assignments_per_course):
+                assignment = Assignment(course_id=course.id, title=f'Assignment {c}.{a}',
+                                        description='Seeded assignment',
+                                        due_date=datetime.utcnow() + timedelta(days=a + 1),
+                                        created_by=teacher.id)
+                db.session.add(assignment)
+                db.session.flush()
+                # Submit every other assignment so both branches are exercised
+                if a % 2:
+                    db.session.add(AssignmentSubmission(assignment_id=assignment.id,
+                                                        user_id=student.id,
+                                                        submission_text='done'))
+        db.session.commit()
+        return student
+    return seed_dashboard
+
+
+def _dashboard_query_count(app, seed_dashboard, course_count, assignments_per_course):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        student = seed_dashboard(course_count, assignments_per_course)
+        client = app.test_client()
+        login_as(client, student)
+        with count_queries() as statements:
+            response = client.get('/dashboard')
+        assert response.status_code == 200
+        return len(statements)
+
+
+def test_dashboard_query_count_is_constant(isolated_app, seed_dashboard):
+    small = _dashboard_query_count(isolated_app, seed_dashboard, 1, 1)
+    large = _dashboard_query_count(isolated_app, seed_dashboard, 6, 20)
+    assert large == small, f"dashboard ran {small} queries for 1x1 but {large} for 6x20"
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the denormalized Course.enrolled_count counter
+"""
+
+import pytest
+
+from database import db
+from enrollments import add_enrollment, reconcile_enrolled_counts
+from isolated_app import count_queries, login_as
+from models import Course, Enrollment, UserDeletionRequest
+
+
+@pytest.fixture
+def seed_roster(make_user, make_course):
+    """Factory for a teacher, an admin, ``student_count`` students and an empty course"""
+    def seed_roster(student_count=3):
+        teacher = make_user('teacher', 'teacher')
+        admin = make_user('admin', 'admin')
+        students = [make_user(f'student{i}', 'student') for i in range(student_count)]
+        db.session.flush()
+        course = make_course(teacher, title='Counting 101')
+        db.session.commit()
+        return teacher, admin, students, course
+    return seed_roster
+
+
+def _count(course_id):
+    return db.session.get(Course, course_id).enrolled_count
+
+
+def test_counter_follows_enroll_and_unenroll(isolated_app, seed_roster):
+    with isolated_app.app_context():
+        teacher, admin, students, course = seed_roster()
+        client = isolated_app.test_client()
+
+        for student in students:
+            login_as(client, student)
+            client.get(f'/enroll/{course.id}')
+        assert _count(course.id) == 3
+
+        login_as(client, teacher)
+        client.get(f'/teacher/unenroll-student/{course.id}/{students[0].id}')
+        assert _count(course.id) == 2
+
+        login_as(client, admin)
+        client.get(f'/admin/users/{students[1].id}/delete')
+        assert _count(course.id) == 1
+
+        login_as(client, teacher)
+        client.post(f'/teacher/unenroll-all-students/{course.id}')
+        assert _count(course.id) == 0
+        assert Enrollment.query.count() == 0
+
+
+def test_reconcile_rebuilds_drifted_counters(isolated_app, seed_roster):
+    with isolated_app.app_context():
+        teacher, admin, students, course = seed_roster()
+        # Rows written behind the app's back leave the counter stale
+        db.session.add_all([Enrollment(user_id=s.id, course_id=course.id) for s in students])
+        db.session.commit()
+        assert _count(course.id) == 0
+
+        assert reconcile_enrolled_counts() == 1
+        db.session.commit()
+        assert _count(course.id) == 3
+        assert reconcile_enrolled_counts() == 0
+
+
+def test_admin_pages_count_enrollments_without_loading_them(isolated_app, seed_roster):
+    with isolated_app.app_context():
+        teacher, admin, students, course = seed_roster()
+        add_enrollment(students[0].id, course.id)
+        deletion_request = UserDeletionRequest(user_id=students[0].id, reason='Leaving')
+        db.session.add(deletion_request)
+        db.session.commit()
+        client = isolated_app.test_client()
+        login_as(client, admin)
+
+        with count_queries() as statements:
+            users = client.get('/admin/users')
+            edit = client.get(f'/admin/users/{students[0].id}/edit')
+            review = client.get(f'/admin/user-deletion-requests/{deletion_request.id}/review')
+        assert users.data.count(b'>Active<') == 1
+        assert b'<h4 class="text-primary">1</h4>' in edit.data
+        assert b'<h4 class="text-danger mb-1">1</h4>' in review.data
+        # No user's enrollments are loaded as a relationship
+        assert not [s for s in statements if '= enrollment.user_id' in s]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for conditional, range and offloaded material downloads
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from database import db
+from isolated_app import login_as
+from models import CourseMaterial
+
+DATA = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def student_client(isolated_app, teacher_client, upload_material):
+    teacher, course_id, student = teacher_client
+    upload_material(teacher, course_id, DATA, 'deck.pdf')
+    material = db.session.scalars(db.select(CourseMaterial)).one()
+    client = isolated_app.test_client()
+    login_as(client, student)
+    return client, f'/download-material/{material.id}'
+
+
+def test_download_has_strong_validators_and_long_private_caching(student_client):
+    client, url = student_client
+    response = client.get(url)
+    assert response.data == DATA
+    assert response.headers['ETag'] == f'"{hashlib.sha256(DATA).hexdigest()}"'
+    assert response.headers['Last-Modified']
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    cache = response.cache_control
+    assert cache.private and not cache.public and cache.immutable
+    assert cache.max_age == 365 * 24 * 60 * 60
+
+    again = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+
+
+def test_interrupted_download_resumes_with_a_range(student_client):
+    client, url = student_client
+    etag = client.get(url).headers['ETag']
+
+    response = client.get(url, headers={'Range': 'bytes=1000-', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 1000-{len(DATA) - 1}/{len(DATA)}'
+    assert response.data == DATA[1000:]
+
+    # The file changed since: the whole file comes back
+    response = client.get(url, headers={'Range': 'bytes=1000-', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == DATA
+
+    assert client.get(url, headers={'Range': f'bytes={len(DATA)}-'}).status_code == 416
+
+
+def test_legacy_files_get_an_mtime_and_size_etag(isolated_app, student_client, tmp_path):
+    client, url = student_client
+    path = tmp_path / 'old_notes.txt'
+    path.write_bytes(b'notes')
+    stat = os.stat(path)
+
+    response = client.get('/uploads/old_notes.txt')
+    assert response.data == b'notes'
+    assert response.headers['ETag'] == f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    assert client.get('/uploads/missing.txt').status_code == 404
+
+
+@pytest.mark.parametrize('mode, header', [('x-sendfile', 'X-Sendfile'),
+                                          ('x-accel-redirect', 'X-Accel-Redirect')])
+def test_offloaded_downloads_leave_the_bytes_to_the_proxy(isolated_app, student_client, mode, header):
+    client, url = student_client
+    isolated_app.config.update(DOWNLOAD_OFFLOAD=mode, X_ACCEL_REDIRECT_PREFIX='/protected/')
+    digest = hashlib.sha256(DATA).hexdigest()
+
+    response = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 200
+    assert response.data == b''
+    if mode == 'x-accel-redirect':
+        assert response.headers[header] == f'/protected/blobs/{digest[:2]}/{digest[2:4]}/{digest}'
+        assert 'X-Sendfile' not in response.headers
+    else:
+        assert response.headers[header].endswith(digest)
+
+    revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert header not in revalidated.headers
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQL grade aggregation behind the grades, profile and
+certificates pages.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db
+from grade_stats import course_grade_summaries, overall_grade_summary, recent_grades_by_course
+from isolated_app import count_queries, login_as
+from models import Enrollment, Grade
+
+
+@pytest.fixture
+def seed_grades(make_user, make_course):
+    """Factory for a student with ``grades_per_course`` grades in two courses"""
+    def seed_grades(grades_per_course):
+        teacher = make_user('teacher', 'teacher', first_name='Sarah', last_name='Johnson')
+        student = make_user('student', 'student', first_name='John', last_name='Student')
+        db.session.flush()
+
+        courses = []
+        for title, base_score in (('Algebra', 95), ('Biology', 65)):
+            course = make_course(teacher, title=title, duration_weeks=8, max_students=30)
+            db.session.add(Enrollment(user_id=student.id, course_id=course.id))
+            start = datetime(2024, 1, 1)
+            for i in range(grades_per_course):
+                name = f'Quiz: Week {i}' if i % 2 else f'Homework {i}'
+                db.session.add(Grade(user_id=student.id, course_id=course.id, assignment_name=name,
+                                     score=base_score - (i % 3), graded_at=start + timedelta(days=i)))
+            courses.append(course)
+        db.session.commit()
+        return student, courses
+    return seed_grades
+
+
+def test_course_summaries_match_python_totals(isolated_app, seed_grades):
+    with isolated_app.app_context():
+        student, (algebra, biology) = seed_grades(6)
+        db.session.add(Grade(user_id=student.id, course_id=biology.id,
+                             assignment_name='Ungraded essay', score=None))
+        db.session.commit()
+
+        summaries = course_grade_summaries(student.id)
+        assert [s['course'].id for s in summaries] == [algebra.id, biology.id]
+
+        for summary in summaries:
+            grades = Grade.query.filter_by(user_id=student.id, course_id=summary['course'].id).all()
+            scores = [g.score for g in grades if g.score is not None]
+            assert summary['grade_count'] == len(grades)
+            assert summary['graded_count'] == len(scores)
+            assert summary['average'] == pytest.approx(sum(scores) / len(scores))
+            assert summary['last_graded_at'] == max(g.graded_at for g in grades)
+            assert summary['quiz_count'] == sum('Quiz:' in g.assignment_name for g in grades)
+            for letter, count in summary['letter_counts'].items():
+                assert count == sum(g.get_letter_grade() == letter for g in grades)
+
+        assert summaries[0]['letter_grade'] == 'A'
+        assert summaries[1]['letter_grade'] == 'D'
+
+        overall = overall_grade_summary(summaries)
+        assert overall['grade_count'] == 13
+        assert overall['quiz_count'] == 6
+        assert overall['assignment_count'] == 7
+        assert overall['average'] == pytest.approx(
+            sum(g.score for g in Grade.query.all() if g.score is not None) / 12)
+
+
+def test_recent_grades_are_capped_per_course(isolated_app, seed_grades):
+    with isolated_app.app_context():
+        student, (algebra, biology) = seed_grades(8)
+        recent = recent_grades_by_course(student.id, per_course=3)
+        assert set(recent) == {algebra.id, biology.id}
+        for grades in recent.values():
+            assert [g.assignment_name for g in grades] == ['Quiz: Week 7', 'Homework 6', 'Quiz: Week 5']
+
+
+def _page_query_count(app, seed_grades, path, grades_per_course):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        student, _ = seed_grades(grades_per_course)
+        client = app.test_client()
+        login_as(client, student)
+        with count_queries() as statements:
+            response = client.get(path)
+        assert response.status_code == 200
+        return len(statements)
+
+
+@pytest.mark.parametrize('path', ['/grades', '/profile', '/certificates'])
+def test_grade_pages_do_not_grow_with_grade_count(isolated_app, seed_grades, path):
+    assert (_page_query_count(isolated_app, seed_grades, path, 2)
+            == _page_query_count(isolated_app, seed_grades, path, 300))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the grouped, cached quiz summaries on the manage-quizzes page
+"""
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import User, Quiz, QuizQuestion
+
+
+def _quiz_reads(statements):
+    return [s for s in statements if s.startswith('SELECT') and 'FROM quiz' in s]
+
+
+def test_summaries_come_from_one_query_and_are_cached(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        for n in range(3):
+            extra = Quiz(title=f'Extra {n}', course_id=quiz.course_id, passing_score=50)
+            db.session.add(extra)
+            db.session.flush()
+            db.session.add(QuizQuestion(quiz_id=extra.id, question_text='Q?', option_a='a',
+                                        option_b='b', option_c='c', option_d='d',
+                                        correct_answer='A', order_num=1))
+        db.session.commit()
+        course_id = quiz.course_id
+        teacher = db.session.get(User, quiz.course.instructor_id)
+        path = f'/teacher/manage-quizzes/{course_id}'
+
+        teacher_client = isolated_app.test_client()
+        login_as(teacher_client, teacher)
+        with count_queries() as statements:
+            page = teacher_client.get(path)
+        assert page.status_code == 200
+        assert len(_quiz_reads(statements)) == 1
+        assert b'4 questions' in page.data
+
+        with count_queries() as statements:
+            teacher_client.get(path)
+        assert _quiz_reads(statements) == []
+
+        # A submission invalidates the course's summaries
+        student_client = isolated_app.test_client()
+        login_as(student_client, student)
+        form = {f'question_{q.id}': q.correct_answer for q in questions}
+        assert student_client.post(f'/quiz/{quiz.id}/take', data=form).status_code == 302
+
+        with count_queries() as statements:
+            page = teacher_client.get(path)
+        assert len(_quiz_reads(statements)) == 1
+        assert b'(1 passed)' in page.data
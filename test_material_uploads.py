@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for streamed, size-capped course material uploads
+"""
+
+import hashlib
+import os
+import tracemalloc
+
+import pytest
+
+from database import db
+from file_uploads import IncomingFile, STAGING_DIR
+from isolated_app import login_as
+from models import CourseMaterial
+
+KB = 1024
+
+
+@pytest.fixture
+def upload_config():
+    return {'MATERIAL_MAX_BYTES': 512 * KB, 'COURSE_UPLOAD_QUOTA_BYTES': 1024 * KB}
+
+
+def _leftovers(folder):
+    staging = os.path.join(folder, STAGING_DIR)
+    return os.listdir(staging) if os.path.isdir(staging) else []
+
+
+def test_upload_is_streamed_hashed_and_renamed_into_place(isolated_app, teacher_client, monkeypatch,
+                                                           upload_material):
+    client, course_id, student = teacher_client
+    kept = []
+    original_keep = IncomingFile.keep
+    monkeypatch.setattr(IncomingFile, 'keep', lambda self, path: (kept.append(path),
+                                                                  original_keep(self, path)))
+    data = os.urandom(300 * KB)
+
+    assert upload_material(client, course_id, data, '../../etc/week 1.pdf').status_code == 302
+
+    material = db.session.scalars(db.select(CourseMaterial)).one()
+    assert material.file_size == len(data)
+    assert material.sha256 == hashlib.sha256(data).hexdigest()
+    assert material.file_path.startswith('uploads/') and material.file_path.endswith('_week_1.pdf')
+    digest = material.sha256
+    path = os.path.join(isolated_app.config['UPLOAD_FOLDER'], 'blobs', digest[:2], digest[2:4], digest)
+    assert kept == [path]
+    with open(path, 'rb') as stored:
+        assert stored.read() == data
+    assert _leftovers(isolated_app.config['UPLOAD_FOLDER']) == []
+
+
+def test_oversized_files_are_refused_without_leftovers(isolated_app, teacher_client, upload_material):
+    client, course_id, student = teacher_client
+    response = upload_material(client, course_id, os.urandom(600 * KB))
+    assert response.status_code == 200
+    assert b'too large' in response.data
+    assert db.session.scalar(db.select(db.func.count(CourseMaterial.id))) == 0
+    assert _leftovers(isolated_app.config['UPLOAD_FOLDER']) == []
+
+
+def test_course_quota_limits_what_is_left(isolated_app, teacher_client, upload_material):
+    client, course_id, student = teacher_client
+    assert upload_material(client, course_id, os.urandom(400 * KB)).status_code == 302
+    assert upload_material(client, course_id, os.urandom(400 * KB)).status_code == 302
+    # 224 KB of the 1024 KB quota is left
+    page = client.get(f'/teacher/upload-material/{course_id}').data
+    assert b'Max size: 224.0 KB' in page
+    response = upload_material(client, course_id, os.urandom(300 * KB))
+    assert b'too large' in response.data
+    assert db.session.scalar(db.select(db.func.count(CourseMaterial.id))) == 2
+
+
+def test_upload_memory_does_not_grow_with_file_size(isolated_app, teacher_client, tmp_path):
+    client, course_id, student = teacher_client
+    isolated_app.config.update(MATERIAL_MAX_BYTES=64 * 1024 * KB,
+                               COURSE_UPLOAD_QUOTA_BYTES=64 * 1024 * KB)
+    source = tmp_path / 'video.bin'
+    with open(source, 'wb') as out:
+        for _ in range(32):
+            out.write(os.urandom(1024 * KB))
+
+    with open(source, 'rb') as video:
+        tracemalloc.start()
+        response = client.post(f'/teacher/upload-material/{course_id}', data={
+            'title': 'Lecture', 'description': '', 'file': (video, 'lecture.mp4'),
+        }, content_type='multipart/form-data')
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    assert response.status_code == 302
+    assert db.session.scalars(db.select(CourseMaterial.file_size)).one() == 32 * 1024 * KB
+    # A 32 MB upload, test client encoding included, stays within a few MB
+    assert peak < 4 * 1024 * KB
+
+
+def test_enrolled_student_downloads_from_the_upload_folder(isolated_app, teacher_client, upload_material):
+    client, course_id, student = teacher_client
+    data = b'lecture notes'
+    upload_material(client, course_id, data, 'notes.txt')
+    material = db.session.scalars(db.select(CourseMaterial)).one()
+
+    student_client = isolated_app.test_client()
+    login_as(student_client, student)
+    response = student_client.get(f'/download-material/{material.id}')
+    assert response.status_code == 200
+    assert response.data == data
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Query plan checks for the hot filters used by the student, teacher and
+admin pages. Each query must be answered from an index; a plan step that
+scans a whole table fails the test.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from database import db
+from isolated_app import full_table_scans, query_plan
+from models import (Announcement, Assignment, AssignmentSubmission, CourseMaterial,
+                    Enrollment, Grade, Quiz, QuizAnswer, QuizAttempt, QuizQuestion,
+                    StudyProgress)
+
+HOT_QUERIES = {
+    'grades for a student in a course': lambda: db.select(Grade).where(
+        Grade.user_id == 1, Grade.course_id == 1),
+    'grades for a student': lambda: db.select(Grade).where(Grade.user_id == 1),
+    'submission for a student': lambda: db.select(AssignmentSubmission).where(
+        AssignmentSubmission.assignment_id == 1, AssignmentSubmission.user_id == 1),
+    'submissions for an assignment': lambda: db.select(AssignmentSubmission).where(
+        AssignmentSubmission.assignment_id == 1),
+    'completed materials in a course': lambda: db.select(db.func.count(StudyProgress.id)).where(
+        StudyProgress.user_id == 1, StudyProgress.course_id == 1,
+        StudyProgress.completion_status == 'completed'),
+    'study records for a material': lambda: db.select(StudyProgress).where(
+        StudyProgress.material_id == 1),
+    'attempts by a student on a quiz': lambda: db.select(QuizAttempt).where(
+        QuizAttempt.quiz_id == 1, QuizAttempt.user_id == 1),
+    'attempts on a quiz': lambda: db.select(QuizAttempt).where(QuizAttempt.quiz_id == 1),
+    'answers in an attempt': lambda: db.select(QuizAnswer).where(QuizAnswer.attempt_id == 1),
+    'questions in a quiz': lambda: db.select(QuizQuestion).where(
+        QuizQuestion.quiz_id == 1).order_by(QuizQuestion.order_num),
+    'quizzes in a course': lambda: db.select(Quiz).where(Quiz.course_id == 1),
+    'active assignments in a course': lambda: db.select(Assignment).where(
+        Assignment.course_id == 1, Assignment.is_active == True).order_by(Assignment.due_date),
+    'upcoming assignments in a course': lambda: db.select(Assignment).where(
+        Assignment.course_id == 1, Assignment.is_active == True,
+        Assignment.due_date > datetime(2024, 1, 1)),
+    'course announcements': lambda: db.select(Announcement).where(
+        Announcement.course_id == 1).order_by(Announcement.created_at.desc()),
+    'course materials': lambda: db.select(CourseMaterial).where(
+        CourseMaterial.course_id == 1).order_by(CourseMaterial.order_index),
+    'enrollments in a course': lambda: db.select(Enrollment).where(Enrollment.course_id == 1),
+    'enrollments of a student': lambda: db.select(Enrollment).where(Enrollment.user_id == 1),
+    'dashboard assignments': lambda: db.select(Assignment, AssignmentSubmission).join(
+        Enrollment, Enrollment.course_id == Assignment.course_id
+    ).outerjoin(
+        AssignmentSubmission, db.and_(AssignmentSubmission.assignment_id == Assignment.id,
+                                      AssignmentSubmission.user_id == 1)
+    ).where(Enrollment.user_id == 1, Assignment.is_active == True),
+}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(isolated_app, name):
+    with isolated_app.app_context():
+        statement = HOT_QUERIES[name]()
+        assert not full_table_scans(statement), query_plan(statement)
+
+
+def test_harness_detects_full_scans(isolated_app):
+    with isolated_app.app_context():
+        statement = db.select(Grade).where(Grade.assignment_name == 'Midterm')
+        assert full_table_scans(statement)
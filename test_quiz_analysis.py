@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for cached, incrementally refreshed quiz item analysis
+"""
+
+import statistics
+
+import pytest
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import User, QuizAttempt
+from quiz_analysis import quiz_item_analysis, clear_analysis_cache
+from quiz_grading import AnswerKey, start_attempt, submit_attempt
+
+# Each row is one attempt's answers to the four questions (correct: A B C D)
+RESPONSES = [
+    'ABCD',
+    'ABCA',
+    'ABAA',
+    'AAAA',
+    'BBCD',
+    'CB D',
+]
+
+
+@pytest.fixture
+def submit_as_new_student(make_user):
+    """Factory that has student number ``n`` answer ``letters`` (' ' skips a question)"""
+    def submit_as_new_student(quiz, questions, letters, n):
+        student = make_user(f'taker{n}', 'student')
+        db.session.flush()
+        submit_attempt(quiz, student.id, {q.id: letter for q, letter in zip(questions, letters)
+                                          if letter != ' '})
+        db.session.commit()
+    return submit_as_new_student
+
+
+def _expected(quiz, questions):
+    attempts = QuizAttempt.query.filter_by(quiz_id=quiz.id).order_by(QuizAttempt.id).all()
+    expected = []
+    for index, question in enumerate(questions):
+        # Each question only counts the attempts it was shown to
+        shown = [a for a in attempts if a.question_ids is None or question.id in a.question_ids]
+        shares = [a.score / a.max_score for a in shown]
+        right = [1 if any(ans.question_id == question.id and ans.is_correct for ans in a.answers)
+                 else 0 for a in shown]
+        discrimination = (statistics.correlation(right, shares)
+                          if 0 < sum(right) < len(right) else None)
+        expected.append((sum(right) / len(right), discrimination))
+    return expected
+
+
+def test_item_statistics_match_a_direct_calculation(isolated_app, seed_quiz, submit_as_new_student):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        for n, letters in enumerate(RESPONSES):
+            submit_as_new_student(quiz, questions, letters, n)
+
+        analysis = quiz_item_analysis(quiz)
+        assert analysis['summary']['attempts'] == len(RESPONSES)
+        for item, (difficulty, discrimination) in zip(analysis['items'], _expected(quiz, questions)):
+            assert item['difficulty'] == pytest.approx(difficulty)
+            if discrimination is None:
+                assert item['discrimination'] is None
+            else:
+                assert item['discrimination'] == pytest.approx(discrimination)
+
+        last = analysis['items'][2]
+        assert [c['count'] for c in last['choices']] == [2, 0, 3, 0]
+        assert last['unanswered'] == 1
+        assert sum(analysis['bands'].values()) == len(RESPONSES)
+
+
+def test_new_attempts_are_folded_in_incrementally(isolated_app, seed_quiz, submit_as_new_student):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        for n, letters in enumerate(RESPONSES[:4]):
+            submit_as_new_student(quiz, questions, letters, n)
+        quiz_item_analysis(quiz)
+
+        # Nothing new: a single fingerprint query
+        with count_queries() as statements:
+            quiz_item_analysis(quiz)
+        assert len(statements) == 1
+
+        for n, letters in enumerate(RESPONSES[4:], start=4):
+            submit_as_new_student(quiz, questions, letters, n)
+        db.session.refresh(quiz)
+        with count_queries() as statements:
+            incremental = quiz_item_analysis(quiz)
+        # Fingerprint, attempt ids, then one aggregate pair for the new attempts
+        assert len(statements) == 4
+
+        clear_analysis_cache()
+        assert quiz_item_analysis(quiz) == incremental
+
+
+def test_overview_page_shows_item_analysis(isolated_app, seed_quiz, submit_as_new_student):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        for n, letters in enumerate(RESPONSES):
+            submit_as_new_student(quiz, questions, letters, n)
+        teacher = db.session.get(User, quiz.course.instructor_id)
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+
+        response = client.get(f'/teacher/quiz-results/{quiz.id}')
+        assert response.status_code == 200
+        assert b'Item Analysis' in response.data
+
+
+def test_overview_page_lists_attempts_a_page_at_a_time(isolated_app, seed_quiz,
+                                                      submit_as_new_student):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        for n in range(25):
+            submit_as_new_student(quiz, questions, RESPONSES[n % len(RESPONSES)], n)
+        teacher = db.session.get(User, quiz.course.instructor_id)
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+
+        first = client.get(f'/teacher/quiz-results/{quiz.id}')
+        second = client.get(f'/teacher/quiz-results/{quiz.id}?page=2')
+        assert first.data.count(b'View Detailed Results') == 20
+        assert second.data.count(b'View Detailed Results') == 5
+        # The statistics still cover every attempt
+        assert b'Student Results (25)' in second.data
+        assert quiz_item_analysis(quiz)['summary']['attempts'] == 25
+
+
+def test_pooled_questions_are_measured_over_the_attempts_that_drew_them(isolated_app, seed_quiz,
+                                                                        make_user):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz(question_points=(1, 2, 3, 4))
+        quiz.questions_per_attempt = 2
+        key = AnswerKey.load(quiz.id)
+        q = [question.id for question in questions]
+        # (drawn questions, letters given to them); correct answers are A B C D
+        papers = [((0, 1), 'AB'), ((0, 1), 'AA'), ((0, 2), 'BC'), ((0, 2), 'AC'),
+                  ((1, 3), 'BD'), ((2, 3), 'CA'), ((2, 3), 'CD'), ((1, 3), 'AD')]
+        for n, (drawn, letters) in enumerate(papers):
+            user = make_user(f'pooled{n}', 'student')
+            db.session.flush()
+            ids = [q[i] for i in drawn]
+            paper_key = AnswerKey(quiz.id, {qid: key.questions[qid] for qid in ids})
+            attempt = start_attempt(quiz, user.id, lambda: {
+                'question_ids': ids, 'max_score': paper_key.max_score})
+            submit_attempt(quiz, user.id, dict(zip(ids, letters)), answer_key=paper_key,
+                           attempt=attempt)
+        db.session.commit()
+
+        analysis = quiz_item_analysis(quiz)
+        assert [item['seen'] for item in analysis['items']] == [4, 4, 4, 4]
+        # Two of the four papers with the second question got it right, not two of all eight
+        assert analysis['items'][1]['difficulty'] == pytest.approx(2 / 4)
+        assert [item['unanswered'] for item in analysis['items']] == [0, 0, 0, 0]
+        for item, (difficulty, discrimination) in zip(analysis['items'], _expected(quiz, questions)):
+            assert item['difficulty'] == pytest.approx(difficulty)
+            if discrimination is None:
+                assert item['discrimination'] is None
+            else:
+                assert item['discrimination'] == pytest.approx(discrimination)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming quiz archive export and import
+"""
+
+import io
+import json
+
+import pytest
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import User, Grade, Quiz, QuizQuestion, QuizAttempt, QuizAnswer
+from quiz_archive import (export_records, archive_lines, read_records, import_archive,
+                          ArchiveFormatError)
+from quiz_grading import start_attempt, submit_attempt
+
+
+@pytest.fixture
+def quiz_with_attempts(seed_quiz, make_user):
+    """Factory for a quiz submitted by ``students`` students. Returns (quiz, users)."""
+    def quiz_with_attempts(students=5):
+        student, quiz, questions = seed_quiz()
+        users = [student] + [make_user(f'student{n}', 'student') for n in range(1, students)]
+        db.session.flush()
+        for n, user in enumerate(users):
+            # Student n gets the first n questions right
+            responses = {q.id: q.correct_answer if i < n else 'A' if q.correct_answer != 'A' else 'B'
+                         for i, q in enumerate(questions)}
+            submit_attempt(quiz, user.id, responses)
+        db.session.commit()
+        return quiz, users
+    return quiz_with_attempts
+
+
+@pytest.fixture
+def second_course(make_course):
+    """Factory for another course taught by the quiz's teacher"""
+    def second_course(quiz):
+        course = make_course(db.session.get(User, quiz.course.instructor_id), title='Copy')
+        db.session.commit()
+        return course
+    return second_course
+
+
+def _round_trip(quiz_id, course_id, archive_format, chunk_size=None):
+    text = ''.join(archive_lines(export_records([quiz_id], chunk_size=chunk_size), archive_format))
+    counts = import_archive(read_records(io.StringIO(text), archive_format), course_id,
+                            chunk_size=chunk_size)
+    db.session.commit()
+    return text, counts
+
+
+def _contents(quiz_id):
+    questions = db.session.execute(
+        db.select(QuizQuestion.question_text, QuizQuestion.correct_answer, QuizQuestion.points)
+        .where(QuizQuestion.quiz_id == quiz_id).order_by(QuizQuestion.order_num)).all()
+    attempts = db.session.execute(
+        db.select(User.username, QuizAttempt.score, QuizAttempt.percentage, QuizAttempt.passed)
+        .join(User, User.id == QuizAttempt.user_id)
+        .where(QuizAttempt.quiz_id == quiz_id).order_by(User.username)).all()
+    answers = db.session.execute(
+        db.select(User.username, QuizQuestion.question_text, QuizAnswer.selected_answer,
+                  QuizAnswer.is_correct)
+        .join(QuizAttempt, QuizAttempt.id == QuizAnswer.attempt_id)
+        .join(User, User.id == QuizAttempt.user_id)
+        .join(QuizQuestion, QuizQuestion.id == QuizAnswer.question_id)
+        .where(QuizAttempt.quiz_id == quiz_id)
+        .order_by(User.username, QuizQuestion.order_num)).all()
+    return questions, attempts, answers
+
+
+@pytest.mark.parametrize('archive_format', ['jsonl', 'csv'])
+def test_round_trip_into_another_course(isolated_app, archive_format, quiz_with_attempts, second_course):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts()
+        course = second_course(quiz)
+        text, counts = _round_trip(quiz.id, course.id, archive_format, chunk_size=3)
+        assert counts == {'quizzes': 1, 'questions': 4, 'attempts': 5, 'answers': 20,
+                          'skipped_attempts': 0, 'skipped_answers': 0, 'open_attempts': 0}
+
+        copy = db.session.scalars(db.select(Quiz).where(Quiz.course_id == course.id)).one()
+        assert copy.id != quiz.id and copy.title == quiz.title
+        assert _contents(copy.id) == _contents(quiz.id)
+        # Completed attempts land in the gradebook of the new course
+        grades = db.session.scalars(db.select(Grade.score).where(Grade.course_id == course.id)).all()
+        assert sorted(grades) == sorted(a.percentage for a in copy.attempts)
+
+
+def test_export_reads_in_pages_and_orders_attempts_before_answers(isolated_app, quiz_with_attempts):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts()
+        quiz_id = quiz.id
+        with count_queries() as statements:
+            records = list(export_records([quiz_id], chunk_size=3))
+        kinds = [record['type'] for record in records]
+        assert kinds == ['quiz'] + ['question'] * 4 + ['attempt'] * 5 + ['answer'] * 20
+        # 1 quiz + 2 question pages + 2 attempt pages + 7 answer pages
+        assert len(statements) == 12
+        assert all('LIMIT' in s for s in statements[1:])
+        assert {record['username'] for record in records if record['type'] == 'attempt'} == \
+            {user.username for user in users}
+
+
+def test_import_writes_each_chunk_with_one_insert(isolated_app, quiz_with_attempts, second_course):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts()
+        course = second_course(quiz)
+        text = ''.join(archive_lines(export_records([quiz.id]), 'jsonl'))
+        with count_queries() as statements:
+            import_archive(read_records(io.StringIO(text), 'jsonl'), course.id, chunk_size=8)
+        inserts = [s.split(' (')[0] for s in statements if s.startswith('INSERT')]
+        assert inserts == ['INSERT INTO quiz', 'INSERT INTO quiz_question',
+                           'INSERT INTO quiz_attempt', 'INSERT INTO grade',
+                           'INSERT INTO quiz_answer', 'INSERT INTO quiz_answer',
+                           'INSERT INTO quiz_answer']
+
+
+def test_pooled_attempts_are_remapped_and_unknown_students_skipped(isolated_app, quiz_with_attempts,
+                                                                   second_course):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts(students=2)
+        drawn = [q.id for q in quiz.questions][:2]
+        db.session.execute(db.update(QuizAttempt).values(question_ids=drawn))
+        db.session.commit()
+        course = second_course(quiz)
+
+        lines = list(archive_lines(export_records([quiz.id]), 'jsonl'))
+        lines = [line.replace('"student1"', '"nobody"') for line in lines]
+        counts = import_archive(read_records(io.StringIO(''.join(lines)), 'jsonl'), course.id)
+        db.session.commit()
+        assert counts['attempts'] == 1 and counts['skipped_attempts'] == 1
+        assert counts['answers'] == 4 and counts['skipped_answers'] == 4
+
+        copy = db.session.scalars(db.select(Quiz).where(Quiz.course_id == course.id)).one()
+        attempt = db.session.scalars(
+            db.select(QuizAttempt).where(QuizAttempt.quiz_id == copy.id)).one()
+        by_text = {q.question_text: q.id for q in copy.questions}
+        originals = {q.id: q.question_text for q in quiz.questions}
+        assert attempt.question_ids == [by_text[originals[qid]] for qid in drawn]
+
+
+def test_bad_archives_report_the_line(isolated_app, quiz_with_attempts, second_course):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts(students=1)
+        course = second_course(quiz)
+        records = [json.loads(line) for line in archive_lines(export_records([quiz.id]), 'jsonl')]
+        answer = next(r for r in records if r['type'] == 'answer')
+        broken = [records[0], answer]
+        text = ''.join(json.dumps(r) + '\n' for r in broken)
+        with pytest.raises(ArchiveFormatError) as error:
+            import_archive(read_records(io.StringIO(text), 'jsonl'), course.id)
+        assert error.value.line == 2
+        db.session.rollback()
+
+        with pytest.raises(ArchiveFormatError) as error:
+            list(read_records(io.StringIO('{"type": "quiz", "id": 1}\nnot json\n'), 'jsonl'))
+        assert error.value.line == 2
+
+
+def test_teacher_can_download_and_upload_archives(isolated_app, quiz_with_attempts, second_course):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts(students=2)
+        course = second_course(quiz)
+        teacher = db.session.get(User, quiz.course.instructor_id)
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+
+        response = client.get(f'/teacher/export-quizzes/{quiz.course_id}?format=csv')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert response.is_streamed
+
+        upload = {'archive': (io.BytesIO(response.data), 'quizzes.csv')}
+        response = client.post(f'/teacher/import-quizzes/{course.id}', data=upload,
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+        copy = db.session.scalars(db.select(Quiz).where(Quiz.course_id == course.id)).one()
+        assert _contents(copy.id) == _contents(quiz.id)
+
+
+def test_open_attempts_are_not_imported(isolated_app, quiz_with_attempts, second_course, make_user):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts(students=1)
+        latecomer = make_user('latecomer', 'student')
+        db.session.flush()
+        start_attempt(quiz, latecomer.id)
+        db.session.commit()
+        course = second_course(quiz)
+
+        text = ''.join(archive_lines(export_records([quiz.id]), 'jsonl'))
+        counts = import_archive(read_records(io.StringIO(text), 'jsonl'), course.id)
+        db.session.commit()
+        assert (counts['attempts'], counts['skipped_attempts'], counts['open_attempts']) == (1, 1, 1)
+        copy = db.session.scalars(db.select(Quiz).where(Quiz.course_id == course.id)).one()
+        assert db.session.scalar(db.select(db.func.count(QuizAttempt.id)).where(
+            QuizAttempt.quiz_id == copy.id, QuizAttempt.completed_at.is_(None))) == 0
+
+
+def test_database_errors_roll_the_import_back(isolated_app, quiz_with_attempts, second_course):
+    with isolated_app.app_context():
+        quiz, users = quiz_with_attempts(students=1)
+        course = second_course(quiz)
+        teacher = db.session.get(User, quiz.course.instructor_id)
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+
+        records = [json.loads(line) for line in archive_lines(export_records([quiz.id]), 'jsonl')]
+        next(r for r in records if r['type'] == 'question')['question_text'] = None
+        upload = {'archive': (io.BytesIO(''.join(json.dumps(r) + '\n' for r in records).encode()),
+                              'quizzes.jsonl')}
+        response = client.post(f'/teacher/import-quizzes/{course.id}', data=upload,
+                               content_type='multipart/form-data', follow_redirects=True)
+        assert response.status_code == 200
+        assert b'Error importing quizzes' in response.data
+        assert db.session.scalar(db.select(db.func.count(Quiz.id)).where(Quiz.course_id == course.id)) == 0
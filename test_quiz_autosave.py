@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for quiz autosave and grading of stored answers
+"""
+
+from database import db
+from isolated_app import count_queries
+from models import QuizAttempt, QuizAnswer, Grade
+from quiz_autosave import autosave_buffer, store_answers
+
+
+def test_autosave_coalesces_and_flushes_in_one_batch(isolated_app, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        (q0, _), (q1, _), (q2, _), _ = questions
+        url = f'/quiz/{quiz.id}/autosave'
+
+        assert client.post(url, json={'answers': {str(q0): 'B'}}).json['saved'] == 1
+        assert client.post(url, json={'answers': {str(q0): 'C', str(q1): 'A'}}).json['saved'] == 2
+        # Unknown questions and letters are ignored
+        assert client.post(url, json={'answers': {str(q2): 'Z', '999999': 'A'}}).json['saved'] == 0
+        assert len(autosave_buffer) == 2
+
+        with count_queries() as statements:
+            assert autosave_buffer.flush() == 2
+        writes = [s.split()[0] for s in statements if s.startswith(('INSERT', 'DELETE'))]
+        assert writes == ['DELETE', 'INSERT']
+        assert len(autosave_buffer) == 0
+
+        stored = dict(db.session.execute(
+            db.select(QuizAnswer.question_id, QuizAnswer.selected_answer)).all())
+        assert stored == {q0: 'C', q1: 'A'}
+
+        # Reloading the page restores the saved choices
+        page = client.get(f'/quiz/{quiz.id}/take').data.decode()
+        assert f'id="q{q0}_c" \n                                        value="C" required checked' in page
+
+
+def test_final_submit_grades_stored_answers(isolated_app, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        form = {f'question_{qid}': correct for qid, correct in questions}
+        client.post(f'/quiz/{quiz.id}/autosave',
+                    json={'answers': {str(qid): correct for qid, correct in questions[:3]}})
+        autosave_buffer.flush()
+
+        with count_queries() as statements:
+            response = client.post(f'/quiz/{quiz.id}/take', data=form)
+        assert response.status_code == 302
+        # Only the one answer autosave had not stored yet is written
+        answer_inserts = [s for s in statements if s.startswith('INSERT INTO quiz_answer')]
+        assert len(answer_inserts) == 1
+
+        attempt = QuizAttempt.query.one()
+        assert attempt.completed_at is not None
+        assert (attempt.score, attempt.max_score, attempt.percentage) == (10, 10, 100.0)
+        assert QuizAnswer.query.filter_by(is_correct=True).count() == 4
+        assert db.session.scalar(db.select(db.func.sum(QuizAnswer.points_earned))) == 10
+        assert Grade.query.one().quiz_attempt_id == attempt.id
+
+        # Late autosaves and repeat submissions change nothing
+        assert client.post(f'/quiz/{quiz.id}/autosave', json={'answers': {}}).status_code == 409
+        assert client.post(f'/quiz/{quiz.id}/take', data=form).status_code == 302
+        assert QuizAttempt.query.count() == 1
+        assert Grade.query.count() == 1
+
+
+def test_flush_never_overwrites_a_graded_attempt(isolated_app, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        (q0, a0), _, _, _ = questions
+        client.post(f'/quiz/{quiz.id}/take', data={f'question_{q0}': a0})
+        attempt = QuizAttempt.query.one()
+
+        # A flush that checked the attempt just before the submit committed
+        store_answers([{'attempt_id': attempt.id, 'question_id': q0, 'selected_answer': 'D',
+                        'is_correct': False, 'points_earned': 0.0}], open_only=True)
+        db.session.commit()
+        answer = QuizAnswer.query.one()
+        assert (answer.selected_answer, answer.is_correct) == (a0, True)
+
+
+def test_failed_submit_keeps_buffered_answers(isolated_app, monkeypatch, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        (q0, a0), (q1, a1), _, _ = questions
+        client.post(f'/quiz/{quiz.id}/autosave', json={'answers': {str(q0): a0}})
+        attempt_id = QuizAttempt.query.one().id
+
+        commit = db.session.commit
+        failures = [RuntimeError('database went away')]
+
+        def failing_commit():
+            if failures:
+                raise failures.pop()
+            return commit()
+
+        monkeypatch.setattr(db.session, 'commit', failing_commit)
+        response = client.post(f'/quiz/{quiz.id}/take', data={f'question_{q1}': a1})
+        assert b'An error occurred while submitting the quiz' in response.data
+        assert autosave_buffer.pending(attempt_id) == {q0: a0}
+        assert QuizAttempt.query.one().completed_at is None
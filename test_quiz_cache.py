@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the versioned per-process quiz question cache
+"""
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import User, Quiz, QuizAttempt
+from quiz_cache import quiz_cache, QUIZ_CACHE_SIZE
+
+
+def _question_reads(statements):
+    return [s for s in statements if s.startswith('SELECT') and 'FROM quiz_question' in s]
+
+
+def test_take_quiz_reads_questions_once_per_version(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        client = isolated_app.test_client()
+        login_as(client, student)
+
+        with count_queries() as statements:
+            assert client.get(f'/quiz/{quiz.id}/take').status_code == 200
+        assert len(_question_reads(statements)) == 1
+
+        form = {f'question_{q.id}': q.correct_answer for q in questions}
+        with count_queries() as statements:
+            page = client.get(f'/quiz/{quiz.id}/take')
+            assert client.post(f'/quiz/{quiz.id}/take', data=form).status_code == 302
+        assert _question_reads(statements) == []
+        assert b'Q3' in page.data
+
+        assert QuizAttempt.query.one().score == 10
+        stats = quiz_cache.stats()
+        assert (stats['hits'], stats['misses']) == (2, 1)
+
+
+def test_editing_answers_bumps_the_version(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        teacher = db.session.get(User, quiz.course.instructor_id)
+        assert quiz_cache.get(quiz).answer_key.questions[questions[0].id] == ('A', 1)
+
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+        form = {f'correct_answer_{q.id}': 'D' for q in questions}
+        form.update({f'points_{q.id}': '5' for q in questions})
+        assert client.post(f'/teacher/edit-quiz-answers/{quiz.id}', data=form).status_code == 302
+
+        db.session.expire_all()
+        quiz = db.session.get(Quiz, quiz.id)
+        assert quiz.version == 2
+        snapshot = quiz_cache.get(quiz)
+        assert snapshot.answer_key.questions[questions[0].id] == ('D', 5)
+        assert snapshot.answer_key.max_score == 20
+        assert quiz_cache.stats()['misses'] == 2
+
+
+def test_cache_evicts_least_recently_used(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        other = Quiz(title='Other', course_id=quiz.course_id)
+        db.session.add(other)
+        db.session.commit()
+
+        quiz_cache.max_size = 1
+        try:
+            quiz_cache.get(quiz)
+            quiz_cache.get(other)
+            quiz_cache.get(quiz)
+        finally:
+            quiz_cache.max_size = QUIZ_CACHE_SIZE
+        stats = quiz_cache.stats()
+        assert (stats['misses'], stats['evictions'], stats['size']) == (3, 2, 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tests for server-enforced quiz deadlines and the expired-attempt sweeper
+"""
+
+import re
+import threading
+from datetime import datetime, timedelta
+
+from database import db
+from isolated_app import count_queries
+from models import User, QuizAttempt, QuizAnswer, Grade
+from quiz_autosave import autosave_buffer, AUTOSAVE_FLUSH_SECONDS
+from quiz_deadlines import sweep_expired_attempts, close_expired_batch, DEADLINE_GRACE_SECONDS
+
+EXPIRING_ATTEMPTS = 3000
+SWEEPERS = 3
+
+
+def test_opening_a_quiz_starts_the_clock(isolated_app, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        attempt = QuizAttempt.query.one()
+        assert attempt.deadline - attempt.started_at == timedelta(minutes=quiz.time_limit_minutes)
+
+        # Reopening the page keeps the same attempt and deadline
+        page = client.get(f'/quiz/{quiz.id}/take').data.decode()
+        assert QuizAttempt.query.count() == 1
+        assert re.search(r'new QuizTimer\(timeLimitMinutes, 1(799|800)\)', page)
+
+
+def test_late_requests_only_grade_answers_saved_in_time(isolated_app, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        (q0, a0), (q1, a1), _, _ = questions
+        client.post(f'/quiz/{quiz.id}/autosave', json={'answers': {str(q0): a0}})
+        autosave_buffer.flush()
+
+        attempt = QuizAttempt.query.one()
+        attempt.deadline = datetime.utcnow() - timedelta(seconds=DEADLINE_GRACE_SECONDS + 1)
+        db.session.commit()
+
+        late = client.post(f'/quiz/{quiz.id}/autosave', json={'answers': {str(q1): a1}})
+        assert late.status_code == 409
+        response = client.post(f'/quiz/{quiz.id}/take', data={f'question_{q1}': a1})
+        assert response.status_code == 302
+
+        attempt = QuizAttempt.query.one()
+        # Stored in UTC like started_at and deadline, so durations come out right
+        assert abs(attempt.completed_at - datetime.utcnow()) < timedelta(minutes=1)
+        assert (attempt.score, attempt.max_score) == (1, 10)
+        assert Grade.query.one().score == 10.0
+
+
+def test_sweeper_waits_one_autosave_flush_past_the_grace_period(isolated_app, open_quiz):
+    with isolated_app.app_context():
+        client, quiz, questions = open_quiz()
+        attempt = QuizAttempt.query.one()
+        now = datetime.utcnow()
+        attempt.deadline = now - timedelta(seconds=DEADLINE_GRACE_SECONDS + 1)
+        db.session.commit()
+
+        # Autosaves are refused now, but another worker may still hold some
+        assert sweep_expired_attempts(now=now) == 0
+        assert sweep_expired_attempts(now=now + timedelta(seconds=AUTOSAVE_FLUSH_SECONDS)) == 1
+        assert QuizAttempt.query.one().completed_at is not None
+
+
+def test_thousands_of_attempts_expiring_together(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        db.session.execute(db.insert(User), [
+            {'username': f'late{n}', 'email': f'late{n}@example.com', 'password_hash': 'unused',
+             'first_name': 'Late', 'last_name': str(n), 'role': 'student'}
+            for n in range(EXPIRING_ATTEMPTS)
+        ])
+        user_ids = db.session.scalars(db.select(User.id).where(User.username.like('late%'))).all()
+        deadline = datetime.utcnow() - timedelta(minutes=5)
+        db.session.execute(db.insert(QuizAttempt), [
+            {'quiz_id': quiz.id, 'user_id': user_id, 'started_at': deadline - timedelta(minutes=30),
+             'deadline': deadline}
+            for user_id in user_ids
+        ])
+        attempt_ids = db.session.scalars(db.select(QuizAttempt.id)).all()
+        # Every attempt autosaved the first question (1 point); even ones got it right
+        first = questions[0]
+        db.session.execute(db.insert(QuizAnswer), [
+            {'attempt_id': attempt_id, 'question_id': first.id,
+             'selected_answer': first.correct_answer if attempt_id % 2 == 0 else 'D',
+             'is_correct': False, 'points_earned': 0.0}
+            for attempt_id in attempt_ids
+        ])
+        # One attempt that is still running must be left alone
+        db.session.add(QuizAttempt(quiz_id=quiz.id, user_id=student.id,
+                                   deadline=datetime.utcnow() + timedelta(minutes=10)))
+        db.session.commit()
+
+        with count_queries() as statements:
+            assert close_expired_batch(datetime.utcnow(), batch_size=100) == 100
+        # Select, claim, mark answers, two attempt UPDATEs, grade INSERT
+        assert len(statements) == 6
+
+    closed = []
+    errors = []
+    start = threading.Barrier(SWEEPERS)
+
+    def sweep():
+        with isolated_app.app_context():
+            start.wait()
+            try:
+                closed.append(sweep_expired_attempts(batch_size=250))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=sweep) for _ in range(SWEEPERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sum(closed) == EXPIRING_ATTEMPTS - 100
+    with isolated_app.app_context():
+        assert QuizAttempt.query.filter(QuizAttempt.completed_at.is_(None)).count() == 1
+        assert Grade.query.count() == EXPIRING_ATTEMPTS
+        duplicates = db.session.execute(
+            db.select(Grade.quiz_attempt_id).group_by(Grade.quiz_attempt_id)
+            .having(db.func.count() > 1)
+        ).all()
+        assert duplicates == []
+        passed_first = QuizAttempt.query.filter(QuizAttempt.score == 1).count()
+        assert passed_first == EXPIRING_ATTEMPTS // 2
+        assert QuizAnswer.query.filter_by(is_correct=True).count() == EXPIRING_ATTEMPTS // 2
+        grade = Grade.query.filter(Grade.score > 0).first()
+        assert (grade.score, grade.feedback) == (10.0, 'Quiz completed with 1/10 points')
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk, points-aware quiz grading engine
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import quiz_grading
+from database import db
+from isolated_app import count_queries, login_as
+from models import User, QuizQuestion, QuizAttempt, QuizAnswer, Grade
+from quiz_autosave import store_answers
+from quiz_grading import (AnswerKey, score_responses, start_attempt, submit_attempt,
+                          grade_stored_attempts)
+
+
+def test_scoring_honors_points_and_skips_bad_answers(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        key = AnswerKey.load(quiz.id)
+        assert key.max_score == 10
+
+        responses = {questions[0].id: 'A',   # correct, 1 point
+                     questions[1].id: 'A',   # wrong
+                     questions[2].id: 'C',   # correct, 3 points
+                     questions[3].id: 'X',   # not a valid option
+                     999999: 'A'}            # not in this quiz
+        rows, score = score_responses(key, responses)
+        assert score == 4
+        assert sorted((r['question_id'], r['points_earned']) for r in rows) == [
+            (questions[0].id, 1), (questions[1].id, 0), (questions[2].id, 3)]
+
+
+def test_submission_writes_attempt_answers_and_grade_together(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        client = isolated_app.test_client()
+        login_as(client, student)
+        form = {f'question_{q.id}': q.correct_answer for q in questions[1:]}
+
+        with count_queries() as statements:
+            response = client.post(f'/quiz/{quiz.id}/take', data=form)
+        assert response.status_code == 302
+        answer_inserts = [s for s in statements if s.startswith('INSERT INTO quiz_answer')]
+        assert len(answer_inserts) == 1
+
+        attempt = QuizAttempt.query.one()
+        assert (attempt.score, attempt.max_score, attempt.percentage) == (9, 10, 90.0)
+        assert attempt.passed
+        assert QuizAnswer.query.filter_by(attempt_id=attempt.id).count() == 3
+        grade = Grade.query.one()
+        assert grade.score == 90.0
+        assert grade.feedback == 'Quiz completed with 9/10 points'
+
+
+def test_failed_submission_leaves_nothing_behind(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        submit_attempt(quiz, student.id, {q.id: q.correct_answer for q in questions})
+        db.session.rollback()
+        assert QuizAttempt.query.count() == 0
+        assert QuizAnswer.query.count() == 0
+        assert Grade.query.count() == 0
+
+
+def test_regrade_updates_answers_attempts_and_grades(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        client = isolated_app.test_client()
+        login_as(client, student)
+        # Answers A, A, A, A: only the first matches the original key (A, B, C, D)
+        client.post(f'/quiz/{quiz.id}/take', data={f'question_{q.id}': 'A' for q in questions})
+        attempt = QuizAttempt.query.one()
+        assert (attempt.score, attempt.percentage, attempt.passed) == (1, 10.0, False)
+
+        teacher = User.query.filter_by(username='teacher').one()
+        login_as(client, teacher)
+        form = {}
+        for q in questions:
+            form[f'correct_answer_{q.id}'] = 'A'
+            form[f'points_{q.id}'] = 5 if q.order_num == 3 else q.points
+        with count_queries() as statements:
+            response = client.post(f'/teacher/edit-quiz-answers/{quiz.id}', data=form)
+        assert response.status_code == 302
+        # Set-based: no per-attempt loading of answers
+        assert not [s for s in statements if 'WHERE ? = quiz_answer.attempt_id' in s]
+
+        attempt = QuizAttempt.query.one()
+        assert (attempt.score, attempt.max_score, attempt.percentage) == (11, 11, 100.0)
+        assert attempt.passed
+        assert all(a.is_correct for a in QuizAnswer.query.all())
+        assert sorted(a.points_earned for a in QuizAnswer.query.all()) == [1, 2, 3, 5]
+        grade = Grade.query.one()
+        assert grade.quiz_attempt_id == attempt.id
+        assert grade.score == 100.0
+        assert grade.feedback == 'Quiz completed with 11/11 points'
+
+
+def test_questions_without_points_are_worth_one_when_graded_in_sql(isolated_app, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz(question_points=(1, 2))
+        # Rows from before the points column have NULL there
+        db.session.execute(db.update(QuizQuestion).where(QuizQuestion.id == questions[0].id)
+                           .values(points=None))
+        answers = [{'question_id': q.id, 'selected_answer': q.correct_answer,
+                    'is_correct': False, 'points_earned': 0.0} for q in questions]
+
+        # An attempt closed by the deadline sweeper, from its stored answers
+        attempt = start_attempt(quiz, student.id)
+        store_answers([{'attempt_id': attempt.id, **answer} for answer in answers])
+        attempt.completed_at = datetime.utcnow()
+        db.session.flush()
+        grade_stored_attempts([attempt.id], attempt.completed_at)
+        attempt = QuizAttempt.query.one()
+        assert (attempt.score, attempt.max_score, attempt.percentage) == (3, 3, 100.0)
+        assert sorted(a.points_earned for a in QuizAnswer.query.all()) == [1, 2]
+
+        quiz_grading.regrade_quiz(quiz)
+        attempt = QuizAttempt.query.one()
+        assert (attempt.score, attempt.max_score, attempt.percentage) == (3, 3, 100.0)
+        assert sorted(a.points_earned for a in QuizAnswer.query.all()) == [1, 2]
+
+
+def test_a_student_has_at_most_one_open_attempt(isolated_app, monkeypatch, seed_quiz):
+    with isolated_app.app_context():
+        student, quiz, questions = seed_quiz()
+        first = start_attempt(quiz, student.id)
+        db.session.commit()
+        assert start_attempt(quiz, student.id).id == first.id
+
+        db.session.add(QuizAttempt(quiz_id=quiz.id, user_id=student.id))
+        with pytest.raises(IntegrityError):
+            db.session.flush()
+        db.session.rollback()
+
+        # Another request opens the next attempt between our lookup and insert
+        submit_attempt(quiz, student.id, {}, attempt=first)
+        db.session.commit()
+        lookup = quiz_grading._open_attempt
+
+        def raced(quiz_id, user_id):
+            monkeypatch.setattr(quiz_grading, '_open_attempt', lookup)
+            with db.engine.begin() as other:
+                other.execute(db.insert(QuizAttempt).values(quiz_id=quiz_id, user_id=user_id))
+            return None
+
+        monkeypatch.setattr(quiz_grading, '_open_attempt', raced)
+        attempt = start_attempt(quiz, student.id)
+        db.session.commit()
+        open_ids = db.session.scalars(db.select(QuizAttempt.id).where(
+            QuizAttempt.user_id == student.id, QuizAttempt.completed_at.is_(None))).all()
+        assert open_ids == [attempt.id]
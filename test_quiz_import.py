@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming, line-numbered quiz text importer
+"""
+
+import io
+
+import pytest
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import Quiz, QuizQuestion
+from quiz_import import QuizFormatError, parse_quiz
+
+GOOD_QUIZ = """Science Quiz
+
+What is the chemical symbol for gold?
+A) Au [CORRECT]
+B) Ag
+C) Gd
+D) Fe
+
+How many planets are in our solar system?
+A) 7
+B) 8 [CORRECT]
+"""
+
+
+@pytest.fixture
+def teacher_and_course(make_user, make_course):
+    def teacher_and_course():
+        teacher = make_user('teacher', 'teacher', first_name='Sarah', last_name='Johnson')
+        db.session.flush()
+        course = make_course(teacher, title='Science')
+        db.session.commit()
+        return teacher, course
+    return teacher_and_course
+
+
+def test_parses_title_questions_and_answers():
+    quiz = parse_quiz(GOOD_QUIZ)
+    assert quiz['title'] == 'Science Quiz'
+    assert [q['correct_answer'] for q in quiz['questions']] == ['A', 'B']
+    assert quiz['questions'][0]['options']['A'] == 'Au'
+    assert [q['line'] for q in quiz['questions']] == [3, 9]
+
+
+def test_errors_carry_line_numbers():
+    text = """Broken Quiz
+A) Orphan option
+
+Which is not marked?
+A) One
+B) Two
+
+Which is marked twice?
+A) One [CORRECT]
+B) Two [CORRECT]
+this line is neither
+"""
+    with pytest.raises(QuizFormatError) as excinfo:
+        parse_quiz(text)
+    assert excinfo.value.errors == [
+        (2, 'option appears before any question'),
+        (4, 'no option is marked [CORRECT]'),
+        (10, 'more than one option is marked [CORRECT]'),
+        (11, 'expected a question ending in "?" or an option A) to D)'),
+    ]
+
+
+def test_uploaded_bank_is_inserted_in_chunks(isolated_app, monkeypatch, teacher_and_course):
+    monkeypatch.setattr('quiz_import.IMPORT_CHUNK_SIZE', 2)
+    with isolated_app.app_context():
+        teacher, course = teacher_and_course()
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+        bank = GOOD_QUIZ + ''.join(f'\nQuestion {n}?\nA) yes [CORRECT]\nB) no\n' for n in range(3))
+
+        with count_queries() as statements:
+            response = client.post(f'/quiz/create/{course.id}', content_type='multipart/form-data',
+                                   data={'quiz_file': (io.BytesIO(bank.encode('utf-8-sig')), 'bank.txt')})
+        assert response.status_code == 302
+        question_inserts = [s for s in statements if s.startswith('INSERT INTO quiz_question')]
+        assert len(question_inserts) == 3
+
+        quiz = Quiz.query.one()
+        assert quiz.title == 'Science Quiz'
+        orders = db.session.scalars(db.select(QuizQuestion.order_num)
+                                    .where(QuizQuestion.quiz_id == quiz.id)
+                                    .order_by(QuizQuestion.order_num)).all()
+        assert orders == [1, 2, 3, 4, 5]
+
+
+def test_bad_text_creates_nothing(isolated_app, teacher_and_course):
+    with isolated_app.app_context():
+        teacher, course = teacher_and_course()
+        client = isolated_app.test_client()
+        login_as(client, teacher)
+
+        response = client.post(f'/quiz/create/{course.id}',
+                               data={'quiz_text': GOOD_QUIZ.replace(' [CORRECT]', '', 1)})
+        assert response.status_code == 200
+        assert b'Line 3: no option is marked [CORRECT]' in response.data
+        assert Quiz.query.count() == 0
+        assert QuizQuestion.query.count() == 0
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for question pools and shuffled answer options
+"""
+
+import pytest
+
+import quiz_pools
+from database import db
+from isolated_app import login_as
+from models import QuizAttempt, QuizAnswer, QuizQuestion
+from quiz_cache import quiz_cache
+from quiz_grading import regrade_quiz, VALID_ANSWERS
+from quiz_pools import AttemptLayout, option_order
+
+
+@pytest.fixture
+def pooled_quiz(seed_quiz):
+    """Factory for a quiz of eight questions drawn ``per_attempt`` at a time"""
+    def pooled_quiz(per_attempt=3, shuffle=True):
+        student, quiz, questions = seed_quiz(question_points=(1, 2, 3, 4, 5, 6, 7, 8))
+        quiz.questions_per_attempt = per_attempt
+        quiz.shuffle_options = shuffle
+        db.session.commit()
+        return student, quiz, {q.id: (q.correct_answer, q.points) for q in questions}
+    return pooled_quiz
+
+
+def test_option_order_is_a_stable_permutation():
+    assert option_order(None, 7) == VALID_ANSWERS
+    order = option_order(12345, 7)
+    assert sorted(order) == list(VALID_ANSWERS)
+    assert option_order(12345, 7) == order
+    # Different questions on the same paper get their own order
+    assert len({option_order(12345, qid) for qid in range(50)}) > 1
+
+
+def test_attempt_stores_its_draw_and_keeps_it(isolated_app, monkeypatch, pooled_quiz):
+    with isolated_app.app_context():
+        student, quiz, key = pooled_quiz()
+        client = isolated_app.test_client()
+        login_as(client, student)
+        page = client.get(f'/quiz/{quiz.id}/take').data.decode()
+
+        attempt = db.session.scalars(db.select(QuizAttempt)).one()
+        drawn = attempt.question_ids
+        assert len(drawn) == 3 and len(set(drawn)) == 3 and set(drawn) <= set(key)
+        assert attempt.shuffle_seed is not None
+        assert attempt.max_score == sum(key[qid][1] for qid in drawn)
+        for qid in key:
+            assert (f'name="question_{qid}"' in page) == (qid in drawn)
+
+        # Reloading shows the same paper without drawing again
+        monkeypatch.setattr(quiz_pools, 'draw_attempt', None)
+        assert client.get(f'/quiz/{quiz.id}/take').status_code == 200
+        db.session.refresh(attempt)
+        assert attempt.question_ids == drawn
+        assert db.session.scalar(db.select(db.func.count(QuizAttempt.id))) == 1
+
+
+def test_grading_maps_shown_letters_through_the_permutation(isolated_app, pooled_quiz):
+    with isolated_app.app_context():
+        student, quiz, key = pooled_quiz()
+        client = isolated_app.test_client()
+        login_as(client, student)
+        client.get(f'/quiz/{quiz.id}/take')
+        attempt = db.session.scalars(db.select(QuizAttempt)).one()
+        first, *rest = attempt.question_ids
+
+        # Autosave the first question with the letter the correct option was shown as
+        shown = {qid: VALID_ANSWERS[option_order(attempt.shuffle_seed, qid).index(key[qid][0])]
+                 for qid in attempt.question_ids}
+        client.post(f'/quiz/{quiz.id}/autosave', json={'answers': {str(first): shown[first]}})
+        form = {f'question_{qid}': shown[qid] for qid in rest}
+        assert client.post(f'/quiz/{quiz.id}/take', data=form).status_code == 302
+
+        db.session.refresh(attempt)
+        assert attempt.score == attempt.max_score
+        assert attempt.percentage == 100
+        stored = dict(db.session.execute(
+            db.select(QuizAnswer.question_id, QuizAnswer.selected_answer)).all())
+        assert stored == {qid: key[qid][0] for qid in attempt.question_ids}
+
+
+def test_layout_round_trips_answers(isolated_app, pooled_quiz):
+    with isolated_app.app_context():
+        student, quiz, key = pooled_quiz(per_attempt=None)
+        attempt = QuizAttempt(quiz_id=quiz.id, user_id=student.id, shuffle_seed=99)
+        layout = AttemptLayout(attempt, quiz_cache.get(quiz))
+        assert len(layout.questions) == len(key)
+        assert layout.answer_key.max_score == 36
+
+        authored = {qid: correct for qid, (correct, _) in key.items()}
+        shown = layout.to_displayed(authored)
+        assert layout.to_authored(shown) == authored
+        # Options are shown with the text of the authored option they stand for
+        question = layout.questions[0]
+        order = option_order(99, question.id)
+        assert [text for _, text in question.options] == [letter.lower() for letter in order]
+
+
+def test_regrade_keeps_pooled_attempts_out_of_their_own_questions(isolated_app, pooled_quiz):
+    with isolated_app.app_context():
+        student, quiz, key = pooled_quiz(shuffle=False)
+        client = isolated_app.test_client()
+        login_as(client, student)
+        client.get(f'/quiz/{quiz.id}/take')
+        attempt = db.session.scalars(db.select(QuizAttempt)).one()
+        form = {f'question_{qid}': key[qid][0] for qid in attempt.question_ids}
+        client.post(f'/quiz/{quiz.id}/take', data=form)
+
+        # Double the points of one drawn question
+        first = attempt.question_ids[0]
+        db.session.get(QuizQuestion, first).points = key[first][1] * 2
+        regrade_quiz(quiz)
+        db.session.commit()
+
+        db.session.refresh(attempt)
+        expected = sum(key[qid][1] for qid in attempt.question_ids) + key[first][1]
+        assert attempt.max_score == expected
+        assert attempt.score == expected
+        assert attempt.percentage == 100
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for the local and S3-compatible storage backends.
+
+The S3 tests run against moto's standalone server and are skipped when
+boto3 or moto is not installed.
+"""
+
+import hashlib
+import os
+import socket
+import urllib.request
+
+import pytest
+
+import storage as storage_module
+from database import db
+from file_uploads import IncomingFile
+from isolated_app import login_as
+from models import CourseMaterial
+from storage import LocalStorage, S3Storage
+
+MIB = 1024 * 1024
+
+
+def _incoming(directory, data):
+    incoming = IncomingFile(str(directory))
+    incoming.write(data)
+    return incoming
+
+
+def test_local_storage_round_trip(tmp_path):
+    store = LocalStorage(str(tmp_path))
+    (tmp_path / '.incoming').mkdir()
+    store.save('blobs/ab/cd/abcd', _incoming(tmp_path / '.incoming', b'slides'))
+    source = tmp_path / 'old.pdf'
+    source.write_bytes(b'old upload')
+    store.save_path('blobs/ef/01/ef01', str(source))
+
+    assert store.exists('blobs/ab/cd/abcd') and not store.exists('blobs/ab/cd/missing')
+    with store.open('blobs/ab/cd/abcd') as stored:
+        assert stored.read() == b'slides'
+    assert sorted(item.key for item in store.list('blobs/')) == ['blobs/ab/cd/abcd', 'blobs/ef/01/ef01']
+    # Staging files are not listed
+    assert sorted(item.key for item in store.list()) == ['blobs/ab/cd/abcd', 'blobs/ef/01/ef01', 'old.pdf']
+    assert store.download_url('blobs/ab/cd/abcd', 'slides.pdf') is None
+
+    store.delete('blobs/ab/cd/abcd')
+    store.delete('blobs/ab/cd/abcd')
+    assert not store.exists('blobs/ab/cd/abcd')
+
+
+def test_local_storage_refuses_keys_outside_its_root(tmp_path):
+    store = LocalStorage(str(tmp_path / 'uploads'))
+    assert not store.exists('../app.py')
+    with pytest.raises(ValueError):
+        store.open('../app.py')
+
+
+@pytest.fixture(scope='module')
+def s3_endpoint():
+    pytest.importorskip('boto3')
+    moto_server = pytest.importorskip('moto.server')
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=port)
+    server.start()
+    yield f'http://127.0.0.1:{port}'
+    server.stop()
+
+
+@pytest.fixture
+def s3_config(s3_endpoint, monkeypatch, request):
+    import boto3
+
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        monkeypatch.setenv(name, 'testing')
+    bucket = f'edutrack-{request.node.name.replace("_", "-")[:40]}'
+    boto3.client('s3', endpoint_url=s3_endpoint, region_name='us-east-1').create_bucket(Bucket=bucket)
+    monkeypatch.setattr(storage_module, '_s3_backends', {})
+    return {'STORAGE_BACKEND': 's3', 'S3_BUCKET': bucket, 'S3_PREFIX': 'lms',
+            'S3_ENDPOINT_URL': s3_endpoint, 'S3_REGION': 'us-east-1',
+            'S3_MULTIPART_THRESHOLD': 5 * MIB, 'S3_PART_SIZE': 5 * MIB}
+
+
+def test_s3_storage_uploads_large_files_in_parts(s3_config, tmp_path):
+    store = S3Storage.from_config(s3_config)
+    data = os.urandom(11 * MIB)
+    store.save('blobs/aa/bb/big', _incoming(tmp_path, data))
+
+    head = store.client.head_object(Bucket=s3_config['S3_BUCKET'], Key='lms/blobs/aa/bb/big')
+    # Multipart objects have an ETag ending in -<number of parts>
+    assert head['ETag'].strip('"').endswith('-3')
+    assert os.listdir(tmp_path) == []
+    assert store.exists('blobs/aa/bb/big') and not store.exists('blobs/aa/bb/missing')
+    assert [(item.key, item.size) for item in store.list('blobs/')] == [('blobs/aa/bb/big', len(data))]
+    body = store.open('blobs/aa/bb/big')
+    assert hashlib.sha256(b''.join(body.iter_chunks(MIB))).digest() == hashlib.sha256(data).digest()
+
+    store.delete('blobs/aa/bb/big')
+    assert not store.exists('blobs/aa/bb/big')
+
+
+@pytest.fixture
+def upload_config(s3_config):
+    # teacher_client uploads to the bucket
+    return s3_config
+
+
+def test_s3_downloads_redirect_to_a_presigned_url(isolated_app, teacher_client, upload_material):
+    teacher, course_id, student = teacher_client
+    data = b'week 1 slides'
+    upload_material(teacher, course_id, data, 'week1.pdf')
+    material = db.session.scalars(db.select(CourseMaterial)).one()
+
+    client = isolated_app.test_client()
+    login_as(client, student)
+    response = client.get(f'/download-material/{material.id}')
+    assert response.status_code == 302
+    assert response.cache_control.no_store
+    with urllib.request.urlopen(response.headers['Location']) as download:
+        assert download.read() == data
+        assert 'week1.pdf' in download.headers['Content-Disposition']
+
+    # With presigning off the app streams the object itself
+    isolated_app.config['S3_PRESIGN_DOWNLOADS'] = False
+    storage_module._s3_backends.clear()
+    response = client.get(f'/download-material/{material.id}')
+    assert response.status_code == 200
+    assert response.data == data
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for the aggregate, cached admin analytics report and dashboard
+"""
+
+import pytest
+
+from admin_routes import _compute_admin_dashboard_stats, _compute_system_analytics
+from database import db
+from enrollments import add_enrollment
+from isolated_app import count_queries, login_as
+from models import User, Enrollment
+from stats_cache import report_cache
+
+
+@pytest.fixture
+def seed_courses(make_user, make_course):
+    """Factory for seven users and three courses: popular, quiet and empty"""
+    def seed_courses():
+        admin = make_user('admin', 'admin')
+        teacher = make_user('teacher', 'teacher')
+        students = [make_user(f'student{i}', 'student') for i in range(4)]
+        make_user('lurker', 'student')
+        db.session.flush()
+        courses = [make_course(teacher, title=title) for title in ('Popular', 'Quiet', 'Empty')]
+        popular, quiet, _ = courses
+        for i, student in enumerate(students):
+            add_enrollment(student.id, popular.id, status='completed' if i == 0 else 'active')
+        add_enrollment(students[0].id, quiet.id, status='completed')
+        db.session.commit()
+        return admin, students, courses
+    return seed_courses
+
+
+def test_analytics_report_values(isolated_app, seed_courses):
+    with isolated_app.app_context():
+        seed_courses()
+        report = _compute_system_analytics()
+        assert report['total_users'] == 7
+        assert report['user_roles'] == {'student': 5, 'teacher': 1, 'admin': 1}
+        assert report['total_courses'] == 3
+        assert report['total_enrollments'] == 5
+        assert report['active_users'] == 4
+        assert report['inactive_users'] == 3
+        # Popular: 1 of 4 completed, Quiet: 1 of 1; Empty has no enrollments
+        assert report['avg_completion_rate'] == 62.5
+        assert [(c['course']['title'], c['enrollment_count'], c['completion_rate'])
+                for c in report['course_enrollments']] == [
+            ('Popular', 4, 25.0), ('Quiet', 1, 100.0), ('Empty', 0, 0)]
+
+
+def test_analytics_page_is_cached_until_enrollments_change(isolated_app, seed_courses):
+    with isolated_app.app_context():
+        admin, students, (popular, quiet, empty) = seed_courses()
+        client = isolated_app.test_client()
+        login_as(client, admin)
+
+        assert client.get('/admin/analytics').status_code == 200
+        with count_queries() as statements:
+            response = client.get('/admin/analytics')
+        assert response.status_code == 200
+        # At most the session user lookup; the report itself comes from cache
+        assert len(statements) <= 1
+
+        login_as(client, students[1])
+        client.get(f'/enroll/{empty.id}')
+        assert Enrollment.query.filter_by(course_id=empty.id).count() == 1
+
+        login_as(client, admin)
+        with count_queries() as statements:
+            client.get('/admin/analytics')
+        assert len(statements) > 1
+
+
+def test_rolled_back_changes_keep_the_cache(isolated_app, seed_courses):
+    with isolated_app.app_context():
+        admin, students, courses = seed_courses()
+        calls = []
+        report_cache.get('system_analytics', lambda: calls.append(1) or 'report')
+
+        add_enrollment(students[3].id, courses[1].id)
+        db.session.rollback()
+        assert report_cache.get('system_analytics', lambda: 'recomputed') == 'report'
+
+        add_enrollment(students[3].id, courses[1].id)
+        db.session.commit()
+        assert report_cache.get('system_analytics', lambda: 'recomputed') == 'recomputed'
+
+
+def _landing_queries(client):
+    with count_queries() as statements:
+        response = client.get('/admin/dashboard')
+    assert response.status_code == 200
+    return len(statements), response.get_data(as_text=True)
+
+
+def test_admin_dashboard_counters(isolated_app, seed_courses):
+    with isolated_app.app_context():
+        admin, students, courses = seed_courses()
+        stats = _compute_admin_dashboard_stats()
+        assert (stats['total_users'], stats['students'], stats['teachers'], stats['admins']) == (7, 5, 1, 1)
+        assert (stats['total_courses'], stats['total_enrollments']) == (3, 5)
+        assert (stats['pending_deletion_requests'], stats['pending_user_deletion_requests']) == (0, 0)
+        assert [c['title'] for c in stats['recent_courses']][0] in ('Popular', 'Quiet', 'Empty')
+        assert len(stats['recent_users']) == 5
+
+
+def test_admin_dashboard_is_cached_until_a_write(isolated_app, seed_courses):
+    with isolated_app.app_context():
+        admin, students, (popular, quiet, empty) = seed_courses()
+        teacher = User.query.filter_by(username='teacher').one()
+        client = isolated_app.test_client()
+        login_as(client, admin)
+        _landing_queries(client)
+        queries, _ = _landing_queries(client)
+        assert queries <= 1
+
+        # Each write path drops the cached counters once it commits
+        writes = [
+            lambda: client.post('/register', data={
+                'username': 'newcomer', 'email': 'newcomer@example.com',
+                'first_name': 'New', 'last_name': 'Comer',
+                'password': 'secret123', 'confirm_password': 'secret123'}),
+            lambda: (login_as(client, students[2]),
+                     client.post('/account/request-deletion', data={'reason': 'Leaving'})),
+            lambda: (login_as(client, teacher),
+                     client.post(f'/teacher/request-course-deletion/{empty.id}', data={'reason': 'Unused'})),
+            lambda: (login_as(client, students[3]), client.get(f'/enroll/{quiet.id}')),
+        ]
+        for write in writes:
+            write()
+            login_as(client, admin)
+            queries, _ = _landing_queries(client)
+            assert queries > 1
+
+        stats = report_cache.get('admin_dashboard', lambda: None)
+        assert stats['total_users'] == 8
+        assert stats['total_enrollments'] == 6
+        assert stats['pending_deletion_requests'] == 1
+        assert stats['pending_user_deletion_requests'] == 1
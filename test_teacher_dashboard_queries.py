@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Regression tests: the teacher dashboard and manage-course pages must cost a
+fixed number of queries no matter how many sections or students there are.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db
+from isolated_app import count_queries, login_as
+from models import Course, Grade
+from enrollments import add_enrollment
+
+
+@pytest.fixture
+def seed_sections(make_user, make_course):
+    """Factory for a teacher of ``course_count`` sections of three graded students"""
+    def seed_sections(course_count, grades_per_course=4):
+        teacher = make_user('teacher', 'teacher', first_name='Sarah', last_name='Johnson')
+        students = [make_user(f'student{i}', 'student') for i in range(3)]
+        db.session.flush()
+
+        start = datetime(2024, 1, 1)
+        for c in range(course_count):
+            course = make_course(teacher, title=f'Section {c}', duration_weeks=8, max_students=30)
+            for student in students:
+                add_enrollment(student.id, course.id)
+            for g in range(grades_per_course):
+                db.session.add(Grade(user_id=students[g % 3].id, course_id=course.id,
+                                     assignment_name=f'Homework {c}.{g}', score=80 + g,
+                                     graded_at=start + timedelta(hours=c * grades_per_course + g)))
+        db.session.commit()
+        return teacher
+    return seed_sections
+
+
+def _dashboard(app, seed_sections, course_count):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        teacher = seed_sections(course_count)
+        client = app.test_client()
+        login_as(client, teacher)
+        with count_queries() as statements:
+            response = client.get('/teacher/dashboard')
+        assert response.status_code == 200
+        return len(statements), response.get_data(as_text=True)
+
+
+def test_teacher_dashboard_query_count_is_constant(isolated_app, seed_sections):
+    small, _ = _dashboard(isolated_app, seed_sections, 1)
+    large, page = _dashboard(isolated_app, seed_sections, 15)
+    assert small == large
+    # Newest grades come from the last section, capped at three per course
+    assert 'Homework 14.3' in page and 'Homework 14.1' in page
+    assert 'Homework 14.0' not in page
+    assert 'Homework 13.3' in page and 'Homework 13.2' in page
+
+
+def _manage_course(app, seed_sections, make_user, student_count):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        teacher = seed_sections(1)
+        course = Course.query.one()
+        for i in range(student_count):
+            student = make_user(f'extra{i}', 'student')
+            db.session.flush()
+            add_enrollment(student.id, course.id)
+            db.session.add(Grade(user_id=student.id, course_id=course.id,
+                                 assignment_name='Essay', score=75))
+        db.session.commit()
+        client = app.test_client()
+        login_as(client, teacher)
+        with count_queries() as statements:
+            response = client.get(f'/teacher/manage-course/{course.id}')
+        assert response.status_code == 200
+        return len(statements)
+
+
+def test_manage_course_query_count_is_constant(isolated_app, seed_sections, make_user):
+    assert (_manage_course(isolated_app, seed_sections, make_user, 0)
+            == _manage_course(isolated_app, seed_sections, make_user, 40))